@@ -0,0 +1,132 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+
+class AdmissionRejected(Exception):
+    """A request was refused; reason is rate_limited, queue_full, deadline or buffer_full, retry_after in seconds."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """
+    Token bucket per client: on average `rate` requests per second, in bursts of up to `burst`.
+    Only the max_clients most recently seen clients are tracked; a client that was dropped
+    starts again with a full bucket, as it would have after being idle for burst / rate seconds.
+    """
+
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # client -> (tokens, monotonic time of the last update)
+
+    def acquire(self, client):
+        """Take a token for client. Returns 0 when the request may proceed, else seconds until it could."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[client] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class ByteBudget:
+    """
+    Bytes that may be held at once across requests, e.g. request bodies buffered in memory.
+    Not thread-safe: use from one event loop.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+
+    def reserve(self, size):
+        """Take size bytes of the budget. Returns False, taking nothing, if that would exceed it."""
+        if self.used + size > self.limit:
+            return False
+        self.used += size
+        return True
+
+    def release(self, size):
+        self.used -= size
+
+
+class AdmissionController:
+    """
+    At most `limit` requests run at once; up to `max_waiting` more wait in arrival order.
+    The time a request holds its slot is tracked as a moving average, which gives the expected
+    wait for a place in the queue. A request that could not finish before its deadline is
+    rejected on arrival, or leaves the queue as soon as its deadline becomes unreachable,
+    instead of using a worker only to time out. Not thread-safe: use from one event loop.
+    """
+
+    def __init__(self, limit, max_waiting, service_time=1.0):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.service_time = service_time  # seconds, moving average
+        self.active = 0
+        self._waiters = deque()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def expected_wait(self, position):
+        """Seconds until the request at queue position (0 = next) gets a slot, with slots freeing at a steady rate."""
+        return (position + 1) * self.service_time / self.limit
+
+    async def acquire(self, deadline):
+        """Wait for a slot; deadline is a time.monotonic() value. Raises AdmissionRejected."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        wait = self.expected_wait(len(self._waiters))
+        if len(self._waiters) >= self.max_waiting:
+            raise AdmissionRejected("queue_full", wait)
+        budget = deadline - time.monotonic() - self.service_time
+        if wait > budget:
+            raise AdmissionRejected("deadline", wait)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await asyncio.wait_for(future, budget)
+        except asyncio.TimeoutError:
+            self._discard(future)
+            raise AdmissionRejected("deadline", self.expected_wait(len(self._waiters)))
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # the slot was handed over just as the client went away
+            else:
+                self._discard(future)
+            raise
+
+    def release(self, held=None):
+        """Free a slot (held: seconds it was held, to update the service time); the oldest waiter takes it over."""
+        if held is not None:
+            self.service_time += 0.2 * (held - self.service_time)
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def _discard(self, future):
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
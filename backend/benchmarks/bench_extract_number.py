@@ -0,0 +1,87 @@
+"""
+Checks the precompiled numeric extractors against the original extract_number on a
+large corpus of synthetic OCR lines, and times them.
+
+    cd backend
+    python -m benchmarks.bench_extract_number --reports 2000
+
+Exits 1 if any line gives a different value.
+"""
+import argparse
+import random
+import re
+import sys
+import time
+
+import main
+from benchmarks.synthetic import report_corpus
+
+def legacy_extract_number(s):
+    """extract_number as it was before the precompiled rewrite (reference implementation)."""
+    if s is None:
+        return None
+    s = s.replace("‘", "").replace("’", "").replace("“", "").replace("”", "")
+    s = s.replace("—", "-").replace("−", "-")
+    s = re.sub(r"(?<=\d)[,](?=\d{3}\b)", "", s)
+    perc = re.search(r"(-?\d+\.?\d*)\s*%", s)
+    if perc:
+        try:
+            return float(perc.group(1))
+        except:
+            return None
+    m = re.search(r"(-?\d+\.?\d*)", s)
+    if m:
+        try:
+            return float(m.group(1))
+        except:
+            return None
+    return None
+
+# OCR debris that exercises the normalization rules
+EDGE_CASES = [
+    "5-10%", "12.34.5%", "1,234,567", "‘12’", "“1,000”", "—5", "−3.2 %", "1,23", "4,000,5",
+    "1 ,000", ".5", "12.", "1,000.5 mg/dL", "Hb ‘13.2’ g/dL", "WBC 11,000— 4,000", "-", "%", "",
+]
+
+def ocr_lines(reports, seed):
+    rng = random.Random(seed)
+    lines = list(EDGE_CASES)
+    for text, _, _ in report_corpus(seed, reports):
+        lines.extend(ln.strip() for ln in text.splitlines() if ln.strip())
+    alphabet = "0123456789.,-% ‘’“”—−abgdL/\t"
+    for _ in range(len(lines) // 10):
+        lines.append("".join(rng.choice(alphabet) for _ in range(rng.randint(0, 16))))
+    return lines
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+def run(reports, seed):
+    lines = ocr_lines(reports, seed)
+    expected, legacy_s = timed(lambda: [legacy_extract_number(ln) for ln in lines])
+    single, single_s = timed(lambda: [main.extract_number(ln) for ln in lines])
+    batch, batch_s = timed(lambda: main.extract_numbers(lines))
+    matches, match_s = timed(lambda: [main.find_number(ln) for ln in lines])
+
+    mismatches = 0
+    for ln, want, a, b, m in zip(lines, expected, single, batch, matches):
+        if not (want == a == b == (m.value if m else None)):
+            mismatches += 1
+            if mismatches <= 10:
+                print(f"MISMATCH {ln!r}: legacy={want} extract_number={a} extract_numbers={b} find_number={m}")
+
+    print(f"{len(lines)} lines, {mismatches} mismatches")
+    print(f"  legacy extract_number   {legacy_s * 1e6 / len(lines):7.2f} us/line")
+    print(f"  extract_number          {single_s * 1e6 / len(lines):7.2f} us/line  ({legacy_s / single_s:.1f}x)")
+    print(f"  extract_numbers (batch) {batch_s * 1e6 / len(lines):7.2f} us/line  ({legacy_s / batch_s:.1f}x)")
+    print(f"  find_number (+unit/pos) {match_s * 1e6 / len(lines):7.2f} us/line  ({legacy_s / match_s:.1f}x)")
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=1000, help="synthetic reports to split into lines")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sys.exit(run(args.reports, args.seed))
@@ -0,0 +1,98 @@
+"""
+Benchmark of typo-tolerant alias matching (fuzzy.FuzzyAliasIndex) on synthetic lab reports.
+
+    cd backend
+    python -m benchmarks.bench_fuzzy
+    python -m benchmarks.bench_fuzzy --reports 300 --rounds 5
+
+Corpora:
+- noisy:  the mixed corpus of bench_pipeline (clean and character-noised reports)
+- typo1:  noise-free reports with one OCR error in every alias word of 5+ letters
+- typo2:  the same with two errors per alias word
+
+For each corpus, parse_medical_report runs with FUZZY_ALIASES off and on: share of written
+results recovered exactly (recall), wrong values reported, share of reported values that are
+right (precision), and parse latency. Most wrong values fuzzy matching adds on the noisy corpus
+come from a misread name whose number was misread too ("creainine: 11.0" for 1.0): without
+fuzzy matching the parameter is missed instead, so precision is the number to compare. Then the cost of the
+fuzzy pass alone (FuzzyAliasIndex.find_all) per report and per line, once warm and once with
+an empty lookup cache.
+"""
+import argparse
+import sys
+import time
+
+import main
+from benchmarks.bench_pipeline import time_calls
+from benchmarks.synthetic import report_corpus, typo_corpus
+from fuzzy import FuzzyAliasIndex
+
+def accuracy(corpus):
+    """(share of written parameters recovered with the exact value, wrong values reported, share of reported values right)."""
+    correct = total = wrong = 0
+    for text, expected, _ in corpus:
+        parsed = main.parse_medical_report(text)
+        total += len(expected)
+        correct += sum(1 for p, v in expected.items() if p in parsed and parsed[p]["value"] == float(v))
+        wrong += sum(1 for p, info in parsed.items() if p not in expected or info["value"] != float(expected[p]))
+    return round(correct / total, 4), wrong, round(correct / max(1, correct + wrong), 4)
+
+def time_find_all(index, corpus, cold):
+    """Microseconds per report and per line of index.find_all; cold empties the lookup cache per report, warm fills it first."""
+    inputs = []
+    for text, _, _ in corpus:
+        lowered = text.lower()
+        inputs.append((lowered.split("\n"), lowered))
+    if not cold:
+        for lines, lowered in inputs:
+            index.find_all(lines, lowered)
+    elapsed = 0.0
+    for lines, lowered in inputs:
+        if cold:
+            index._cache.clear()
+            index._misread.clear()
+        start = time.perf_counter()
+        index.find_all(lines, lowered)
+        elapsed += time.perf_counter() - start
+    lines = sum(len(lines) for lines, _ in inputs)
+    return elapsed / len(inputs) * 1e6, elapsed / lines * 1e6
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=150, help="reports per corpus")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    corpora = {
+        "noisy": report_corpus(args.seed, args.reports),
+        "typo1": typo_corpus(args.seed, args.reports, edits=1),
+        "typo2": typo_corpus(args.seed, args.reports, edits=2),
+    }
+    print(f"{'corpus':<7} {'fuzzy':<6} {'recall':>8} {'wrong':>6} {'precision':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    enabled = main.FUZZY_ALIASES
+    try:
+        for name, corpus in corpora.items():
+            for fuzzy in (False, True):
+                main.FUZZY_ALIASES = fuzzy
+                correct, wrong, precision = accuracy(corpus)
+                r = time_calls(main.parse_medical_report, [(text,) for text, _, _ in corpus], args.rounds)
+                print(f"{name:<7} {'on' if fuzzy else 'off':<6} {correct:>8.2%} {wrong:>6} {precision:>10.2%} "
+                      f"{r['p50_ms']:>8.4f} {r['p95_ms']:>8.4f} {r['p99_ms']:>8.4f}")
+    finally:
+        main.FUZZY_ALIASES = enabled
+
+    index = main.catalog.fuzzy_index
+    start = time.perf_counter()
+    FuzzyAliasIndex(alias for aliases in main.catalog.aliases for alias in aliases)
+    print(f"\nindex build: {(time.perf_counter() - start) * 1000:.1f} ms, "
+          f"{len(index.words)} alias words, {len(index._deletes)} deletion variants")
+    print(f"{'corpus':<7} {'cache':<6} {'us/report':>10} {'us/line':>8}")
+    for name, corpus in corpora.items():
+        for cold in (True, False):
+            per_report, per_line = time_find_all(index, corpus, cold)
+            print(f"{name:<7} {'cold' if cold else 'warm':<6} {per_report:>10.1f} {per_line:>8.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,104 @@
+"""
+Benchmark of the patient history store (history.py) at millions of stored values.
+
+    cd backend
+    python -m benchmarks.bench_history                         # 1M values: 5000 patients x 10 reports x 20 parameters
+    python -m benchmarks.bench_history --patients 20000        # 4M values
+    python -m benchmarks.bench_history --path /tmp/history.sqlite3 --keep
+
+Fills a fresh store through HistoryStore.add / flush (the same batched path uploads use) and
+reports the write rate and the cost of add() on the request path, then p50/p95/p99 latency of
+the trend, out-of-range, delta and report list queries for random patients.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import main
+from benchmarks.bench_pipeline import summarize_latencies
+from history import HistoryStore
+
+def fill(store, rng, patients, reports, params_per_report, batch_size):
+    """Queue and write every report; returns (reports/s, values/s, add() p50 in microseconds)."""
+    names = list(main.catalog.names)
+    flags = ("normal",) * 6 + ("low", "high")
+    start_date = date(2015, 1, 1)
+    add_us = []
+    wall_start = time.perf_counter()
+    written = 0
+    for patient in range(patients):
+        day = start_date + timedelta(days=rng.randrange(365))
+        for _ in range(reports):
+            day += timedelta(days=rng.randrange(20, 200))
+            results = [
+                (name, round(rng.uniform(1, 300), 1), rng.choice(flags))
+                for name in rng.sample(names, params_per_report)
+            ]
+            start = time.perf_counter()
+            store.add(f"patient-{patient}", day.isoformat(), results, "report.png", "unknown")
+            add_us.append((time.perf_counter() - start) * 1e6)
+            if store.pending() >= batch_size:
+                written += store.flush()
+    written += store.flush()
+    wall = time.perf_counter() - wall_start
+    return round(written / wall, 1), round(written * params_per_report / wall, 1), round(statistics.median(add_us), 2)
+
+def time_queries(func, args_list):
+    latencies = []
+    wall_start = time.perf_counter()
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return summarize_latencies(latencies, time.perf_counter() - wall_start)
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=5000)
+    parser.add_argument("--reports", type=int, default=10, help="reports per patient")
+    parser.add_argument("--params", type=int, default=20, help="parameters per report")
+    parser.add_argument("--batch-size", type=int, default=500, help="reports written per transaction")
+    parser.add_argument("--queries", type=int, default=2000, help="queries per case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--path", help="SQLite file to create (default: a temporary file)")
+    parser.add_argument("--keep", action="store_true", help="keep the SQLite file afterwards")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    path = args.path or os.path.join(tempfile.mkdtemp(prefix="bench_history_"), "history.sqlite3")
+    if os.path.exists(path):
+        raise SystemExit(f"{path} exists; the benchmark needs a fresh store.")
+    store = HistoryStore(path, batch_size=args.batch_size)
+    try:
+        reports_per_s, values_per_s, add_us = fill(store, rng, args.patients, args.reports, args.params, args.batch_size)
+        values = args.patients * args.reports * args.params
+        print(f"stored {values:,} values in {args.patients * args.reports:,} reports ({os.path.getsize(path) / 2**20:.0f} MiB)")
+        print(f"write: {reports_per_s:,.0f} reports/s, {values_per_s:,.0f} values/s; add() p50 {add_us} us")
+
+        names = list(main.catalog.names)
+        patients = [f"patient-{rng.randrange(args.patients)}" for _ in range(args.queries)]
+        cases = {
+            "trend": (store.trend, [(p, rng.choice(names)) for p in patients]),
+            "out_of_range": (store.out_of_range, [(p,) for p in patients]),
+            "delta": (store.delta, [(p,) for p in patients]),
+            "reports": (store.reports, [(p,) for p in patients]),
+        }
+        print(f"{'query':<13} {'runs':>7} {'ops/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+        for case, (func, args_list) in cases.items():
+            r = time_queries(func, args_list)
+            print(f"{case:<13} {r['runs']:>7} {r['ops_per_s']:>10.1f} {r['p50_ms']:>10.4f} {r['p95_ms']:>10.4f} {r['p99_ms']:>10.4f}")
+    finally:
+        store.close()
+        if not args.keep:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,146 @@
+"""
+Benchmark of the OCR engines (ocr_engine.py): per-image latency of the persistent tesserocr
+engine against one tesseract process per image through pytesseract.
+
+    cd backend
+    python -m benchmarks.bench_ocr
+    python -m benchmarks.bench_ocr --engines tesserocr --rounds 20
+
+Images are synthetic reports, preprocessed once up front so only OCR is timed:
+- line:   one result row
+- panel:  a short panel (8 results) on a half-width page
+- page:   every known parameter on a full-width page
+For every engine that can run here: p50/p95 per image size and the share of written results
+parsed back exactly. For tesserocr, also the cost the subprocess path pays again for every
+image: loading the language models (engine start) and the PNG written to a temp file.
+When both engines run, each image's output is compared between them: images whose OCR text
+differs, and parsed values that differ.
+Needs Tesseract: tesserocr with language data (TESSDATA_PREFIX) and/or the tesseract binary.
+"""
+import argparse
+import io
+import random
+import sys
+import time
+
+import main
+from benchmarks.bench_pipeline import summarize_latencies
+from benchmarks.synthetic import report_rows, render_report_image
+from ocr_engine import create_engine
+
+def sample_images(seed):
+    """{size: [(prepared image, {param: value})]}"""
+    rng = random.Random(seed)
+    samples = {}
+    for size, n_params, width, count in (("line", 1, 1240, 8), ("panel", 8, 1240, 4), ("page", None, 2480, 2)):
+        samples[size] = []
+        for _ in range(count):
+            params = rng.sample(list(main.catalog.names), n_params or len(main.catalog))
+            rows = report_rows(rng, params)
+            img = render_report_image(rows, width=width)
+            if size == "line":
+                img = img.crop((0, width // 12 + 2 * int(max(12, width // 60) * 1.8) - 8, width, img.height // 7))
+            expected = {p: v for p, (_, v, _) in zip(params, rows)}
+            samples[size].append((main.prepare_image(img)[0], expected))
+    return samples
+
+def run(engine, img):
+    return engine.image_to_data(img) if main.OCR_LAYOUT else engine.image_to_string(img)
+
+def recall(payloads):
+    correct = total = 0
+    for payload, expected in payloads:
+        text, rows = main.read_ocr_output(payload)
+        parsed = main.parse_medical_report(text, rows=rows)
+        total += len(expected)
+        correct += sum(1 for p, v in expected.items() if p in parsed and parsed[p]["value"] == float(v))
+    return correct / total
+
+def bench_engine(engine, samples, rounds):
+    results = {}
+    for size, images in samples.items():
+        run(engine, images[0][0])  # first call of a size allocates its buffers
+        latencies = []
+        wall_start = time.perf_counter()
+        for _ in range(rounds):
+            for img, _ in images:
+                start = time.perf_counter()
+                run(engine, img)
+                latencies.append((time.perf_counter() - start) * 1000)
+        results[size] = summarize_latencies(latencies, time.perf_counter() - wall_start)
+        results[size]["recall"] = recall([(run(engine, img), expected) for img, expected in images])
+    return results
+
+def parsed_values(payload):
+    text, rows = main.read_ocr_output(payload)
+    return {p: info["value"] for p, info in main.parse_medical_report(text, rows=rows).items()}
+
+def compare_outputs(outputs, samples):
+    """Per image size: (images, images whose OCR text differs, parsed values that differ) between two engines."""
+    (name_a, a), (name_b, b) = outputs.items()
+    result = {}
+    for size in samples:
+        pairs = list(zip(a[size], b[size]))
+        text_diff = sum(1 for x, y in pairs if main.read_ocr_output(x)[0] != main.read_ocr_output(y)[0])
+        value_diff = 0
+        for x, y in pairs:
+            va, vb = parsed_values(x), parsed_values(y)
+            value_diff += sum(1 for p in va.keys() | vb.keys() if va.get(p) != vb.get(p))
+        result[size] = (len(pairs), text_diff, value_diff)
+    return result
+
+def per_image_costs(samples, repeat=5):
+    """Milliseconds of what one tesseract process per image redoes each time: engine start, temp PNG per size."""
+    starts = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        create_engine("tesserocr", main.OCR_LANG, main.tesseract_config(), main.TESSDATA_DIR).close()
+        starts.append((time.perf_counter() - start) * 1000)
+    pngs = {}
+    for size, images in samples.items():
+        start = time.perf_counter()
+        for img, _ in images:
+            img.save(io.BytesIO(), "PNG")
+        pngs[size] = (time.perf_counter() - start) * 1000 / len(images)
+    return sorted(starts)[len(starts) // 2], pngs
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", default="tesserocr,pytesseract")
+    parser.add_argument("--rounds", type=int, default=5, help="passes over the images of each size")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    samples = sample_images(args.seed)
+    outputs = {}  # engine -> {size: [OCR payload of each image]}
+    print(f"{'engine':<12} {'size':<6} {'runs':>5} {'p50 ms':>9} {'p95 ms':>9} {'recall':>7}")
+    for kind in [e.strip() for e in args.engines.split(",") if e.strip()]:
+        engine = create_engine(kind, main.OCR_LANG, main.tesseract_config(), main.TESSDATA_DIR)
+        try:
+            if engine.name != kind:
+                print(f"{kind:<12} unavailable: {engine.fallback_reason}")
+                continue
+            try:
+                engine.describe()
+            except Exception as e:
+                print(f"{kind:<12} unavailable: {e}")
+                continue
+            for size, r in bench_engine(engine, samples, args.rounds).items():
+                print(f"{kind:<12} {size:<6} {r['runs']:>5} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['recall']:>7.1%}")
+            outputs[kind] = {size: [run(engine, img) for img, _ in images] for size, images in samples.items()}
+        finally:
+            engine.close()
+        if kind == "tesserocr":
+            start_ms, pngs = per_image_costs(samples)
+            print(f"{'':<12} engine start {start_ms:.1f} ms (once per worker instead of once per image); "
+                  "temp PNG per image: " + ", ".join(f"{s} {ms:.1f} ms" for s, ms in pngs.items()))
+    if len(outputs) == 2:
+        print(f"{' vs '.join(outputs)}, per image:")
+        for size, (images, text_diff, value_diff) in compare_outputs(outputs, samples).items():
+            print(f"  {size:<6} {text_diff}/{images} images with different text, {value_diff} parsed values differ")
+    else:
+        print("engine comparison skipped: it needs both engines to run")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,241 @@
+"""
+Benchmark of the OCR-to-parse pipeline on synthetic lab reports.
+
+    cd backend
+    python -m benchmarks.bench_pipeline                      # run and print
+    python -m benchmarks.bench_pipeline --save-baseline      # store results as the baseline
+    python -m benchmarks.bench_pipeline --compare            # fail (exit 1) on regressions
+
+Cases:
+- parse:  parse_medical_report on a mixed corpus (short panels, full panels, long noisy reports)
+- gender: detect_gender_from_text on the same corpus
+- report: what an upload does with its text: one scan_report pass, then gender and parse_report
+- table:  parse_medical_report on the plain text of tabular reports (result, unit and range columns)
+- layout: the same reports parsed from Tesseract TSV word boxes (TSV decoding and row grouping included)
+- upload: POST /upload through the FastAPI TestClient with rendered report images.
+          OCR is stubbed (returns the text / word boxes the image was rendered from) unless --ocr tesseract.
+
+Runs offline. Baselines are machine specific; regenerate one on the machine you compare on.
+"""
+import os
+
+# benchmark the pipeline itself, not the OCR cache or disk copies
+os.environ.setdefault("OCR_CACHE_MAX_BYTES", "0")
+os.environ.setdefault("PERSIST_UPLOADS", "0")
+os.environ.setdefault("CLIENT_RATE", "0")  # one client sends every upload
+
+import argparse
+import hashlib
+import io
+import json
+import random
+import statistics
+import sys
+import time
+
+import pytesseract
+
+import main
+from benchmarks.bench_preprocess import find_tesseract
+from benchmarks.synthetic import (
+    HEADERS, report_corpus, report_rows, render_report_image, format_value, report_words, table_corpus,
+)
+from layout import words_to_tsv
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+def summarize_latencies(latencies_ms, wall_s):
+    cuts = statistics.quantiles(latencies_ms, n=100, method="inclusive")
+    return {
+        "runs": len(latencies_ms),
+        "ops_per_s": round(len(latencies_ms) / wall_s, 1),
+        "p50_ms": round(cuts[49], 4),
+        "p95_ms": round(cuts[94], 4),
+        "p99_ms": round(cuts[98], 4),
+    }
+
+def time_calls(func, inputs, rounds):
+    latencies = []
+    wall_start = time.perf_counter()
+    for _ in range(rounds):
+        for args in inputs:
+            start = time.perf_counter()
+            func(*args)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return summarize_latencies(latencies, time.perf_counter() - wall_start)
+
+def parse_accuracy(corpus):
+    """Share of written parameters that parse_medical_report recovers with the exact value."""
+    correct = total = 0
+    for text, expected, _ in corpus:
+        parsed = main.parse_medical_report(text)
+        total += len(expected)
+        correct += sum(1 for p, v in expected.items() if p in parsed and parsed[p]["value"] == float(v))
+    return round(correct / total, 4)
+
+def bench_parse(corpus, rounds):
+    result = time_calls(main.parse_medical_report, [(text,) for text, _, _ in corpus], rounds)
+    result["accuracy"] = parse_accuracy(corpus)
+    return result
+
+def table_accuracy(corpus, parse):
+    """Share of written results parse(text, tsv) recovers exactly, and how many values it reports wrongly."""
+    correct = total = wrong = 0
+    for text, tsv, expected in corpus:
+        parsed = parse(text, tsv)
+        total += len(expected)
+        correct += sum(1 for p, v in expected.items() if p in parsed and parsed[p]["value"] == float(v))
+        wrong += sum(1 for p, info in parsed.items() if p not in expected or info["value"] != float(expected[p]))
+    return round(correct / total, 4), wrong
+
+def parse_table_text(text, tsv):
+    return main.parse_medical_report(text)
+
+def parse_table_layout(text, tsv):
+    text, rows = main.read_ocr_output(tsv)
+    return main.parse_medical_report(text, rows=rows)
+
+def bench_table(corpus, rounds, parse):
+    result = time_calls(parse, [(text, tsv) for text, tsv, _ in corpus], rounds)
+    result["accuracy"], result["wrong_values"] = table_accuracy(corpus, parse)
+    return result
+
+def bench_gender(corpus, rounds):
+    return time_calls(main.detect_gender_from_text, [(text,) for text, _, _ in corpus], rounds)
+
+def analyze_text(text):
+    scan = main.scan_report([(text, [])])
+    gender, _ = main.resolve_gender(None, scan)
+    return main.parse_report(scan, gender)
+
+def bench_report(corpus, rounds):
+    return time_calls(analyze_text, [(text,) for text, _, _ in corpus], rounds)
+
+def upload_images(seed, count):
+    """PNG report pages plus the text and TSV word boxes each one was rendered from, keyed by decoded pixel hash."""
+    rng = random.Random(seed)
+    images, texts, tsvs = [], {}, {}
+    for _ in range(count):
+        params = rng.sample(list(main.catalog.names), rng.choice((8, len(main.catalog))))
+        rows = report_rows(rng, params)
+        header = rng.choice(HEADERS)
+        img = render_report_image(rows, width=1240, header=header)
+        buf = io.BytesIO()
+        img.save(buf, "PNG")
+        images.append(buf.getvalue())
+        lines = [header] + [f"{alias} {format_value(value)} {ref}" for alias, value, ref in rows]
+        key = hashlib.sha1(img.tobytes()).hexdigest()
+        texts[key] = "\n".join(lines)
+        tsvs[key] = words_to_tsv(report_words(rows, width=1240, header=header))
+    return images, texts, tsvs
+
+def bench_upload(seed, count, rounds, ocr):
+    from fastapi.testclient import TestClient
+
+    images, texts, tsvs = upload_images(seed, count)
+    if ocr == "tesseract" and not find_tesseract():
+        raise SystemExit("Tesseract not found (set TESSERACT_CMD or add it to PATH).")
+    if ocr == "stub":
+        # the stub must see the exact rendered pixels, so skip preprocessing, and replaces pytesseract
+        main.PREPROCESS_STEPS = ()
+        main.OCR_ENGINE = "pytesseract"
+        pytesseract.image_to_string = lambda img, **kwargs: texts.get(hashlib.sha1(img.tobytes()).hexdigest(), "")
+        pytesseract.image_to_data = lambda img, **kwargs: tsvs.get(hashlib.sha1(img.tobytes()).hexdigest(), "")
+    latencies = []
+    with TestClient(main.app) as client:
+        client.post("/upload", files={"file": ("warmup.png", images[0])})  # start the OCR pool
+        wall_start = time.perf_counter()
+        for _ in range(rounds):
+            for i, data in enumerate(images):
+                start = time.perf_counter()
+                response = client.post("/upload", files={"file": (f"page{i}.png", data)})
+                latencies.append((time.perf_counter() - start) * 1000)
+                response.raise_for_status()
+        wall = time.perf_counter() - wall_start
+    return summarize_latencies(latencies, wall)
+
+def compare(results, baseline, tolerance):
+    """Return regression messages: p50 slower or accuracy lower than baseline beyond tolerance, or no baseline for a case."""
+    problems = []
+    for case, current in results.items():
+        base = baseline.get(case)
+        if not base:
+            problems.append(f"{case}: not in the baseline (regenerate it with --save-baseline)")
+            continue
+        if current["p50_ms"] > base["p50_ms"] * (1 + tolerance):
+            problems.append(f"{case}: p50 {current['p50_ms']:.4f} ms vs baseline {base['p50_ms']:.4f} ms")
+        if "accuracy" in base and current.get("accuracy", 1) < base["accuracy"] - 0.005:
+            problems.append(f"{case}: accuracy {current['accuracy']:.2%} vs baseline {base['accuracy']:.2%}")
+    return problems
+
+def print_results(results, baseline=None):
+    print(f"{'case':<8} {'runs':>7} {'ops/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'vs base p50':>12}")
+    for case, r in results.items():
+        delta = ""
+        if baseline and case in baseline:
+            delta = f"{(r['p50_ms'] / baseline[case]['p50_ms'] - 1) * 100:+.1f}%"
+        print(f"{case:<8} {r['runs']:>7} {r['ops_per_s']:>10.1f} {r['p50_ms']:>10.4f} {r['p95_ms']:>10.4f} {r['p99_ms']:>10.4f} {delta:>12}")
+        if "accuracy" in r:
+            wrong = f", {r['wrong_values']} wrong values" if "wrong_values" in r else ""
+            print(f"{'':<8} parse accuracy {r['accuracy']:.2%}{wrong}")
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", default="parse,gender,report,table,layout,upload")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reports", type=int, default=150, help="synthetic reports in the text corpus")
+    parser.add_argument("--rounds", type=int, default=5, help="passes over the corpus for parse/gender")
+    parser.add_argument("--uploads", type=int, default=10, help="distinct report images for the upload case")
+    parser.add_argument("--upload-rounds", type=int, default=5)
+    parser.add_argument("--ocr", choices=("stub", "tesseract"), default="stub")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true",
+                        help="exit 1 if slower than baseline beyond --tolerance, or if a case has no baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative p50 slowdown")
+    parser.add_argument("--output", help="also write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    cases = [c.strip() for c in args.cases.split(",") if c.strip()]
+    corpus = report_corpus(args.seed, args.reports)
+    results = {}
+    if "parse" in cases:
+        results["parse"] = bench_parse(corpus, args.rounds)
+    if "gender" in cases:
+        results["gender"] = bench_gender(corpus, args.rounds)
+    if "report" in cases:
+        results["report"] = bench_report(corpus, args.rounds)
+    if "table" in cases or "layout" in cases:
+        tables = table_corpus(args.seed, args.reports)
+        if "table" in cases:
+            results["table"] = bench_table(tables, args.rounds, parse_table_text)
+        if "layout" in cases:
+            results["layout"] = bench_table(tables, args.rounds, parse_table_layout)
+    if "upload" in cases:
+        results["upload"] = bench_upload(args.seed, args.uploads, args.upload_rounds, args.ocr)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+    if args.compare:
+        if baseline is None:
+            print(f"no baseline at {args.baseline}")
+            return 1
+        problems = compare(results, baseline, args.tolerance)
+        for problem in problems:
+            print("REGRESSION", problem)
+        return 1 if problems else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
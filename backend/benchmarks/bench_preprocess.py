@@ -0,0 +1,86 @@
+"""
+OCR preprocessing benchmark on synthetic phone photos of a lab report.
+
+    cd backend
+    python -m benchmarks.bench_preprocess --repeat 3
+
+Always reports per-stage preprocessing time and the pixels handed to Tesseract.
+When a Tesseract binary is available (PATH or TESSERACT_CMD) it also compares OCR
+latency and parameters recovered for the raw photo vs the preprocessed page.
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import time
+
+import pytesseract
+
+import main
+from preprocess import preprocess
+from benchmarks.synthetic import report_rows, render_report_image, phone_photo
+
+def find_tesseract():
+    cmd = os.environ.get("TESSERACT_CMD") or shutil.which("tesseract")
+    if not cmd:
+        return None
+    pytesseract.pytesseract.tesseract_cmd = cmd
+    try:
+        pytesseract.get_tesseract_version()
+    except Exception:
+        return None
+    return cmd
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+def run(repeat, seed):
+    rng = random.Random(seed)
+    tesseract = find_tesseract()
+    stage_ms = {}
+    raw_ms, tuned_ms = [], []
+    raw_found, tuned_found = [], []
+    for i in range(repeat):
+        rows = report_rows(rng)
+        photo = phone_photo(render_report_image(rows), rng)
+        page, timings = preprocess(
+            photo, main.PREPROCESS_STEPS, roi=main.OCR_ROI,
+            max_dimension=main.OCR_MAX_DIMENSION, target_dpi=main.OCR_TARGET_DPI,
+        )
+        for stage, ms in timings.items():
+            stage_ms.setdefault(stage, []).append(ms)
+        if i == 0:
+            print(f"pixels to Tesseract: raw {photo.width}x{photo.height} -> preprocessed {page.width}x{page.height} "
+                  f"({photo.width * photo.height / (page.width * page.height):.1f}x fewer)")
+        if tesseract:
+            text, ms = timed(pytesseract.image_to_string, photo)
+            raw_ms.append(ms)
+            raw_found.append(len(main.parse_medical_report(text)))
+            text, ms = timed(pytesseract.image_to_string, page, lang=main.OCR_LANG, config=main.tesseract_config())
+            tuned_ms.append(ms)
+            tuned_found.append(len(main.parse_medical_report(text)))
+
+    print("preprocessing stage        median ms")
+    for stage, values in stage_ms.items():
+        print(f"  {stage:<24} {statistics.median(values):8.1f}")
+    print(f"  {'total':<24} {sum(statistics.median(v) for v in stage_ms.values()):8.1f}")
+
+    if not tesseract:
+        print("Tesseract not found (set TESSERACT_CMD or add it to PATH); OCR comparison skipped.")
+        return
+    total = len(main.catalog)
+    print("OCR                        median ms   params found")
+    print(f"  raw photo, default config {statistics.median(raw_ms):9.1f}   {statistics.mean(raw_found):.1f}/{total}")
+    pre_total = statistics.median(tuned_ms) + sum(statistics.median(v) for v in stage_ms.values())
+    print(f"  preprocessed, tuned       {pre_total:9.1f}   {statistics.mean(tuned_found):.1f}/{total}")
+    print(f"  speedup {statistics.median(raw_ms) / pre_total:.1f}x (preprocessing time included)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(args.repeat, args.seed)
@@ -0,0 +1,127 @@
+"""
+Benchmark of worker cold start: time to ready and first-request latency, with and without warm-up.
+
+    cd backend
+    python -m benchmarks.bench_startup                    # 5 fresh processes per mode
+    python -m benchmarks.bench_startup --trials 10 --ocr tesseract
+
+Each trial starts a fresh interpreter, as an autoscaled worker would, and measures:
+- import:  `import main` (FastAPI, PIL, catalog compilation; NumPy, pytesseract and pymupdf load on first use)
+- ready:   from app startup until GET /ready answers 200 (STARTUP_WARMUP=1: parser warm-up,
+           Tesseract check and one OCR job per worker; STARTUP_WARMUP=0: the Tesseract check only)
+- spawn:   from process start until ready, interpreter start-up included (the benchmark's own
+           image rendering excluded)
+- first:   the first POST /upload once ready
+- steady:  p50 of the uploads after it
+OCR is stubbed by default (see bench_pipeline); pass --ocr tesseract to use a local Tesseract install.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def stub_engine_info():
+    """main.check_tesseract for the stubbed OCR (module level: it is pickled to an OCR worker)."""
+    import main
+    return {"cmd": "stub", "version": "stub", "languages": main.OCR_LANG.split("+")}
+
+def child(args):
+    """One trial in this (fresh) process; prints its measurements as JSON."""
+    start = time.perf_counter()
+    import main
+    import_ms = (time.perf_counter() - start) * 1000
+
+    import hashlib
+    import mimetypes
+    import pytesseract
+    from fastapi.testclient import TestClient
+    from benchmarks.bench_pipeline import upload_images
+    from benchmarks.bench_preprocess import find_tesseract
+
+    start = time.perf_counter()
+    images, texts, tsvs = upload_images(args.seed, args.uploads)
+    mimetypes.init()  # the test client's first multipart upload would load it
+    setup_s = time.perf_counter() - start
+    if args.ocr == "tesseract":
+        if not find_tesseract():
+            raise SystemExit("Tesseract not found (set TESSERACT_CMD or add it to PATH).")
+    else:
+        # the stub must see the exact rendered pixels, so skip preprocessing, and replaces pytesseract
+        main.PREPROCESS_STEPS = ()
+        main.OCR_ENGINE = "pytesseract"
+        pytesseract.image_to_string = lambda img, **kwargs: texts.get(hashlib.sha1(img.tobytes()).hexdigest(), "")
+        pytesseract.image_to_data = lambda img, **kwargs: tsvs.get(hashlib.sha1(img.tobytes()).hexdigest(), "")
+        main.check_tesseract = stub_engine_info
+
+    start = time.perf_counter()
+    with TestClient(main.app) as client:
+        while client.get("/ready").status_code != 200:
+            if main.startup["error"]:
+                raise SystemExit(main.startup["error"])
+            time.sleep(0.01)
+        ready_ms = (time.perf_counter() - start) * 1000
+        spawn_ms = (time.time() - float(os.environ["BENCH_STARTED_AT"]) - setup_s) * 1000
+        latencies = []
+        for i, data in enumerate(images):
+            start = time.perf_counter()
+            client.post("/upload", files={"file": (f"page{i}.png", data)}).raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+    print(json.dumps({
+        "import_ms": import_ms,
+        "ready_ms": ready_ms,
+        "spawn_ms": spawn_ms,
+        "first_ms": latencies[0],
+        "steady_ms": statistics.median(latencies[1:]),
+        "warmup_ms": main.startup["warmup_ms"],
+    }))
+
+def run_trial(args, warmup, workdir):
+    env = dict(
+        os.environ,
+        STARTUP_WARMUP="1" if warmup else "0",
+        OCR_WORKERS=str(args.workers),
+        OCR_CACHE_MAX_BYTES="0",
+        PERSIST_UPLOADS="0",
+        CLIENT_RATE="0",
+        CATALOG_RELOAD_INTERVAL="0",
+        PYTHONPATH=BACKEND_DIR,
+        BENCH_STARTED_AT=repr(time.time()),
+    )
+    command = [sys.executable, "-m", "benchmarks.bench_startup", "--child", "--ocr", args.ocr,
+               "--seed", str(args.seed), "--uploads", str(args.uploads)]
+    out = subprocess.run(command, env=env, cwd=workdir, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=5, help="fresh processes per mode")
+    parser.add_argument("--workers", type=int, default=2, help="OCR_WORKERS of each process")
+    parser.add_argument("--uploads", type=int, default=6, help="uploads per process, the first one included")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ocr", choices=("stub", "tesseract"), default="stub")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        child(args)
+        return 0
+
+    columns = ("import_ms", "ready_ms", "spawn_ms", "first_ms", "steady_ms")
+    print(f"{'warm-up':<8} " + " ".join(f"{c[:-3] + ' ms':>10}" for c in columns) + "   (medians)")
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as workdir:
+        for warmup in (False, True):
+            trials = [run_trial(args, warmup, workdir) for _ in range(args.trials)]
+            medians = [statistics.median(t[c] for t in trials) for c in columns]
+            print(f"{'on' if warmup else 'off':<8} " + " ".join(f"{m:>10.1f}" for m in medians))
+            if warmup:
+                stages = {s: statistics.median(t["warmup_ms"][s] for t in trials) for s in trials[0]["warmup_ms"]}
+                print("warm-up stages (ms):", ", ".join(f"{s} {ms:.1f}" for s, ms in stages.items()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,260 @@
+"""
+Synthetic lab reports for benchmarks: plain OCR-like text and rendered page images.
+Everything is generated from a seed, so runs are reproducible.
+"""
+import random
+from PIL import Image, ImageDraw, ImageFont, ImageFilter
+
+from layout import Word, words_to_tsv
+from main import catalog
+
+def param_range(param):
+    """(low, high) to generate values around: the male range where ranges differ by gender."""
+    return catalog.parameters[catalog.ids[param]].ranges[0]
+
+def param_aliases(param):
+    return catalog.parameters[catalog.ids[param]].aliases
+
+def sample_value(rng, param):
+    """A plausible value for param: mostly inside its range, sometimes just outside."""
+    low, high = param_range(param)
+    high = min(high, low * 3 + 10) if high >= 9999 else high
+    span = high - low
+    value = rng.uniform(low - 0.3 * span, high + 0.3 * span)
+    value = max(value, 0)
+    return round(value) if high >= 1000 else round(value, 1)
+
+def report_rows(rng, params=None):
+    """[(alias, value, range text)] for params (all known parameters by default)."""
+    rows = []
+    for param in params or list(catalog.names):
+        alias = rng.choice(param_aliases(param))
+        low, high = param_range(param)
+        rows.append((alias, sample_value(rng, param), f"{low:g} - {high:g}"))
+    return rows
+
+# ---------------------------
+# Report text
+# ---------------------------
+
+LAYOUTS = ("inline", "colon", "table", "stacked")
+
+HEADERS = (
+    "Patient Name: Jane Doe    Sex: Female    Age: 42 Years",
+    "Patient: John Smith   Age/Sex: 35 Y / Male",
+    "Name: A. Kumar    M 28Y    Ref. By: Dr. Rao",
+    "Name: R. Iyer    F 51 Y    Sample: Serum",
+    "Patient ID: 004512    Collected: 12/03/2024 09:40",
+)
+
+FILLER = (
+    "Method: Automated analyser",
+    "Sample type: Serum",
+    "Report generated electronically, signature not required.",
+    "Please correlate clinically.",
+    "--------------------------------------------",
+    "Page 1 of 3",
+    "Test Name        Result     Units      Reference Interval",
+    "Note: values flagged outside the reference interval",
+)
+
+# characters Tesseract commonly confuses
+OCR_CONFUSIONS = {"0": "O", "1": "l", "5": "S", "8": "B", "l": "1", "O": "0", "e": "c", ".": ","}
+
+def format_value(value):
+    return f"{value:,}" if value >= 1000 else f"{value}"
+
+def add_ocr_noise(text, rng, rate):
+    """Swap easily confused characters and drop or double a few, at roughly `rate` per character."""
+    if rate <= 0:
+        return text
+    out = []
+    for ch in text:
+        r = rng.random()
+        if r < rate and ch in OCR_CONFUSIONS:
+            out.append(OCR_CONFUSIONS[ch])
+        elif r < rate * 1.2 and ch != "\n":
+            continue
+        elif r < rate * 1.4:
+            out.append(ch + ch)
+        else:
+            out.append(ch)
+    return "".join(out)
+
+# letters Tesseract commonly misreads inside words
+LETTER_CONFUSIONS = {"i": "l", "l": "1", "o": "0", "e": "c", "a": "o", "n": "h", "u": "v", "c": "e", "t": "f", "r": "n"}
+
+def misspell(rng, alias, edits=1):
+    """alias with `edits` OCR errors (a confused, dropped or doubled letter) in its longest word, if that has 5+ letters."""
+    words = alias.split(" ")
+    k = max(range(len(words)), key=lambda i: len(words[i]))
+    word = words[k]
+    if len(word) < 5:
+        return alias
+    for _ in range(edits):
+        i = rng.randrange(1, len(word) - 1)  # keep the first and last letter
+        r = rng.random()
+        if r < 0.6:
+            word = word[:i] + LETTER_CONFUSIONS.get(word[i], "x") + word[i + 1:]
+        elif r < 0.8:
+            word = word[:i] + word[i + 1:]
+        else:
+            word = word[:i] + word[i] + word[i:]
+    words[k] = word
+    return " ".join(words)
+
+def report_text(rng, n_params=None, layout=None, noise=0.0, filler_lines=0, alias_typos=0):
+    """
+    Synthetic OCR text of a lab report; alias_typos misspells aliases that many times (see misspell).
+    Returns (text, {param: value} that was written, header line used).
+    """
+    params = list(catalog.names)
+    if n_params is not None and n_params < len(params):
+        params = rng.sample(params, n_params)
+    layout = layout or rng.choice(LAYOUTS)
+    header = rng.choice(HEADERS)
+    lines = [header, ""]
+    expected = {}
+    for alias, value, ref in report_rows(rng, params):
+        param = next(p for p in params if alias in param_aliases(p))
+        expected[param] = value
+        shown = misspell(rng, alias, alias_typos) if alias_typos else alias
+        shown = rng.choice([shown, shown.upper(), shown.title()])
+        if layout == "inline":
+            lines.append(f"{shown} {format_value(value)} {ref}")
+        elif layout == "colon":
+            lines.append(f"{shown}: {format_value(value)}")
+        elif layout == "table":
+            lines.append(f"{shown:<28}\t{format_value(value):>10}\t{ref}")
+        else:
+            lines.extend([shown, format_value(value), ref])
+        if filler_lines and rng.random() < 0.3:
+            lines.append(rng.choice(FILLER))
+    for _ in range(filler_lines):
+        lines.insert(rng.randrange(2, len(lines) + 1), rng.choice(FILLER))
+    return add_ocr_noise("\n".join(lines), rng, noise), expected, header
+
+def report_corpus(seed=0, count=200):
+    """A mix of report sizes, layouts and noise levels: [(text, expected, header)]."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        size = i % 3
+        corpus.append(report_text(
+            rng,
+            n_params=(8, None, None)[size],
+            noise=rng.choice((0.0, 0.0, 0.01, 0.03)),
+            filler_lines=(2, 10, 120)[size],  # short panel, full panel, long multi-page report
+        ))
+    return corpus
+
+def typo_corpus(seed=0, count=150, edits=1):
+    """Noise-free reports whose aliases are misspelled `edits` times each: [(text, expected, header)]."""
+    rng = random.Random(seed)
+    return [
+        report_text(rng, n_params=(8, None, None)[i % 3], filler_lines=(2, 10, 40)[i % 3], alias_typos=edits)
+        for i in range(count)
+    ]
+
+# ---------------------------
+# OCR word boxes
+# ---------------------------
+
+UNITS = ("g/dL", "%", "mg/dL", "10^3/uL", "mmol/L", "U/L", "IU/L", "pg/mL", "fL")
+
+def line_words(texts_at, top, char_width, height):
+    """Words of one printed line: [(x, text)] cells split on spaces, each word char_width per character."""
+    words = []
+    for x, text in texts_at:
+        for part in text.split():
+            words.append(Word(part, round(x), top, round(len(part) * char_width), height))
+            x += (len(part) + 1) * char_width
+    return words
+
+def report_words(rows, width=2480, header="Patient: Jane Doe    Sex: Female    Age: 42 Y"):
+    """Word boxes where render_report_image draws header and rows: [[Word] per line]."""
+    size = max(12, width // 60)
+    char_width, line_height = size * 0.55, int(size * 1.8)
+    x, y = width // 12, width // 12
+    lines = [line_words([(x, header)], y, char_width, size)]
+    y += line_height * 2
+    for alias, value, ref in rows:
+        if y > int(width * 1.414) - line_height:
+            break
+        cells = [(x, alias.title()), (x + width * 0.45, format_value(value)), (x + width * 0.65, ref)]
+        lines.append(line_words(cells, y, char_width, size))
+        y += line_height
+    return lines
+
+def report_table(rng, n_params=None, noise=0.0, missing=0.1, width=2480):
+    """
+    Word boxes of a tabular report (test, result, unit and reference columns, some results left
+    blank) as Tesseract TSV plus the plain text Tesseract would read from it.
+    Returns (text, tsv, {param: value} of the results written).
+    """
+    params = list(catalog.names)
+    if n_params is not None and n_params < len(params):
+        params = rng.sample(params, n_params)
+    size = max(12, width // 60)
+    char_width, line_height = size * 0.55, int(size * 1.8)
+    x = width // 12
+    columns = (x, x + width * 0.4, x + width * 0.52, x + width * 0.66)
+    y = x
+    lines = [line_words([(x, rng.choice(HEADERS))], y, char_width, size)]
+    y += line_height * 2
+    lines.append(line_words(zip(columns, ("Test", "Result", "Units", "Reference Interval")), y, char_width, size))
+    expected = {}
+    for alias, value, ref in report_rows(rng, params):
+        y += line_height
+        param = next(p for p in params if alias in param_aliases(p))
+        shown = rng.choice([alias, alias.upper(), alias.title()])
+        result = "" if rng.random() < missing else format_value(value)
+        if result:
+            expected[param] = value
+        cells = zip(columns, (shown, result, rng.choice(UNITS), ref))
+        words = [w._replace(text=add_ocr_noise(w.text, rng, noise) or w.text) for w in line_words(cells, y, char_width, size)]
+        # Tesseract jitters boxes by a pixel or two
+        lines.append([w._replace(top=w.top + rng.randint(-2, 2)) for w in words])
+    text = "\n".join(" ".join(w.text for w in line) for line in lines)
+    return text, words_to_tsv(lines), expected
+
+def table_corpus(seed=0, count=100):
+    """Tabular reports of mixed size and noise: [(text, tsv, expected)]."""
+    rng = random.Random(seed)
+    return [
+        report_table(rng, n_params=(8, None)[i % 2], noise=rng.choice((0.0, 0.0, 0.01, 0.03)))
+        for i in range(count)
+    ]
+
+# ---------------------------
+# Rendered images
+# ---------------------------
+
+def render_report_image(rows, width=2480, header="Patient: Jane Doe    Sex: Female    Age: 42 Y"):
+    """Render rows as a clean A4-proportioned page at roughly 300 DPI."""
+    height = int(width * 1.414)
+    font = ImageFont.load_default(size=max(12, width // 60))
+    line_height = int(font.size * 1.8)
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    x, y = width // 12, width // 12
+    draw.text((x, y), header, fill="black", font=font)
+    y += line_height * 2
+    for alias, value, ref in rows:
+        if y > height - line_height:
+            break
+        draw.text((x, y), alias.title(), fill="black", font=font)
+        draw.text((x + width * 0.45, y), f"{value:,}" if value >= 1000 else f"{value}", fill="black", font=font)
+        draw.text((x + width * 0.65, y), ref, fill="black", font=font)
+        y += line_height
+    return img
+
+def phone_photo(img, rng, long_side=4032, max_skew=3.0):
+    """Make a clean page look like a phone photo: upscaled, tilted, tinted, slightly blurred and noisy."""
+    scale = long_side / max(img.size)
+    photo = img.resize((round(img.width * scale), round(img.height * scale)), Image.Resampling.BILINEAR)
+    photo = photo.rotate(rng.uniform(-max_skew, max_skew), resample=Image.Resampling.BICUBIC, expand=True, fillcolor=(200, 195, 185))
+    tint = Image.new("RGB", photo.size, (255, 240, 215))
+    photo = Image.blend(photo, tint, 0.25).filter(ImageFilter.GaussianBlur(1.2))
+    noise = Image.effect_noise(photo.size, 24).convert("RGB")
+    return Image.blend(photo, noise, 0.08)
@@ -0,0 +1,249 @@
+import json
+import os
+import re
+import time
+from functools import cached_property
+
+from fuzzy import FuzzyAliasIndex
+from classify import RangeClassifier, GENDERS, CLASS_LABELS, NORMAL, LOW, HIGH, NO_RANGE
+
+SCHEMA_VERSION = 1
+RANGE_KEYS = ("male", "female", "default")
+PARAMETER_FIELDS = {
+    "name", "aliases", "ranges", "normal_range", "description", "low_meaning", "high_meaning", "advice", "notes",
+}
+
+# patient header fields in lowered report text: "sex: male", a bare "male" / "female",
+# the "M 25Y" / "F 51 Y" shorthand and "age: 42"; matched in the same scan as the aliases.
+# The leading character class lets the scan reject most positions before trying any branch.
+HEADER_PATTERN = (
+    r"(?=[smfa])\b(?:"
+    r"sex[:\s]*(?P<sex>male|female|m|f)\b"
+    r"|(?P<word>male|female)\b"
+    r"|(?P<short>[mf])[\s,](?P<short_age>\d{1,2})\s*y?\b"
+    r"|age(?:/sex)?[:\s]*(?P<age>\d{1,3})\b)"
+)
+HEADER_RE = re.compile(f"(?=(?:{HEADER_PATTERN}))")
+
+
+class CatalogError(ValueError):
+    """The catalog file is missing, malformed or inconsistent (message lists every problem)."""
+
+
+class Parameter:
+    """One catalog entry, resolved for fast lookups: per-gender ranges and response text are precomputed."""
+
+    __slots__ = ("id", "name", "aliases", "ranges", "normal_ranges", "description", "advice", "meanings")
+
+    def __init__(self, id, entry):
+        self.id = id
+        self.name = entry["name"]
+        self.aliases = tuple(entry["aliases"])
+        ranges = entry.get("ranges") or {}
+        # (low, high) or (None, None) per gender id: gender-specific, else default, else any range given
+        self.ranges = tuple(_for_gender(ranges, gender, (None, None)) for gender in GENDERS)
+        normal_range = entry.get("normal_range", "")
+        if isinstance(normal_range, dict):
+            self.normal_ranges = tuple(_for_gender(normal_range, gender, "") for gender in GENDERS)
+        else:
+            self.normal_ranges = (normal_range,) * len(GENDERS)
+        self.description = entry.get("description", "")
+        self.advice = entry.get("advice", "")
+        meanings = [None] * len(CLASS_LABELS)
+        meanings[NORMAL] = "Within normal range."
+        meanings[LOW] = entry.get("low_meaning", "Below normal range.")
+        meanings[HIGH] = entry.get("high_meaning", "Above normal range.")
+        meanings[NO_RANGE] = "Value found."
+        self.meanings = tuple(meanings)
+
+    def __repr__(self):
+        return f"Parameter({self.id}, {self.name!r})"
+
+
+def _for_gender(by_gender, gender, missing):
+    if gender in by_gender:
+        return tuple(by_gender[gender]) if isinstance(by_gender[gender], list) else by_gender[gender]
+    if "default" in by_gender:
+        return _for_gender(by_gender, "default", missing)
+    for key in by_gender:
+        return _for_gender(by_gender, key, missing)
+    return missing
+
+
+class FallbackPatterns(dict):
+    """
+    alias -> regex finding the alias and the first number within 80 characters after it.
+    Compiling one per alias costs most of a catalog load, and most aliases never need
+    the fallback, so each is compiled when first looked up.
+    """
+
+    def __missing__(self, alias):
+        pattern = re.compile(rf"(?<![a-z0-9]){re.escape(alias)}(?![a-z0-9])[\s\S]{{0,80}}?([-\d.,%]+)", re.IGNORECASE)
+        self[alias] = pattern
+        return pattern
+
+
+def build_alias_index(aliases_by_param):
+    """
+    Compile every alias into one lookahead regex so a single scan of the lowered
+    text reports all alias occurrences, including overlapping ones ("hdl" inside "hdl cholesterol"),
+    and the patient header fields (HEADER_PATTERN groups) where no alias starts.
+    Aliases match whole words only: "k" does not hit inside "bank", nor "hb" inside "hba1c".
+    aliases_by_param is a sequence of alias tuples indexed by parameter id.
+    Returns a dict with:
+    - pattern: the combined regex (longest alias first, so each position reports its longest
+      hit in the "alias" group; header matches leave it empty),
+    - hits: longest alias -> (aliases, param ids) that also start at that position,
+    - params: alias -> param ids it names,
+    - fallback: alias -> windowed regex used by the fallback pass, compiled on first use
+      (Catalog.warm compiles them all ahead of time).
+    """
+    params_by_alias = {}
+    for param_id, aliases in enumerate(aliases_by_param):
+        for alias in aliases:
+            params_by_alias.setdefault(alias, [])
+            if param_id not in params_by_alias[alias]:
+                params_by_alias[alias].append(param_id)
+
+    ordered = sorted(params_by_alias, key=len, reverse=True)
+    alternation = "|".join(re.escape(a) for a in ordered)
+    pattern = re.compile(f"(?=(?<![a-z0-9])(?P<alias>{alternation})(?![a-z0-9])|{HEADER_PATTERN})")
+
+    hits = {}
+    for alias in ordered:
+        # a shorter alias that is a prefix of this one and ends on a word boundary matches at the same position
+        covered = [a for a in ordered if alias.startswith(a) and not alias[len(a):len(a) + 1].isalnum()]
+        params = []
+        for a in covered:
+            for p in params_by_alias[a]:
+                if p not in params:
+                    params.append(p)
+        hits[alias] = (tuple(covered), tuple(params))
+
+    fallback = FallbackPatterns()
+    params = {alias: tuple(ids) for alias, ids in params_by_alias.items()}
+    return {"pattern": pattern, "hits": hits, "params": params, "fallback": fallback}
+
+
+def validate_catalog(data):
+    """Return a list of problems with a decoded catalog document (empty when it is valid)."""
+    if not isinstance(data, dict):
+        return ["catalog must be a JSON object"]
+    problems = []
+    if data.get("schema_version") != SCHEMA_VERSION:
+        problems.append(f"schema_version must be {SCHEMA_VERSION}")
+    if not isinstance(data.get("version"), (str, int)):
+        problems.append("version is required (string or integer)")
+    entries = data.get("parameters")
+    if not isinstance(entries, list) or not entries:
+        return problems + ["parameters must be a non-empty list"]
+
+    names = set()
+    for i, entry in enumerate(entries):
+        where = f"parameters[{i}]"
+        if not isinstance(entry, dict):
+            problems.append(f"{where}: must be an object")
+            continue
+        name = entry.get("name")
+        if not isinstance(name, str) or not name.strip():
+            problems.append(f"{where}: name must be a non-empty string")
+        elif name in names:
+            problems.append(f"{where}: duplicate name {name!r}")
+        else:
+            names.add(name)
+            where = f"{where} ({name})"
+        unknown = set(entry) - PARAMETER_FIELDS
+        if unknown:
+            problems.append(f"{where}: unknown fields {sorted(unknown)}")
+
+        aliases = entry.get("aliases")
+        if not isinstance(aliases, list) or not aliases:
+            problems.append(f"{where}: aliases must be a non-empty list")
+        else:
+            for alias in aliases:
+                # the parser matches aliases against lowered text
+                if not isinstance(alias, str) or not alias.strip() or alias != alias.strip().lower():
+                    problems.append(f"{where}: alias {alias!r} must be a non-empty, trimmed, lowercase string")
+
+        ranges = entry.get("ranges", {})
+        if not isinstance(ranges, dict):
+            problems.append(f"{where}: ranges must be an object")
+        else:
+            for key, bounds in ranges.items():
+                if key not in RANGE_KEYS:
+                    problems.append(f"{where}: range key {key!r} must be one of {RANGE_KEYS}")
+                elif (
+                    not isinstance(bounds, list) or len(bounds) != 2
+                    or not all(isinstance(b, (int, float)) and not isinstance(b, bool) for b in bounds)
+                ):
+                    problems.append(f"{where}: range {key!r} must be [low, high]")
+                elif bounds[0] > bounds[1]:
+                    problems.append(f"{where}: range {key!r} has low > high")
+
+        normal_range = entry.get("normal_range", "")
+        if isinstance(normal_range, dict):
+            if any(k not in RANGE_KEYS or not isinstance(v, str) for k, v in normal_range.items()):
+                problems.append(f"{where}: normal_range object must map {RANGE_KEYS} to strings")
+        elif not isinstance(normal_range, str):
+            problems.append(f"{where}: normal_range must be a string or an object")
+        for field in ("description", "low_meaning", "high_meaning", "advice", "notes"):
+            if field in entry and not isinstance(entry[field], str):
+                problems.append(f"{where}: {field} must be a string")
+    return problems
+
+
+class Catalog:
+    """
+    Parameter catalog with everything the parse path needs precomputed: parameters indexed by
+    integer id, the exact and fuzzy alias indexes, the range classifier tables (built on first use,
+    or by warm) and per-gender response fragments.
+    Instances are never modified; a reload builds a new one and swaps the reference.
+    """
+
+    def __init__(self, data, source=None, mtime=None):
+        problems = validate_catalog(data)
+        if problems:
+            raise CatalogError("; ".join(problems))
+        self.version = str(data["version"])
+        self.source = source
+        self.mtime = mtime
+        self.loaded_at = time.time()
+        self.parameters = tuple(Parameter(i, entry) for i, entry in enumerate(data["parameters"]))
+        self.names = tuple(p.name for p in self.parameters)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.aliases = tuple(p.aliases for p in self.parameters)
+        self.alias_index = build_alias_index(self.aliases)
+        self.fuzzy_index = FuzzyAliasIndex(alias for aliases in self.aliases for alias in aliases)
+
+    @cached_property
+    def classifier(self):
+        return RangeClassifier(self.names, self.threshold_for)
+
+    def threshold_for(self, name, gender="unknown"):
+        """(low, high) of a parameter for a gender, or (None, None) when it has no range."""
+        param_id = self.ids.get(name)
+        if param_id is None:
+            return None, None
+        gender = gender.lower() if gender else "unknown"
+        return self.parameters[param_id].ranges[GENDERS.index(gender) if gender in GENDERS else -1]
+
+    def warm(self):
+        """Compile what is otherwise built on first use (the fallback regexes, the classifier), e.g. before serving."""
+        self.classifier
+        fallback = self.alias_index["fallback"]
+        for alias in self.alias_index["params"]:
+            fallback[alias]
+
+    def __len__(self):
+        return len(self.parameters)
+
+
+def load_catalog(path):
+    """Read, validate and compile a catalog file. Raises CatalogError."""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise CatalogError(f"cannot read {path}: {e}")
+    return Catalog(data, source=path, mtime=mtime)
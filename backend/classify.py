@@ -0,0 +1,67 @@
+# NumPy is imported where it is used rather than here: catalog and main import this module, and
+# importing NumPy would add a tenth of a second to every server start before the first report needs it
+
+# gender ids used to index the threshold tables; anything else uses the "unknown" column
+GENDERS = ("male", "female", "unknown")
+GENDER_IDS = {"male": 0, "female": 1}
+UNKNOWN_GENDER = 2
+
+# class codes returned by RangeClassifier.classify
+NORMAL, LOW, HIGH, NO_RANGE = 0, 1, 2, 3
+CLASS_LABELS = ("normal", "low", "high", "no_range")
+
+def gender_id(gender):
+    return GENDER_IDS.get(gender.lower(), UNKNOWN_GENDER) if gender else UNKNOWN_GENDER
+
+class RangeClassifier:
+    """
+    Threshold tables compiled into (param id x gender id) NumPy arrays, so whole arrays of
+    (param, value, gender) can be classified as low / normal / high in one call.
+    threshold_for(param, gender) supplies the (low, high) pair, or (None, None) when a
+    parameter has no range.
+    """
+
+    def __init__(self, params, threshold_for):
+        import numpy as np
+        self.params = list(params)
+        self.param_ids = {p: i for i, p in enumerate(self.params)}
+        self.low = np.full((len(self.params), len(GENDERS)), np.nan)
+        self.high = np.full((len(self.params), len(GENDERS)), np.nan)
+        for i, param in enumerate(self.params):
+            for g, gender in enumerate(GENDERS):
+                low, high = threshold_for(param, gender)
+                if low is not None and high is not None:
+                    self.low[i, g] = low
+                    self.high[i, g] = high
+
+    def encode_params(self, params):
+        """Param names -> int array of ids (-1 for names the table does not know)."""
+        import numpy as np
+        return np.fromiter((self.param_ids.get(p, -1) for p in params), dtype=np.int64, count=len(params))
+
+    def encode_genders(self, genders):
+        import numpy as np
+        return np.fromiter((gender_id(g) for g in genders), dtype=np.int64, count=len(genders))
+
+    def classify(self, param_ids, values, gender_ids):
+        """
+        Vectorized classification. All arguments are equal-length arrays (gender_ids may be a scalar).
+        Returns an int8 array of NORMAL / LOW / HIGH / NO_RANGE; unknown param ids give NO_RANGE.
+        """
+        import numpy as np
+        param_ids = np.asarray(param_ids, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        gender_ids = np.broadcast_to(np.asarray(gender_ids, dtype=np.int64), param_ids.shape)
+        known = param_ids >= 0
+        safe_ids = np.where(known, param_ids, 0)
+        low = np.where(known, self.low[safe_ids, gender_ids], np.nan)
+        high = np.where(known, self.high[safe_ids, gender_ids], np.nan)
+        classes = np.full(param_ids.shape, NORMAL, dtype=np.int8)
+        classes[values < low] = LOW
+        classes[values > high] = HIGH
+        classes[np.isnan(low) | np.isnan(high)] = NO_RANGE
+        return classes
+
+    def classify_named(self, params, values, genders):
+        """classify() for parameter names and gender strings; returns the class codes."""
+        return self.classify(self.encode_params(params), values, self.encode_genders(genders))
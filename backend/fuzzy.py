@@ -0,0 +1,139 @@
+import re
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text)
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance (adjacent swaps count once), or limit + 1 once it exceeds limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        best = i
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            d = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if cost and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                d = min(d, previous2[j - 2] + 1)
+            current[j] = d
+            best = min(best, d)
+        if best > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(word, depth):
+    """Every string left after removing up to `depth` characters from word (word included)."""
+    found = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))} - found
+        found |= frontier
+    return found
+
+
+class FuzzyAliasIndex:
+    """
+    Typo-tolerant lookup of aliases by whole words, for OCR misreadings such as "haemoglobln"
+    or "creatin1ne". Alias words of at least min_length characters go into a SymSpell-style
+    deletion dictionary: a token and a word within edit distance d share a string obtained by
+    deleting at most d characters from each, so a lookup costs a few dict probes instead of a
+    comparison with every word. Words shorter than long_length tolerate one edit, longer ones
+    two; shorter aliases ("k", "na", "hb") are never matched fuzzily.
+    Lookups are memoized, since report vocabulary repeats from one report to the next; a report
+    whose words are all known costs one regex pass and two set operations.
+    """
+
+    def __init__(self, aliases, min_length=5, long_length=8, cache_size=50000):
+        self.min_length = min_length
+        self.long_length = long_length
+        self.cache_size = cache_size
+        self.words = set()
+        self.sequences = {}  # first word -> [(alias words, alias)], most words first
+        for alias in aliases:
+            words = tuple(tokenize(alias))
+            if not words:
+                continue
+            self.words.update(words)
+            self.sequences.setdefault(words[0], []).append((words, alias))
+        for candidates in self.sequences.values():
+            candidates.sort(key=lambda c: -len(c[0]))
+        self._deletes = {}
+        for word in self.words:
+            if len(word) >= min_length:
+                for variant in _deletes(word, self.max_distance(word)):
+                    self._deletes.setdefault(variant, set()).add(word)
+        self._long_token_re = re.compile(f"[a-z0-9]{{{min_length},}}")
+        self._cache = {}  # token -> alias word or None
+        self._misread = set()  # tokens in the cache that have an alias word
+
+    def max_distance(self, token):
+        return 1 if len(token) < self.long_length else 2
+
+    def correct(self, token):
+        """The alias word a token is a misreading of, or None (no word close enough, or two equally close)."""
+        if token in self._cache:
+            return self._cache[token]
+        best = None
+        if len(token) >= self.min_length and token not in self.words:
+            limit = self.max_distance(token)
+            candidates = set()
+            for variant in _deletes(token, limit):
+                candidates |= self._deletes.get(variant, set())
+            best_distance = limit + 1
+            for word in candidates:
+                distance = edit_distance(token, word, min(limit, self.max_distance(word)))
+                if distance < best_distance:
+                    best, best_distance = word, distance
+                elif distance == best_distance:
+                    best = None if best is not None and best != word else best
+        if len(self._cache) >= self.cache_size:
+            self._cache.clear()
+            self._misread.clear()
+        self._cache[token] = best
+        if best is not None:
+            self._misread.add(token)
+        return best
+
+    def find_all(self, lines, text):
+        """[(line index, start, end, alias)] for find() over lowered lines; text is the lines joined by newlines."""
+        tokens = set(self._long_token_re.findall(text))
+        for token in tokens - self._cache.keys():
+            self.correct(token)
+        misread = tokens & self._misread
+        if not misread:
+            return []
+        found = []
+        for line_no, line in enumerate(lines):
+            if any(token in line for token in misread):
+                found.extend((line_no, start, end, alias) for start, end, alias in self.find(line))
+        return found
+
+    def find(self, line):
+        """
+        [(start, end, alias)] of aliases in a lowered line that only match once misread words are
+        corrected. Aliases match whole words; the longest alias starting at a word wins.
+        """
+        tokens = list(TOKEN_RE.finditer(line))
+        corrected = [self.correct(m.group()) for m in tokens]
+        if not any(corrected):
+            return []
+        words = [c or m.group() for c, m in zip(corrected, tokens)]
+        found = []
+        i = 0
+        while i < len(words):
+            for alias_words, alias in self.sequences.get(words[i], ()):
+                n = len(alias_words)
+                if tuple(words[i:i + n]) == alias_words and any(corrected[i:i + n]):
+                    found.append((tokens[i].start(), tokens[i + n - 1].end(), alias))
+                    i += n - 1
+                    break
+            i += 1
+        return found
@@ -0,0 +1,307 @@
+import sqlite3
+import threading
+import time
+
+OUT_OF_RANGE = ("low", "high")
+MAX_RETRY_DELAY = 60  # seconds between attempts once writes keep failing
+CLOSE_ATTEMPTS = 3  # writes tried on shutdown before queued reports are given up
+
+
+class HistoryStore:
+    """
+    Parsed results of every stored report, keyed by patient and report date, in a local SQLite file.
+
+    Writes are buffered in memory and inserted by a background thread, one transaction per
+    batch (every flush_interval seconds, or sooner once batch_size reports are waiting), so
+    add() never touches the disk. Reads use their own connection; in WAL mode they do not wait
+    for a batch being written. Results sit in a table clustered on (patient, param, date),
+    so a parameter's trend is one range scan, and a partial index holds only out-of-range values.
+    A batch that fails to write (e.g. "database is locked" while another process writes) goes
+    back to the front of the queue and is retried with exponential backoff; on_error, if given,
+    is called with each failure. Safe to share between threads.
+    """
+
+    def __init__(self, path, batch_size=500, flush_interval=1.0, on_error=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_error = on_error
+        self.written = 0
+        self.failures = 0
+        self._pending = []
+        self._wakeup = threading.Condition()
+        self._closing = False
+        self._thread = None
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS patients (id INTEGER PRIMARY KEY, key TEXT NOT NULL UNIQUE)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS reports ("
+            " id INTEGER PRIMARY KEY, patient INTEGER NOT NULL, report_date TEXT NOT NULL,"
+            " filename TEXT, gender TEXT, created_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS reports_by_patient ON reports(patient, report_date, id)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " patient INTEGER NOT NULL, param TEXT NOT NULL, report_date TEXT NOT NULL, report INTEGER NOT NULL,"
+            " value REAL NOT NULL, flag TEXT NOT NULL,"
+            " PRIMARY KEY (patient, param, report_date, report)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_by_report ON results(report)")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS results_out_of_range ON results(patient, report_date)"
+            " WHERE flag IN ('low', 'high')"
+        )
+        self._db.commit()
+        self._patients = {}
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+
+    # ---------------------------
+    # Writes
+    # ---------------------------
+
+    def start(self):
+        """Start the background writer."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+
+    def add(self, patient, report_date, results, filename=None, gender=None):
+        """
+        Queue one report for writing. results is [(param, value, flag)], flag one of
+        low / normal / high / no_range; report_date an ISO date (YYYY-MM-DD).
+        """
+        with self._wakeup:
+            self._pending.append((patient, report_date, filename, gender, time.time(), list(results)))
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.notify()
+
+    def pending(self):
+        with self._wakeup:
+            return len(self._pending)
+
+    def _run(self):
+        delay = self.flush_interval
+        attempts_left = CLOSE_ATTEMPTS
+        while True:
+            with self._wakeup:
+                if delay > self.flush_interval:
+                    # backing off after a failure: only shutdown cuts the wait short, not a full batch
+                    self._wakeup.wait_for(lambda: self._closing, delay)
+                elif not self._closing and len(self._pending) < self.batch_size:
+                    self._wakeup.wait(delay)
+                closing = self._closing
+            try:
+                self.flush()
+                delay = self.flush_interval
+            except sqlite3.Error as e:
+                self._failed(e)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                if closing:
+                    attempts_left -= 1
+                    if attempts_left > 0:
+                        time.sleep(min(delay, 1))
+                        continue
+                    print(f"History writer stopping, {self.pending()} queued report(s) not written")
+                else:
+                    print(f"History write failed, retrying in {delay:g}s:", e)
+            if closing:
+                return
+
+    def _failed(self, error):
+        self.failures += 1
+        if self.on_error is not None:
+            self.on_error(error)
+
+    def flush(self):
+        """
+        Write every queued report in one transaction. Returns how many reports were written.
+        On sqlite3.Error the reports are put back at the front of the queue and the error raised.
+        """
+        with self._wakeup:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        with self._write_lock:
+            try:
+                for patient, report_date, filename, gender, created_at, results in batch:
+                    patient_id = self._patient_id(patient)
+                    report_id = self._db.execute(
+                        "INSERT INTO reports (patient, report_date, filename, gender, created_at) VALUES (?, ?, ?, ?, ?)",
+                        (patient_id, report_date, filename, gender, created_at),
+                    ).lastrowid
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO results (patient, param, report_date, report, value, flag)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        [(patient_id, param, report_date, report_id, value, flag) for param, value, flag in results],
+                    )
+                self._db.commit()
+            except sqlite3.Error:
+                self._db.rollback()
+                self._patients.clear()  # ids inserted by the rolled back transaction are gone
+                with self._wakeup:
+                    self._pending[:0] = batch  # written first on the next attempt, in their original order
+                raise
+            self.written += len(batch)
+        return len(batch)
+
+    def _patient_id(self, patient):
+        patient_id = self._patients.get(patient)
+        if patient_id is None:
+            self._db.execute("INSERT OR IGNORE INTO patients (key) VALUES (?)", (patient,))
+            patient_id = self._db.execute("SELECT id FROM patients WHERE key = ?", (patient,)).fetchone()[0]
+            self._patients[patient] = patient_id
+        return patient_id
+
+    # ---------------------------
+    # Queries
+    # ---------------------------
+
+    def _query(self, sql, args):
+        with self._read_lock:
+            return self._reader.execute(sql, args).fetchall()
+
+    def _find_patient(self, patient):
+        row = self._query("SELECT id FROM patients WHERE key = ?", (patient,))
+        return row[0][0] if row else None
+
+    def trend(self, patient, param, since=None, until=None, limit=None):
+        """
+        [{report_id, report_date, value, flag}] of one parameter, oldest first (the latest `limit`
+        points when limit is given). None for an unknown patient.
+        """
+        patient_id = self._find_patient(patient)
+        if patient_id is None:
+            return None
+        sql = "SELECT report, report_date, value, flag FROM results WHERE patient = ? AND param = ?"
+        args = [patient_id, param]
+        sql, args = _date_range(sql, args, since, until)
+        sql += " ORDER BY report_date DESC, report DESC LIMIT ?"
+        args.append(limit if limit is not None else -1)
+        rows = self._query(sql, args)
+        rows.reverse()
+        return [{"report_id": r, "report_date": d, "value": v, "flag": f} for r, d, v, f in rows]
+
+    def out_of_range(self, patient, param=None, since=None, until=None, limit=100):
+        """[{report_id, report_date, param, value, flag}] flagged low or high, newest first. None for an unknown patient."""
+        patient_id = self._find_patient(patient)
+        if patient_id is None:
+            return None
+        # the flag condition must match the partial index's WHERE clause for SQLite to use it
+        sql = (
+            "SELECT report, report_date, param, value, flag FROM results INDEXED BY results_out_of_range"
+            " WHERE patient = ? AND flag IN ('low', 'high')"
+        )
+        args = [patient_id]
+        if param is not None:
+            sql += " AND param = ?"
+            args.append(param)
+        sql, args = _date_range(sql, args, since, until)
+        sql += " ORDER BY report_date DESC, report DESC LIMIT ?"
+        args.append(limit)
+        return [
+            {"report_id": r, "report_date": d, "param": p, "value": v, "flag": f}
+            for r, d, p, v, f in self._query(sql, args)
+        ]
+
+    def reports(self, patient, limit=100):
+        """[{report_id, report_date, filename, gender}] of a patient, newest first. None for an unknown patient."""
+        patient_id = self._find_patient(patient)
+        if patient_id is None:
+            return None
+        rows = self._query(
+            "SELECT id, report_date, filename, gender FROM reports WHERE patient = ?"
+            " ORDER BY report_date DESC, id DESC LIMIT ?",
+            (patient_id, limit),
+        )
+        return [{"report_id": r, "report_date": d, "filename": f, "gender": g} for r, d, f, g in rows]
+
+    def delta(self, patient, report_id=None):
+        """
+        Compare a report (the latest by default) with the patient's previous one: every parameter of
+        the report with its previous value and flag, and the change (None when it was not measured then).
+        None for an unknown patient or report.
+        """
+        patient_id = self._find_patient(patient)
+        if patient_id is None:
+            return None
+        if report_id is None:
+            current = self._query(
+                "SELECT id, report_date FROM reports WHERE patient = ? ORDER BY report_date DESC, id DESC LIMIT 1",
+                (patient_id,),
+            )
+        else:
+            current = self._query(
+                "SELECT id, report_date FROM reports WHERE patient = ? AND id = ?", (patient_id, report_id)
+            )
+        if not current:
+            return None
+        report_id, report_date = current[0]
+        previous = self._query(
+            "SELECT id, report_date FROM reports WHERE patient = ?"
+            " AND (report_date < ? OR (report_date = ? AND id < ?)) ORDER BY report_date DESC, id DESC LIMIT 1",
+            (patient_id, report_date, report_date, report_id),
+        )
+        before = {}
+        if previous:
+            before = {
+                param: (value, flag)
+                for param, value, flag in self._query(
+                    "SELECT param, value, flag FROM results WHERE report = ?", (previous[0][0],)
+                )
+            }
+        changes = []
+        for param, value, flag in self._query(
+            "SELECT param, value, flag FROM results WHERE report = ? ORDER BY param", (report_id,)
+        ):
+            old_value, old_flag = before.get(param, (None, None))
+            changes.append({
+                "param": param,
+                "value": value,
+                "flag": flag,
+                "previous_value": old_value,
+                "previous_flag": old_flag,
+                "change": round(value - old_value, 6) if old_value is not None else None,
+            })
+        return {
+            "report": {"report_id": report_id, "report_date": report_date},
+            "previous": {"report_id": previous[0][0], "report_date": previous[0][1]} if previous else None,
+            "changes": changes,
+        }
+
+    def stats(self):
+        with self._read_lock:
+            patients, reports = self._reader.execute(
+                "SELECT (SELECT COUNT(*) FROM patients), (SELECT COUNT(*) FROM reports)"
+            ).fetchone()
+        return {
+            "patients": patients, "reports": reports, "pending": self.pending(), "written": self.written,
+            "write_failures": self.failures,
+        }
+
+    def close(self):
+        """Stop the writer after it has written everything queued."""
+        with self._wakeup:
+            self._closing = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            self.flush()
+        with self._write_lock:
+            self._db.close()
+        with self._read_lock:
+            self._reader.close()
+
+
+def _date_range(sql, args, since, until):
+    if since is not None:
+        sql += " AND report_date >= ?"
+        args.append(since)
+    if until is not None:
+        sql += " AND report_date <= ?"
+        args.append(until)
+    return sql, args
@@ -0,0 +1,204 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobStore:
+    """
+    Persistent queue of report jobs: metadata and results in a local SQLite file,
+    uploaded bytes as one file per job in payload_dir until the job finishes.
+    Jobs are claimed highest priority first, then oldest first, in a single UPDATE, so several
+    processes can share the queue without claiming the same job. A claimed job carries this
+    store's owner id and a lease of lease_seconds, which the owner renews while it works on it;
+    recover() requeues only running jobs whose lease has run out. Safe to share between threads.
+    """
+
+    def __init__(self, path, payload_dir, lease_seconds=60):
+        self.path = path
+        self.payload_dir = payload_dir
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        os.makedirs(payload_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, priority INTEGER NOT NULL,"
+            " filename TEXT, digest TEXT NOT NULL, user_gender TEXT, callback_url TEXT,"
+            " created_at REAL NOT NULL, started_at REAL, finished_at REAL, attempts INTEGER NOT NULL DEFAULT 0,"
+            " result TEXT, error TEXT, callback_status TEXT, patient_id TEXT, report_date TEXT,"
+            " owner TEXT, lease_until REAL)"
+        )
+        # databases created before patient history and leases existed lack their columns
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("patient_id", "TEXT"), ("report_date", "TEXT"), ("owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs(status, priority DESC, created_at)")
+        self._db.commit()
+
+    def payload_path(self, job_id):
+        return os.path.join(self.payload_dir, job_id)
+
+    def submit(self, data, digest, filename, user_gender=None, priority=0, callback_url=None,
+               patient_id=None, report_date=None):
+        """Store the upload and queue a job for it. Returns the job id."""
+        job_id = uuid.uuid4().hex
+        with open(self.payload_path(job_id), "wb") as f:
+            f.write(data)
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, priority, filename, digest, user_gender, callback_url, created_at,"
+                " patient_id, report_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, priority, filename, digest, user_gender, callback_url, time.time(),
+                 patient_id, report_date),
+            )
+            self._db.commit()
+        return job_id
+
+    def claim(self):
+        """
+        Mark the next queued job as running, leased to this store, and return it (with its
+        payload bytes), or None. Picking and marking the job is one statement, so a job is
+        never claimed twice, even by another process sharing the database.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "UPDATE jobs SET status = ?, owner = ?, started_at = ?, lease_until = ?, attempts = attempts + 1"
+                " WHERE id = (SELECT id FROM jobs WHERE status = ? ORDER BY priority DESC, created_at LIMIT 1)"
+                " AND status = ?"
+                " RETURNING id, filename, digest, user_gender, callback_url, patient_id, report_date",
+                (RUNNING, self.owner, now, now + self.lease_seconds, QUEUED, QUEUED),
+            ).fetchone()
+            self._db.commit()
+        if row is None:
+            return None
+        job_id, filename, digest, user_gender, callback_url, patient_id, report_date = row
+        with open(self.payload_path(job_id), "rb") as f:
+            data = f.read()
+        return {
+            "id": job_id, "filename": filename, "digest": digest, "user_gender": user_gender,
+            "callback_url": callback_url, "patient_id": patient_id, "report_date": report_date, "data": data,
+        }
+
+    def renew(self, job_id):
+        """Extend the lease of a job this store is running. Returns False when it is no longer ours."""
+        with self._lock:
+            count = self._db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = ? AND owner = ?",
+                (time.time() + self.lease_seconds, job_id, RUNNING, self.owner),
+            ).rowcount
+            self._db.commit()
+        return count > 0
+
+    def requeue(self, job_id):
+        """Put a job this store claimed back in the queue (e.g. the OCR pool was busy)."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, started_at = NULL, lease_until = NULL"
+                " WHERE id = ? AND status = ? AND owner = ?",
+                (QUEUED, job_id, RUNNING, self.owner),
+            )
+            self._db.commit()
+
+    def release(self):
+        """Requeue every job this store is still running (on shutdown). Returns how many were requeued."""
+        with self._lock:
+            count = self._db.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, started_at = NULL, lease_until = NULL"
+                " WHERE status = ? AND owner = ?",
+                (QUEUED, RUNNING, self.owner),
+            ).rowcount
+            self._db.commit()
+        return count
+
+    def recover(self):
+        """
+        Requeue running jobs whose lease has expired: their process died or stopped renewing.
+        Jobs other processes are still working on are left alone. Returns how many were requeued.
+        """
+        with self._lock:
+            count = self._db.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, started_at = NULL, lease_until = NULL"
+                " WHERE status = ? AND (lease_until IS NULL OR lease_until < ?)",
+                (QUEUED, RUNNING, time.time()),
+            ).rowcount
+            self._db.commit()
+        return count
+
+    def finish(self, job_id, result=None, error=None):
+        """
+        Record the result (or error) of a job this store is running and drop its payload.
+        Returns False, recording nothing, when the job is no longer ours (its lease expired
+        and it was requeued), so its outcome and callback come from whoever runs it now.
+        """
+        with self._lock:
+            count = self._db.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ?, lease_until = NULL"
+                " WHERE id = ? AND status = ? AND owner = ?",
+                (FAILED if error else DONE, time.time(), json.dumps(result) if result is not None else None, error,
+                 job_id, RUNNING, self.owner),
+            ).rowcount
+            self._db.commit()
+        if not count:
+            return False
+        try:
+            os.remove(self.payload_path(job_id))
+        except FileNotFoundError:
+            pass
+        return True
+
+    def set_callback_status(self, job_id, status):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET callback_status = ? WHERE id = ?", (status, job_id))
+            self._db.commit()
+
+    def get(self, job_id):
+        """Status of a job as a dict (result included once done), or None for unknown ids."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, status, priority, filename, created_at, started_at, finished_at, attempts,"
+                " result, error, callback_url, callback_status FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            position = None
+            if row[1] == QUEUED:
+                position = self._db.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND (priority > ? OR (priority = ? AND created_at < ?))",
+                    (QUEUED, row[2], row[2], row[4]),
+                ).fetchone()[0]
+        job = dict(zip(
+            ("id", "status", "priority", "filename", "created_at", "started_at", "finished_at", "attempts",
+             "result", "error", "callback_url", "callback_status"),
+            row,
+        ))
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        if position is not None:
+            job["queue_position"] = position
+        return job
+
+    def count(self, status):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def purge(self, older_than):
+        """Delete finished jobs that completed before the given timestamp. Returns how many were deleted."""
+        with self._lock:
+            count = self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (DONE, FAILED, older_than)
+            ).rowcount
+            self._db.commit()
+        return count
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,141 @@
+import re
+from collections import namedtuple
+
+# ---------------------------
+# OCR word boxes (Tesseract image_to_data TSV)
+# ---------------------------
+
+Word = namedtuple("Word", "text left top width height")
+
+TSV_COLUMNS = ("level", "page_num", "block_num", "par_num", "line_num", "word_num",
+               "left", "top", "width", "height", "conf", "text")
+TSV_HEADER = "\t".join(TSV_COLUMNS)
+WORD_LEVEL = "5"
+
+def is_tsv(payload):
+    return payload.lstrip("\f").startswith("level\tpage_num\t")
+
+def parse_tsv(tsv):
+    """
+    Split Tesseract TSV into (plain text, [Word]). The text follows Tesseract's own layout:
+    words of a line joined by spaces, a blank line between paragraphs.
+    """
+    words = []
+    lines = []
+    line_words = []
+    line_key = par_key = None
+    for row in tsv.split("\n")[1:]:
+        if not row.startswith(WORD_LEVEL):
+            continue
+        cols = row.split("\t", 11)
+        if len(cols) < 12 or cols[0] != WORD_LEVEL:
+            continue
+        text = cols[11].strip()
+        if not text:
+            continue
+        key = (cols[1], cols[2], cols[3], cols[4])
+        if key != line_key:
+            if line_words:
+                lines.append(" ".join(line_words))
+            if par_key is not None and key[:3] != par_key:
+                lines.append("")
+            line_words = []
+            line_key, par_key = key, key[:3]
+        line_words.append(text)
+        words.append(Word(text, int(cols[6]), int(cols[7]), int(cols[8]), int(cols[9])))
+    if line_words:
+        lines.append(" ".join(line_words))
+    return "\n".join(lines), words
+
+def words_to_tsv(lines):
+    """TSV in Tesseract's format for lines of Words, all in one block as with --psm 6; used to build fixtures."""
+    out = [TSV_HEADER]
+    for line_num, line in enumerate(lines, 1):
+        for word_num, w in enumerate(line, 1):
+            out.append(f"{WORD_LEVEL}\t1\t1\t1\t{line_num}\t{word_num}\t{w.left}\t{w.top}\t{w.width}\t{w.height}\t95\t{w.text}")
+    return "\n".join(out) + "\n"
+
+# ---------------------------
+# Rows and columns
+# ---------------------------
+
+def group_rows(words, tolerance=0.5):
+    """
+    Cluster words into visual rows: a word joins the current row when its vertical centre is
+    within `tolerance` x the median word height of the row's centre. Words in different
+    Tesseract blocks (table columns) end up in the same row. Rows are top to bottom, words left to right.
+    """
+    if not words:
+        return []
+    heights = sorted(w.height for w in words)
+    limit = max(1.0, heights[len(heights) // 2] * tolerance)
+    rows = []
+    centre = None
+    for w in sorted(words, key=lambda w: w.top + w.height / 2):
+        c = w.top + w.height / 2
+        if rows and c - centre <= limit:
+            row = rows[-1]
+            row.append(w)
+            centre += (c - centre) / len(row)
+        else:
+            rows.append([w])
+            centre = c
+    return [sorted(row, key=lambda w: w.left) for row in rows]
+
+# tokens that are part of a reference range or a unit rather than a result: "4.0-6.0", "<5.7", "(13.8", "10^3/uL"
+NOT_RESULT_RE = re.compile(r"\d\s*[-–—]\s*\.?\d|^[<>≤≥(]|[/^]")
+RANGE_DASHES = ("-", "–", "—")
+
+DIGIT_RE = re.compile(r"\d")
+
+def has_digit(text):
+    return DIGIT_RE.search(text) is not None
+
+def is_range_word(text):
+    """A word joining the two ends of a range: "-", "--", "–", "to"."""
+    return text == "to" or (text != "" and not text.strip("".join(RANGE_DASHES)))
+
+def in_range(row, k, start):
+    """Whether row[k] is one end of a range split over several words ("13.8 - 17.2", "13.8- 17.2", "13.8 -17.2")."""
+    before = row[k - 1].text if k > start else ""
+    after = row[k + 1].text if k + 1 < len(row) else ""
+    text = row[k].text
+    return (
+        text.endswith(RANGE_DASHES) or (text.startswith(RANGE_DASHES) and has_digit(before))
+        or is_range_word(after) or (after.startswith(RANGE_DASHES) and has_digit(after))
+        or is_range_word(before) or before.endswith(RANGE_DASHES)
+    )
+
+def numeric_cells(row, start, end, to_number):
+    """[(word, value)] for the words row[start:end] that can hold a result."""
+    cells = []
+    for k in range(start, end):
+        text = row[k].text
+        if not has_digit(text) or NOT_RESULT_RE.search(text) or in_range(row, k, start):
+            continue
+        value = to_number(text)
+        if value is not None:
+            cells.append((row[k], value))
+    return cells
+
+def result_column(first_cells):
+    """
+    (centre, tolerance) of the result column: the median centre of the first number after each
+    alias, so a row's unit, flag or range columns are not mistaken for its result.
+    Returns None without enough rows to tell.
+    """
+    if len(first_cells) < 2:
+        return None
+    centres = sorted(w.left + w.width / 2 for w in first_cells)
+    widths = sorted(w.width for w in first_cells)
+    heights = sorted(w.height for w in first_cells)
+    return centres[len(centres) // 2], max(widths[len(widths) // 2], heights[len(heights) // 2] * 3)
+
+def pick_cell(cells, column):
+    """The cell in the result column, else the first number after the alias."""
+    if column is not None:
+        centre, tolerance = column
+        best = min(cells, key=lambda cell: abs(cell[0].left + cell[0].width / 2 - centre))
+        if abs(best[0].left + best[0].width / 2 - centre) <= tolerance:
+            return best
+    return cells[0]
@@ -1,13 +1,342 @@
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks, Request, Response, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
-import shutil
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import hashlib
+import hmac
+import http.client
+import io
+import ipaddress
+import json
+import math
 import os
-from datetime import datetime
-from PIL import Image
-import pytesseract
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from datetime import date
+from PIL import Image, ImageDraw, UnidentifiedImageError
 import re
+import shlex
+import shutil
+import socket
+import sqlite3
+import string
+import tempfile
+import time
+import urllib.request
+import zipfile
+from urllib.parse import urlsplit
+from typing import List
+from bisect import bisect_right, insort
+from collections import deque, namedtuple
+from ocr_cache import OCRCache, cache_key
+from jobs import JobStore, QUEUED
+from history import HistoryStore
+from storage import UploadStore
+from admission import AdmissionController, AdmissionRejected, ByteBudget, RateLimiter
+import ocr_engine
+from ocr_engine import OCRTimeout, create_engine
+from preprocess import preprocess, split_bands
+from classify import CLASS_LABELS, gender_id
+from catalog import HEADER_RE, CatalogError, load_catalog
+from layout import DIGIT_RE, group_rows, is_tsv, numeric_cells, parse_tsv, pick_cell, result_column
+import metrics
+from metrics import record_stage, timed_stage
+from pydantic import BaseModel
+from typing import Optional
+
+@asynccontextmanager
+async def lifespan(app):
+    """Start background services with the app and stop them on shutdown."""
+    warmer = asyncio.create_task(warm_up())
+    job_tasks = await start_job_workers()
+    if history_store is not None:
+        history_store.start()
+        if not HISTORY_API_TOKEN:
+            print("PATIENT_HISTORY=1 without HISTORY_API_TOKEN: results are stored but /patients answers 403")
+    watcher = asyncio.create_task(watch_catalog()) if CATALOG_RELOAD_INTERVAL > 0 else None
+    sweeper = asyncio.create_task(sweep_uploads()) if upload_store is not None and UPLOAD_SWEEP_INTERVAL > 0 else None
+    yield
+    set_ready(False)  # stop taking traffic while shutting down
+    for task in (warmer, watcher, sweeper):
+        if task is not None:
+            task.cancel()
+    await stop_job_workers(job_tasks)
+    shutdown_ocr_pool()
+    if ocr_cache is not None:
+        ocr_cache.close()
+    if job_store is not None:
+        job_store.close()
+    if history_store is not None:
+        history_store.close()
+    if upload_store is not None:
+        if sweeper is not None:
+            await asyncio.gather(sweeper, return_exceptions=True)
+        upload_store.close()
+
+app = FastAPI(lifespan=lifespan)
 
-app = FastAPI()
+# Tesseract binary: TESSERACT_CMD, else `tesseract` on PATH, else a default Windows install location.
+# Language data is looked up by Tesseract itself (TESSDATA_PREFIX overrides its default directory).
+TESSERACT_CMD = os.environ.get("TESSERACT_CMD", "")
+TESSERACT_WINDOWS_PATHS = (
+    r"C:\Program Files\Tesseract-OCR\tesseract.exe",
+    r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
+    r"D:\Tesseract-OCR\tesseract.exe",
+)
+
+def find_tesseract():
+    """Path of the Tesseract binary to run, or None when it cannot be found."""
+    if TESSERACT_CMD:
+        return TESSERACT_CMD
+    found = shutil.which("tesseract")
+    if found:
+        return found
+    if os.name == "nt":
+        return next((path for path in TESSERACT_WINDOWS_PATHS if os.path.isfile(path)), None)
+    return None
+
+# set before the OCR workers are forked, so they inherit it
+ocr_engine.tesseract_cmd = find_tesseract() or "tesseract"
+
+TESSDATA_DIRS = (
+    "/usr/share/tesseract-ocr/5/tessdata",
+    "/usr/share/tesseract-ocr/4.00/tessdata",
+    "/usr/share/tessdata",
+    "/usr/local/share/tessdata",
+    "/opt/homebrew/share/tessdata",
+)
+
+def find_tessdata():
+    """
+    Language data directory for the in-process OCR engine: TESSDATA_PREFIX, else the one
+    installed with the tesseract binary, else a usual location; None leaves it to the library.
+    """
+    if os.environ.get("TESSDATA_PREFIX"):
+        return os.environ["TESSDATA_PREFIX"]
+    candidates = []
+    cmd = shutil.which(ocr_engine.tesseract_cmd)
+    if cmd:
+        bin_dir = os.path.dirname(os.path.realpath(cmd))
+        candidates += [os.path.join(bin_dir, "tessdata"), os.path.join(os.path.dirname(bin_dir), "share", "tessdata")]
+    return next((d for d in candidates + list(TESSDATA_DIRS) if os.path.isdir(d)), None)
+
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "uploads")
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+# OCR pool sizing (override via environment)
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1))
+OCR_MAX_QUEUE = int(os.environ.get("OCR_MAX_QUEUE", OCR_WORKERS * 2))  # jobs allowed to wait for a worker
+OCR_TIMEOUT = float(os.environ.get("OCR_TIMEOUT", 60))  # seconds per OCR job
+OCR_RETRY_AFTER = int(os.environ.get("OCR_RETRY_AFTER", 5))  # seconds hinted to clients when saturated
+
+# Admission control for uploads: a token bucket per client, at most ADMISSION_CONCURRENCY uploads
+# processed at once and ADMISSION_MAX_WAITING waiting; a waiting upload that could not finish
+# within its deadline is turned away early with a Retry-After hint. The body is received before
+# an upload queues for a slot, so slow senders do not hold slots; UPLOAD_READ_TIMEOUT bounds it.
+CLIENT_RATE = float(os.environ.get("CLIENT_RATE", 0))  # requests per second per client on average; 0 disables
+CLIENT_BURST = int(os.environ.get("CLIENT_BURST", 20))  # requests a client may send at once
+CLIENT_ID_HEADER = os.environ.get("CLIENT_ID_HEADER", "").lower()  # e.g. x-api-key; default: the client address
+# proxies (addresses or CIDR ranges) whose X-Forwarded-For is believed when telling clients apart
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(p.strip(), strict=False) for p in os.environ.get("TRUSTED_PROXIES", "").split(",") if p.strip()
+]
+UPLOAD_READ_TIMEOUT = float(os.environ.get("UPLOAD_READ_TIMEOUT", 30))  # seconds to receive an upload body; 0: no limit
+ADMISSION_CONCURRENCY = int(os.environ.get("ADMISSION_CONCURRENCY", OCR_WORKERS))  # 0 disables the cap and queue
+ADMISSION_MAX_WAITING = int(os.environ.get("ADMISSION_MAX_WAITING", 2 * ADMISSION_CONCURRENCY))
+ADMISSION_DEADLINE = float(os.environ.get("ADMISSION_DEADLINE", OCR_TIMEOUT))  # seconds; X-Request-Timeout may lower it
+ADMISSION_PATHS = ("/upload", "/upload/batch", "/upload/stream")  # held to the concurrency cap
+RATE_LIMITED_PATHS = ADMISSION_PATHS + ("/jobs",)
+rate_limiter = RateLimiter(CLIENT_RATE, CLIENT_BURST) if CLIENT_RATE > 0 else None
+admission = AdmissionController(ADMISSION_CONCURRENCY, ADMISSION_MAX_WAITING) if ADMISSION_CONCURRENCY > 0 else None
+if rate_limiter is not None:
+    metrics.RATE_LIMITED_CLIENTS.set_function(lambda: len(rate_limiter))
+if admission is not None:
+    metrics.ADMISSION_LIMIT.set(admission.limit)
+    metrics.ADMISSION_ACTIVE.set_function(lambda: admission.active)
+    metrics.ADMISSION_WAITING.set_function(lambda: admission.waiting)
+    metrics.ADMISSION_SERVICE_SECONDS.set_function(lambda: admission.service_time)
+
+def is_trusted_proxy(address):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+def client_id(scope):
+    """
+    Key of the client's token bucket: the CLIENT_ID_HEADER value if set, else the client address.
+    Behind TRUSTED_PROXIES that is the rightmost X-Forwarded-For entry not added by one of them
+    (entries further left are whatever the client chose to send).
+    """
+    if CLIENT_ID_HEADER:
+        for name, value in scope["headers"]:
+            if name.decode("latin-1") == CLIENT_ID_HEADER:
+                return value.decode("latin-1")
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    if TRUSTED_PROXIES and is_trusted_proxy(address):
+        forwarded = ",".join(value.decode("latin-1") for name, value in scope["headers"] if name == b"x-forwarded-for")
+        for hop in reversed([h.strip() for h in forwarded.split(",") if h.strip()]):
+            address = hop
+            if not is_trusted_proxy(hop):
+                break
+    return address
+
+def request_deadline(scope, now):
+    """time.monotonic() deadline of a request: ADMISSION_DEADLINE, or sooner if the client sent X-Request-Timeout."""
+    timeout = ADMISSION_DEADLINE
+    for name, value in scope["headers"]:
+        if name == b"x-request-timeout":
+            try:
+                timeout = min(timeout, float(value))
+            except ValueError:
+                pass
+    return now + timeout
+
+def rejection(reason, retry_after):
+    if reason == "rate_limited":
+        status, detail = 429, "Too many requests from this client, please slow down."
+    elif reason == "buffer_full":
+        status, detail = 503, "The server is receiving too many uploads at once, please retry later."
+    elif reason == "deadline":
+        status, detail = 503, "The server cannot process this upload within its deadline, please retry later."
+    else:
+        status, detail = 503, "Too many uploads are waiting, please retry later."
+    return JSONResponse({"detail": detail}, status_code=status, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+class BodyTooLarge(Exception):
+    """A request body passed the limit of its endpoint while it was being received."""
+
+def body_limit(path):
+    """(most bytes a request body may have, 413 detail) for an upload endpoint."""
+    if path == "/upload/batch":
+        return MAX_BATCH_BYTES, f"Batch exceeds {MAX_BATCH_BYTES} bytes."
+    return MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD_BYTES, f"Upload exceeds {MAX_UPLOAD_BYTES} bytes."
+
+def content_length(scope):
+    """The Content-Length a request declared, or None (chunked or invalid)."""
+    for name, value in scope["headers"]:
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+async def receive_body(receive, limit, pending):
+    """
+    Receive a whole request body into pending, a deque of its http.request messages, each one's
+    bytes reserved in upload_buffer. Returns False if the client went away. Raises BodyTooLarge
+    as soon as more than limit bytes have arrived, and AdmissionRejected (buffer_full) when
+    MAX_BUFFERED_BYTES are already held; the rest is never read. The caller frees what is left
+    in pending with release_body.
+    """
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return False
+        chunk = len(message.get("body", b""))
+        size += chunk
+        if size > limit:
+            raise BodyTooLarge()
+        if not upload_buffer.reserve(chunk):
+            raise AdmissionRejected("buffer_full", OCR_RETRY_AFTER)
+        pending.append(message)
+        if not message.get("more_body", False):
+            return True
+
+def release_body(pending):
+    """Drop the messages left in pending, giving their bytes back to upload_buffer."""
+    while pending:
+        upload_buffer.release(len(pending.popleft().get("body", b"")))
+
+def replay_body(pending, receive):
+    """
+    An ASGI receive handing out the messages receive_body put in pending, then deferring to
+    receive (disconnects). Each message leaves pending, and upload_buffer, as it is handed out,
+    so the app's copy is the only one left.
+    """
+    async def replay():
+        if pending:
+            message = pending.popleft()
+            upload_buffer.release(len(message.get("body", b"")))
+            return message
+        return await receive()
+    return replay
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying rate limits and admission control to POSTs on the upload endpoints,
+    and capping their body size: a request whose Content-Length is over the limit is refused
+    before any of its body is read, and a body that grows past it is cut off as it arrives.
+    The whole body is received (within UPLOAD_READ_TIMEOUT) before the upload queues for a slot,
+    so slow senders neither hold slots nor count towards the service time admission control
+    measures; bodies held this way share MAX_BUFFERED_BYTES, past which uploads get a 503. The slot is held until the response is fully sent, so a streamed upload keeps it
+    while its events are still being produced.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in RATE_LIMITED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        arrived = time.monotonic()
+        if rate_limiter is not None:
+            wait = rate_limiter.acquire(client_id(scope))
+            if wait:
+                metrics.ADMISSION_REJECTED.labels("rate_limited").inc()
+                await rejection("rate_limited", wait)(scope, receive, send)
+                return
+        limit, too_large = body_limit(scope["path"])
+        declared = content_length(scope)
+        if declared is not None and declared > limit:
+            await JSONResponse({"detail": too_large}, status_code=413)(scope, receive, send)
+            return
+        pending = deque()
+        try:
+            try:
+                complete = await asyncio.wait_for(receive_body(receive, limit, pending), UPLOAD_READ_TIMEOUT or None)
+            except BodyTooLarge:
+                await JSONResponse({"detail": too_large}, status_code=413)(scope, receive, send)
+                return
+            except AdmissionRejected as e:
+                metrics.ADMISSION_REJECTED.labels(e.reason).inc()
+                await rejection(e.reason, e.retry_after)(scope, receive, send)
+                return
+            except asyncio.TimeoutError:
+                metrics.ADMISSION_REJECTED.labels("read_timeout").inc()
+                await JSONResponse({"detail": "The upload body was not received in time."}, status_code=408)(scope, receive, send)
+                return
+            if not complete:
+                return  # the client went away
+            admitted = None
+            if admission is not None and scope["path"] in ADMISSION_PATHS:
+                received = time.monotonic()
+                try:
+                    await admission.acquire(request_deadline(scope, arrived))
+                except AdmissionRejected as e:
+                    metrics.ADMISSION_REJECTED.labels(e.reason).inc()
+                    await rejection(e.reason, e.retry_after)(scope, receive, send)
+                    return
+                admitted = time.monotonic()
+                metrics.ADMISSION_WAIT_SECONDS.observe(admitted - received)
+            try:
+                await self.app(scope, replay_body(pending, receive), send)
+            finally:
+                if admitted is not None:
+                    admission.release(time.monotonic() - admitted)
+        finally:
+            release_body(pending)
+
+# admission control runs inside CORS, so its rejections carry CORS headers too
+app.add_middleware(AdmissionMiddleware)
 
 # CORS (allow your frontend)
 app.add_middleware(
@@ -18,579 +347,1833 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Path to your tesseract.exe (update if different)
-pytesseract.pytesseract.tesseract_cmd = r"D:\Tesseract-OCR\tesseract.exe"
 
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Upload ingestion limits
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024  # multipart framing and the other form fields of a one-file upload
+MAX_BATCH_BYTES = int(os.environ.get("MAX_BATCH_BYTES", 10 * MAX_UPLOAD_BYTES))  # whole /upload/batch body
+# upload bodies held in memory at once while they are received and wait for admission
+MAX_BUFFERED_BYTES = int(os.environ.get("MAX_BUFFERED_BYTES", 2 * MAX_BATCH_BYTES))
+upload_buffer = ByteBudget(MAX_BUFFERED_BYTES)
+metrics.UPLOAD_BUFFERED_BYTES.set_function(lambda: upload_buffer.used)
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", 50_000_000))
+UPLOAD_CHUNK_BYTES = 256 * 1024
+UPLOAD_HEADER_PROBE_BYTES = 1024 * 1024  # look for the image header within this prefix while reading
+MAX_BATCH_PAGES = int(os.environ.get("MAX_BATCH_PAGES", 50))  # pages per /upload/batch request
+# keep a copy of every upload (written after the response is sent) in a content-addressed store:
+# identical files are kept once, under UPLOAD_STORE_DIR/ab/cd/<sha256>.<ext>
+PERSIST_UPLOADS = os.environ.get("PERSIST_UPLOADS", "1") == "1"
+UPLOAD_STORE_DIR = os.environ.get("UPLOAD_STORE_DIR", os.path.join(UPLOAD_DIR, "store"))
+UPLOAD_STORE_INDEX = os.environ.get("UPLOAD_STORE_INDEX", os.path.join(UPLOAD_DIR, "store.sqlite3"))
+UPLOAD_RETENTION_DAYS = float(os.environ.get("UPLOAD_RETENTION_DAYS", 0))  # since last uploaded; 0 keeps them
+UPLOAD_STORE_MAX_BYTES = int(os.environ.get("UPLOAD_STORE_MAX_BYTES", 0))  # least recently uploaded go first; 0: no limit
+UPLOAD_RECOMPRESS = os.environ.get("UPLOAD_RECOMPRESS", "").lower() or None  # "png" or "webp" for stored lossless images
+UPLOAD_WEBP_QUALITY = int(os.environ.get("UPLOAD_WEBP_QUALITY", 100))  # 100: lossless; lower replaces uploads lossily
+UPLOAD_SWEEP_INTERVAL = float(os.environ.get("UPLOAD_SWEEP_INTERVAL", 300))  # seconds between cleanup passes; 0 disables
+upload_store = UploadStore(
+    UPLOAD_STORE_DIR, UPLOAD_STORE_INDEX, UPLOAD_RETENTION_DAYS, UPLOAD_STORE_MAX_BYTES, UPLOAD_RECOMPRESS, UPLOAD_WEBP_QUALITY
+) if PERSIST_UPLOADS else None
+if upload_store is not None:
+    metrics.UPLOAD_STORE_BYTES.set_function(lambda: upload_store.size)
+# /upload/stream cuts an image into this many bands, so text and parameters arrive while OCR is still running
+STREAM_BANDS = int(os.environ.get("STREAM_BANDS", 4))
 
-# ---------------------------
-# Medical info (descriptions + advice)
-# ---------------------------
-medical_info = {
-    # CBC
-    "Hemoglobin": {
-        "normal_range": "13.8-17.2 g/dL (men), 12.1-15.1 g/dL (women)",
-        "description": "Hemoglobin carries oxygen in your blood.",
-        "low_meaning": "Low hemoglobin can cause fatigue and anemia.",
-        "high_meaning": "High hemoglobin might indicate dehydration or other conditions.",
-        "advice": "Eat iron-rich foods (spinach, lentils, red meat) and consult a doctor if low."
-    },
-    "Hematocrit": {
-        "normal_range": "40.7%-50.3% (men), 36.1%-44.3% (women)",
-        "description": "Hematocrit measures the proportion of red blood cells in the blood.",
-        "low_meaning": "Low hematocrit can indicate anemia.",
-        "high_meaning": "High hematocrit may indicate dehydration or polycythemia.",
-        "advice": "Stay hydrated and consult a doctor for abnormal results."
-    },
-    "RBC": {
-        "normal_range": "4.7-6.1 million/mcL (men), 4.2-5.4 million/mcL (women)",
-        "description": "Red blood cells carry oxygen from lungs to body tissues.",
-        "low_meaning": "Low RBC may cause anemia and fatigue.",
-        "high_meaning": "High RBC may indicate dehydration or lung/heart disease.",
-        "advice": "Follow medical advice; maintain nutrition and hydration."
-    },
-    "WBC": {
-        "normal_range": "4,000-11,000 cells/µL",
-        "description": "White blood cells fight infection.",
-        "low_meaning": "Low WBC may increase infection risk.",
-        "high_meaning": "High WBC may indicate infection or inflammation.",
-        "advice": "Consult a doctor if abnormal."
-    },
-    "Neutrophils": {
-        "normal_range": "40-60 % (of WBC)",
-        "description": "Neutrophils fight bacterial infections.",
-        "low_meaning": "Low neutrophils increase infection risk.",
-        "high_meaning": "High neutrophils often indicate bacterial infection.",
-        "advice": "Seek medical advice if abnormal."
-    },
-    "Lymphocytes": {
-        "normal_range": "20-40 % (of WBC)",
-        "description": "Lymphocytes fight viral infections.",
-        "low_meaning": "Low lymphocytes may weaken immune defense.",
-        "high_meaning": "High lymphocytes may indicate viral infection or chronic conditions.",
-        "advice": "Monitor symptoms and consult a doctor if needed."
-    },
-    "Monocytes": {
-        "normal_range": "2-8 % (of WBC)",
-        "description": "Monocytes clean up debris and help fight infections.",
-        "low_meaning": "Low monocytes may indicate bone marrow problems.",
-        "high_meaning": "High monocytes may indicate infection or inflammation.",
-        "advice": "Consult healthcare provider."
-    },
-    "Eosinophils": {
-        "normal_range": "1-4 % (of WBC)",
-        "description": "Eosinophils are involved in allergies and parasitic infections.",
-        "low_meaning": "Low eosinophils usually not a concern.",
-        "high_meaning": "High eosinophils can indicate allergies or parasites.",
-        "advice": "Discuss allergy testing or treatment with your doctor."
-    },
-    "Basophils": {
-        "normal_range": "0.5-1 % (of WBC)",
-        "description": "Basophils play a role in allergic responses.",
-        "low_meaning": "Low basophils usually not clinically important.",
-        "high_meaning": "High basophils may suggest allergies or inflammation.",
-        "advice": "Talk to your healthcare provider for context."
-    },
-    "Platelets": {
-        "normal_range": "150,000-450,000 /µL",
-        "description": "Platelets help with blood clotting.",
-        "low_meaning": "Low platelets increase bleeding/bruising risk.",
-        "high_meaning": "High platelets may raise clotting risk.",
-        "advice": "Avoid injury and consult a doctor if abnormal."
-    },
-    "MPV": {
-        "normal_range": "7.5-11.5 fL",
-        "description": "Mean platelet volume indicates average platelet size.",
-        "low_meaning": "Low MPV may indicate production problems.",
-        "high_meaning": "High MPV may indicate increased platelet production.",
-        "advice": "Discuss with your clinician."
-    },
-
-    # Lipid profile
-    "Cholesterol (Total)": {
-        "normal_range": "<200 mg/dL",
-        "description": "Total cholesterol is all cholesterol types combined.",
-        "low_meaning": "Low total cholesterol not usually concerning.",
-        "high_meaning": "High total cholesterol increases heart disease risk.",
-        "advice": "Reduce saturated fat and exercise."
-    },
-    "HDL Cholesterol": {
-        "normal_range": ">=40 mg/dL (men), >=50 mg/dL (women)",
-        "description": "HDL is 'good' cholesterol.",
-        "low_meaning": "Low HDL increases cardiovascular risk.",
-        "high_meaning": "High HDL is usually protective.",
-        "advice": "Exercise and healthy fat intake help increase HDL."
-    },
-    "LDL Cholesterol": {
-        "normal_range": "<100 mg/dL (optimal)",
-        "description": "LDL is 'bad' cholesterol that can clog arteries.",
-        "low_meaning": "Low LDL typically fine.",
-        "high_meaning": "High LDL increases heart disease risk.",
-        "advice": "Lifestyle changes and medication if recommended."
-    },
-    "Triglycerides": {
-        "normal_range": "<150 mg/dL",
-        "description": "Triglycerides are fats stored for energy.",
-        "low_meaning": "Low triglycerides usually not a concern.",
-        "high_meaning": "High triglycerides increase heart disease risk.",
-        "advice": "Reduce sugar, alcohol; maintain healthy weight."
-    },
-
-    # Kidney function
-    "Blood Urea Nitrogen (BUN)": {
-        "normal_range": "7-20 mg/dL",
-        "description": "BUN is a kidney function marker.",
-        "low_meaning": "Low BUN may indicate liver issues.",
-        "high_meaning": "High BUN may suggest kidney dysfunction or dehydration.",
-        "advice": "Stay hydrated and consult doctor if high."
-    },
-    "Creatinine": {
-        "normal_range": "0.6-1.3 mg/dL",
-        "description": "Creatinine reflects kidney performance.",
-        "low_meaning": "Low creatinine usually not concerning.",
-        "high_meaning": "High creatinine suggests reduced kidney function.",
-        "advice": "Consult a doctor for elevated values."
-    },
-    "Uric Acid": {
-        "normal_range": "3.5-7.2 mg/dL",
-        "description": "Uric acid is a waste product from purine metabolism.",
-        "low_meaning": "Low values usually not concerning.",
-        "high_meaning": "High levels may cause gout.",
-        "advice": "Limit purine-rich foods if high; consult physician."
-    },
-
-    # Electrolytes
-    "Sodium": {
-        "normal_range": "135-145 mmol/L",
-        "description": "Sodium helps control water balance and nerve function.",
-        "low_meaning": "Low sodium (hyponatremia) can cause confusion and seizures.",
-        "high_meaning": "High sodium suggests dehydration.",
-        "advice": "Correct fluid balance under medical advice."
-    },
-    "Potassium": {
-        "normal_range": "3.5-5.0 mmol/L",
-        "description": "Potassium is vital for heart and muscle function.",
-        "low_meaning": "Low potassium can cause weakness or irregular heartbeat.",
-        "high_meaning": "High potassium can endanger heart rhythm.",
-        "advice": "Follow medical guidance; dietary changes may help."
-    },
-    "Chloride": {
-        "normal_range": "96-106 mmol/L",
-        "description": "Chloride helps maintain acid-base balance.",
-        "low_meaning": "Low chloride can occur with vomiting or dehydration.",
-        "high_meaning": "High chloride may indicate kidney/adrenal issues.",
-        "advice": "Consult your clinician for abnormal values."
-    },
-
-    # Liver function
-    "ALT (SGPT)": {
-        "normal_range": "7-56 U/L",
-        "description": "ALT is a liver enzyme; elevated levels may indicate liver damage.",
-        "low_meaning": "Low levels are normal.",
-        "high_meaning": "High ALT suggests liver injury or inflammation.",
-        "advice": "Avoid alcohol and discuss further evaluation."
-    },
-    "AST (SGOT)": {
-        "normal_range": "10-40 U/L",
-        "description": "AST is a liver/muscle enzyme.",
-        "low_meaning": "Low levels are normal.",
-        "high_meaning": "High AST can indicate liver or muscle damage.",
-        "advice": "Follow up with healthcare provider."
-    },
-    "Alkaline Phosphatase (ALP)": {
-        "normal_range": "44-147 IU/L",
-        "description": "ALP relates to liver and bone health.",
-        "low_meaning": "Low ALP usually not concerning.",
-        "high_meaning": "High ALP may indicate liver/bone disease.",
-        "advice": "Consult a doctor when elevated."
-    },
-    "Bilirubin (Total)": {
-        "normal_range": "0.1-1.2 mg/dL",
-        "description": "Bilirubin is produced by breakdown of red blood cells.",
-        "low_meaning": "Low bilirubin is normal.",
-        "high_meaning": "High bilirubin causes jaundice; check liver function.",
-        "advice": "Seek medical evaluation if elevated."
-    },
-    "Albumin": {
-        "normal_range": "3.4-5.4 g/dL",
-        "description": "Albumin is a protein made by the liver.",
-        "low_meaning": "Low albumin can indicate liver disease or malnutrition.",
-        "high_meaning": "High albumin is uncommon (dehydration).",
-        "advice": "Assess nutrition and liver health with provider."
-    },
-
-    # Thyroid
-    "TSH": {
-        "normal_range": "0.4-4.0 mIU/L",
-        "description": "TSH controls thyroid function.",
-        "low_meaning": "Low TSH may indicate hyperthyroidism.",
-        "high_meaning": "High TSH may indicate hypothyroidism.",
-        "advice": "See an endocrinologist for abnormal results."
-    },
-    "T3": {
-        "normal_range": "80-200 ng/dL",
-        "description": "T3 is an active thyroid hormone.",
-        "low_meaning": "Low T3 may indicate hypothyroid state.",
-        "high_meaning": "High T3 may indicate hyperthyroidism.",
-        "advice": "Discuss with your doctor."
-    },
-    "T4": {
-        "normal_range": "4.6-12.0 µg/dL",
-        "description": "T4 is the main thyroid hormone.",
-        "low_meaning": "Low T4 may indicate hypothyroidism.",
-        "high_meaning": "High T4 may indicate hyperthyroidism.",
-        "advice": "Follow up for thyroid testing if abnormal."
-    },
-
-    # Diabetes markers
-    "Glucose (Fasting)": {
-        "normal_range": "70-100 mg/dL",
-        "description": "Fasting blood glucose measures sugar after not eating.",
-        "low_meaning": "Low glucose can cause dizziness and confusion.",
-        "high_meaning": "High fasting glucose may indicate diabetes/prediabetes.",
-        "advice": "Monitor diet, exercise, and follow medical advice."
-    },
-    "Glucose (PP)": {
-        "normal_range": "<140 mg/dL (2 hrs after meal)",
-        "description": "Postprandial glucose measures blood sugar after eating.",
-        "low_meaning": "Low values rarely concerning.",
-        "high_meaning": "High PP glucose may indicate impaired glucose handling.",
-        "advice": "Consult provider about diabetes testing."
-    },
-    "HbA1c": {
-        "normal_range": "<5.7 %",
-        "description": "HbA1c indicates average blood sugar over ~3 months.",
-        "low_meaning": "Low HbA1c is uncommon and usually fine.",
-        "high_meaning": "High HbA1c indicates prediabetes or diabetes.",
-        "advice": "Lifestyle changes and medical care advised when high."
-    },
-    # Vitamins & minerals (examples)
-    "Vitamin D": {
-        "normal_range": {"default": "20-50 ng/mL"},
-        "description": "Vitamin D aids bone health and immunity.",
-        "low_meaning": "Low Vitamin D can cause bone weakness.",
-        "high_meaning": "High Vitamin D is rare but can be toxic.",
-        "advice": "Supplementation if deficient as guided by clinician."
-    },
-    "Vitamin B12": {
-        "normal_range": {"default": "200-900 pg/mL"},
-        "description": "B12 is important for nerve health and blood formation.",
-        "low_meaning": "Low B12 can cause anemia and neuropathy.",
-        "high_meaning": "High B12 usually not harmful but investigate causes.",
-        "advice": "Supplement if deficient."
-    },
-
-    # Inflammatory markers
-    "CRP": {
-        "normal_range": {"default": "<3 mg/L"},
-        "description": "C-reactive protein, a marker of inflammation.",
-        "low_meaning": "Low CRP is normal.",
-        "high_meaning": "High CRP indicates inflammation or infection.",
-        "advice": "Investigate source of inflammation."
-    },
-    "ESR": {
-        "normal_range": {"male": "0-15 mm/hr", "female": "0-20 mm/hr", "default": "0-20 mm/hr"},
-        "description": "Erythrocyte sedimentation rate, an inflammation marker.",
-        "low_meaning": "Low ESR is not a concern.",
-        "high_meaning": "High ESR suggests inflammation.",
-        "advice": "Correlate clinically."
-    },
-
-    # Hormones (examples)
-    "PSA": {
-        "normal_range": {"male": "<4.0 ng/mL"},
-        "description": "Prostate-specific antigen (male).",
-        "low_meaning": "Low PSA is normal.",
-        "high_meaning": "High PSA may suggest prostate disease.",
-        "advice": "Urology referral if elevated."
-    }
-    # You can add more parameters here as needed.
-}
+# PDF handling: pages with an embedded text layer skip OCR, the rest are rasterized one by one
+PDF_DPI = int(os.environ.get("PDF_DPI", 300))
+PDF_MIN_TEXT_CHARS = int(os.environ.get("PDF_MIN_TEXT_CHARS", 20))  # less embedded text than this means OCR the page
+MAX_PDF_PAGES = int(os.environ.get("MAX_PDF_PAGES", 200))
+
+# Tesseract settings (part of the OCR cache key, so changing them invalidates cached text)
+OCR_LANG = os.environ.get("OCR_LANG", "eng")
+OCR_CONFIG = os.environ.get("OCR_CONFIG", "--psm 6")  # psm 6: one uniform block of text, suits result tables
+OCR_WHITELIST = os.environ.get("OCR_WHITELIST", "1") == "1"  # restrict Tesseract to characters used in reports
+# read word boxes (image_to_data) instead of plain text, so table rows and columns can be told apart
+OCR_LAYOUT = os.environ.get("OCR_LAYOUT", "1") == "1"
+# "tesserocr" keeps Tesseract loaded in every OCR worker (pip install tesserocr), "pytesseract" runs the
+# tesseract command per image; "auto" uses tesserocr when it can load OCR_LANG and pytesseract otherwise
+OCR_ENGINE = os.environ.get("OCR_ENGINE", "auto")
+TESSDATA_DIR = find_tessdata()
+
+# Preprocessing before OCR (comma-separated stages from preprocess.py; empty disables)
+PREPROCESS_STEPS = tuple(s.strip() for s in os.environ.get("PREPROCESS_STEPS", "grayscale,crop,downscale,deskew,binarize").split(",") if s.strip())
+OCR_MAX_DIMENSION = int(os.environ.get("OCR_MAX_DIMENSION", 2500))  # longest side in pixels
+OCR_TARGET_DPI = int(os.environ.get("OCR_TARGET_DPI", 300))
+# optional crop "left,top,right,bottom" as page fractions, e.g. "0,0.2,1,0.9" for the results table
+OCR_ROI = tuple(float(v) for v in os.environ["OCR_ROI"].split(",")) if os.environ.get("OCR_ROI") else None
+
+# OCR result cache keyed by image content; set OCR_CACHE_MAX_BYTES=0 to disable
+OCR_CACHE_PATH = os.environ.get("OCR_CACHE_PATH", os.path.join(UPLOAD_DIR, "ocr_cache.sqlite3"))
+OCR_CACHE_MAX_BYTES = int(os.environ.get("OCR_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+ocr_cache = OCRCache(OCR_CACHE_PATH, OCR_CACHE_MAX_BYTES) if OCR_CACHE_MAX_BYTES > 0 else None
+
+# Asynchronous jobs (POST /jobs): queue and results persist in SQLite across restarts; JOB_WORKERS=0 disables them
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", max(1, OCR_WORKERS // 2)))  # jobs processed at once
+JOB_MAX_QUEUED = int(os.environ.get("JOB_MAX_QUEUED", 1000))  # beyond this POST /jobs returns 503
+JOB_RETENTION_HOURS = float(os.environ.get("JOB_RETENTION_HOURS", 7 * 24))  # finished jobs are deleted after this
+JOB_CALLBACK_TIMEOUT = float(os.environ.get("JOB_CALLBACK_TIMEOUT", 10))
+JOB_CALLBACK_RETRIES = int(os.environ.get("JOB_CALLBACK_RETRIES", 3))
+# hosts callbacks may go to (comma-separated names); unset: any host whose addresses are all public
+JOB_CALLBACK_HOSTS = {h.strip().lower() for h in os.environ.get("JOB_CALLBACK_HOSTS", "").split(",") if h.strip()}
+JOB_POLL_INTERVAL = 5  # seconds an idle worker sleeps before checking the queue again
+# a running job is leased to its process, which renews the lease every third of it; jobs whose lease
+# ran out (their process died) are requeued by any process sharing the queue
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 60))
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", os.path.join(UPLOAD_DIR, "jobs.sqlite3"))
+JOBS_DIR = os.environ.get("JOBS_DIR", os.path.join(UPLOAD_DIR, "jobs"))  # uploads waiting to be processed
+job_store = JobStore(JOBS_DB_PATH, JOBS_DIR, JOB_LEASE_SECONDS) if JOB_WORKERS > 0 else None
+if job_store is not None:
+    metrics.JOBS_QUEUED.set_function(lambda: job_store.count(QUEUED))
+
+# Patient history (GET /patients/...): results of reports uploaded with a patient_id; off unless PATIENT_HISTORY=1.
+# Reading it takes "Authorization: Bearer <HISTORY_API_TOKEN>"; without a token configured nothing can be read.
+PATIENT_HISTORY = os.environ.get("PATIENT_HISTORY", "0") == "1"
+HISTORY_API_TOKEN = os.environ.get("HISTORY_API_TOKEN", "")
+HISTORY_DB_PATH = os.environ.get("HISTORY_DB_PATH", os.path.join(UPLOAD_DIR, "history.sqlite3"))
+HISTORY_BATCH_SIZE = int(os.environ.get("HISTORY_BATCH_SIZE", 500))  # queued reports that trigger a write at once
+HISTORY_FLUSH_INTERVAL = float(os.environ.get("HISTORY_FLUSH_INTERVAL", 1))  # seconds a report may wait to be written
+HISTORY_MAX_ROWS = 5000  # most rows one history query returns
+PATIENT_ID_MAX_CHARS = 128
+history_store = HistoryStore(
+    HISTORY_DB_PATH, HISTORY_BATCH_SIZE, HISTORY_FLUSH_INTERVAL, on_error=lambda e: metrics.HISTORY_WRITE_FAILURES.inc()
+) if PATIENT_HISTORY else None
+if history_store is not None:
+    metrics.HISTORY_PENDING.set_function(history_store.pending)
+
+# Startup phase (see warm_up): Tesseract and its language data are always checked; with STARTUP_WARMUP
+# the parser is run once and every OCR worker is started before GET /ready turns green
+STARTUP_WARMUP = os.environ.get("STARTUP_WARMUP", "1") == "1"
+
+# add a Server-Timing header (per-stage milliseconds) to instrumented responses
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "1") == "1"
+
+# endpoints covered by the request metrics and the Server-Timing header
+INSTRUMENTED_PATHS = ("/upload", "/upload/batch", "/upload/stream", "/classify", "/jobs")
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """Track in-flight requests and latency per endpoint, and attach per-stage timings."""
+    endpoint = request.url.path
+    if endpoint not in INSTRUMENTED_PATHS:
+        return await call_next(request)
+    timer = metrics.start_request_timer()
+    start = time.perf_counter()
+    status = 500
+    with metrics.REQUESTS_IN_FLIGHT.labels(endpoint).track_inprogress():
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        finally:
+            metrics.REQUEST_SECONDS.labels(endpoint, str(status)).observe(time.perf_counter() - start)
+    if SERVER_TIMING and timer.stages:
+        response.headers["Server-Timing"] = timer.server_timing()
+    return response
 
 # ---------------------------
-# Aliases and thresholds (gender-specific where applicable)
+# Parameter catalog (names, aliases, ranges, descriptions and advice)
 # ---------------------------
-param_aliases = {
-    "Hemoglobin": ["hemoglobin", "hb", "hgb"],
-    "Hematocrit": ["hematocrit", "hct"],
-    "RBC": ["rbc", "red blood cell", "red blood cells"],
-    "WBC": ["wbc", "white blood cell", "total wbc", "total wbc count"],
-    "Neutrophils": ["neutrophil", "neutrophils"],
-    "Lymphocytes": ["lymphocyte", "lymphocytes"],
-    "Monocytes": ["monocyte", "monocytes"],
-    "Eosinophils": ["eosinophil", "eosinophils"],
-    "Basophils": ["basophil", "basophils"],
-    "Platelets": ["platelet", "platelets", "plt"],
-    "MPV": ["mpv", "mean platelet volume"],
-    "Cholesterol (Total)": ["cholesterol", "total cholesterol"],
-    "HDL Cholesterol": ["hdl", "hdl cholesterol"],
-    "LDL Cholesterol": ["ldl", "ldl cholesterol"],
-    "Triglycerides": ["triglyceride", "triglycerides", "tg"],
-    "Blood Urea Nitrogen (BUN)": ["bun", "blood urea nitrogen", "urea"],
-    "Creatinine": ["creatinine", "scr"],
-    "Uric Acid": ["uric acid", "uricacid"],
-    "Sodium": ["sodium", "na"],
-    "Potassium": ["potassium", "k"],
-    "Chloride": ["chloride", "cl"],
-    "ALT (SGPT)": ["alt", "sgpt"],
-    "AST (SGOT)": ["ast", "sgot"],
-    "Alkaline Phosphatase (ALP)": ["alp", "alkaline phosphatase"],
-    "Bilirubin (Total)": ["bilirubin", "bilirubin total", "total bilirubin"],
-    "Albumin": ["albumin"],
-    "TSH": ["tsh"],
-    "T3": ["t3"],
-    "T4": ["t4"],
-    "Glucose (Fasting)": ["glucose fasting", "fasting glucose", "glucose (fasting)", "fbs", "fasting blood sugar"],
-    "Glucose (PP)": ["pp glucose", "postprandial glucose", "ppbs", "pp"],
-    "HbA1c": ["hba1c", "a1c"],
-    # Vitamins / others
-    "Vitamin D": ["vitamin d", "vit d", "25-ohd"],
-    "Vitamin B12": ["vitamin b12", "b12"],
-    "CRP": ["crp"],
-    "ESR": ["esr"],
-    "PSA": ["psa"]
-}
-
-# thresholds: support gender-specific ranges where applicable
-# format: { param: {"male": (low,high), "female": (low,high), "default":(low,high)} }
-param_thresholds = {
-    "Hemoglobin": {"male": (13.8, 17.2), "female": (12.1, 15.1), "default": (12.1, 17.2)},
-    "Hematocrit": {"male": (40.7, 50.3), "female": (36.1, 44.3), "default": (36.1, 50.3)},
-    "RBC": {"male": (4.7, 6.1), "female": (4.2, 5.4), "default": (4.2, 6.1)},
-    "WBC": {"default": (4000, 11000)},
-    "Neutrophils": {"default": (40, 60)},
-    "Lymphocytes": {"default": (20, 40)},
-    "Monocytes": {"default": (2, 8)},
-    "Eosinophils": {"default": (1, 4)},
-    "Basophils": {"default": (0.5, 1)},
-    "Platelets": {"default": (150000, 450000)},
-    "MPV": {"default": (7.5, 11.5)},
-    "Cholesterol (Total)": {"default": (0, 200)},
-    "HDL Cholesterol": {"male": (40, 9999), "female": (50, 9999), "default": (40, 9999)},
-    "LDL Cholesterol": {"default": (0, 100)},
-    "Triglycerides": {"default": (0, 150)},
-    "Blood Urea Nitrogen (BUN)": {"default": (7, 20)},
-    "Creatinine": {"default": (0.6, 1.3)},
-    "Uric Acid": {"default": (3.5, 7.2)},
-    "Sodium": {"default": (135, 145)},
-    "Potassium": {"default": (3.5, 5.0)},
-    "Chloride": {"default": (96, 106)},
-    "ALT (SGPT)": {"default": (7, 56)},
-    "AST (SGOT)": {"default": (10, 40)},
-    "Alkaline Phosphatase (ALP)": {"default": (44, 147)},
-    "Bilirubin (Total)": {"default": (0.1, 1.2)},
-    "Albumin": {"default": (3.4, 5.4)},
-    "TSH": {"default": (0.4, 4.0)},
-    "T3": {"default": (80, 200)},    # units vary — these are approximate
-    "T4": {"default": (4.6, 12.0)},
-    "Glucose (Fasting)": {"default": (70, 100)},
-    "Glucose (PP)": {"default": (0, 140)},
-    "HbA1c": {"default": (0, 5.7)},
-     "Vitamin D": {"default": (20, 50)},
-    "Vitamin B12": {"default": (200, 900)},
-    "CRP": {"default": (0, 3)},
-    "ESR": {"male": (0, 15), "female": (0, 20), "default": (0, 20)},
-    "PSA": {"male": (0, 4.0)}
-}
+
+# versioned JSON data file, validated and compiled at startup; edits are picked up without a restart
+CATALOG_PATH = os.environ.get("CATALOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.json"))
+CATALOG_RELOAD_INTERVAL = float(os.environ.get("CATALOG_RELOAD_INTERVAL", 5))  # seconds between checks; 0 disables
+catalog = load_catalog(CATALOG_PATH)
 
 # ---------------------------
 # Helper functions
 # ---------------------------
 
+# OCR punctuation: curly quotes are dropped, dash look-alikes become a minus sign
+# (all non-ASCII, so ASCII text skips the translation)
+OCR_NUMBER_TRANSLATION = str.maketrans({"‘": None, "’": None, "“": None, "”": None, "—": "-", "−": "-"})
+# a comma between a digit and exactly three digits; the leading literal lets re skip ahead quickly
+THOUSANDS_COMMA_RE = re.compile(r",(?<=\d,)(?=\d{3}\b)")
+PERCENT_RE = re.compile(r"(-?\d+\.?\d*)\s*%")
+NUMBER_RE = re.compile(r"(-?\d+\.?\d*)")
+UNIT_RE = re.compile(r"[^\S\n]*([%/a-zA-Zµμ][\w/%µμ^.]*)")
+
+NumberMatch = namedtuple("NumberMatch", "value unit start end")
+
+def _normalize_number_text(s):
+    if not s.isascii():
+        s = s.translate(OCR_NUMBER_TRANSLATION)
+    if "," in s:
+        s = THOUSANDS_COMMA_RE.sub("", s)
+    return s
+
+def _original_index(s, normalized, index):
+    """Map an index in _normalize_number_text(s) back to s (only characters are ever removed)."""
+    if len(normalized) == len(s):
+        return index
+    kept = [i for i, ch in enumerate(s) if OCR_NUMBER_TRANSLATION.get(ord(ch), ch) is not None]
+    translated = s.translate(OCR_NUMBER_TRANSLATION)
+    removed = {m.start() for m in THOUSANDS_COMMA_RE.finditer(translated)} if "," in translated else ()
+    kept = [orig for j, orig in enumerate(kept) if j not in removed]
+    return kept[index] if index < len(kept) else len(s)
+
+def _number_match(s, normalized, m, unit_hint=None):
+    end = m.end(1)
+    unit = unit_hint
+    if unit is None:
+        u = UNIT_RE.match(normalized, end)
+        unit = u.group(1).rstrip(".") if u else None
+    return NumberMatch(float(m.group(1)), unit or None,
+                       _original_index(s, normalized, m.start(1)), _original_index(s, normalized, end))
+
+def find_number(s):
+    """
+    Like extract_number, but returns NumberMatch(value, unit, start, end) or None.
+    unit is "%" for percentages, otherwise the token right after the number (e.g. "g/dL") or None;
+    start/end index the number in the original string.
+    """
+    if s is None:
+        return None
+    normalized = _normalize_number_text(s)
+    # percentage values (e.g. "12 %") win over the first plain number
+    m = "%" in normalized and PERCENT_RE.search(normalized)
+    if m:
+        return _number_match(s, normalized, m, "%")
+    m = NUMBER_RE.search(normalized)
+    if m:
+        return _number_match(s, normalized, m)
+    return None
+
 def extract_number(s):
     """Try to extract a numeric value from a string robustly."""
     if s is None:
         return None
-    # normalize unicode punctuation that OCR often produces
-    s = s.replace("‘", "").replace("’", "").replace("“", "").replace("”", "")
-    # replace weird characters often seen in OCR for minus or decimal
-    s = s.replace("—", "-").replace("−", "-")
-    # remove commas used as thousand separators or trailing commas
-    s = re.sub(r"(?<=\d)[,](?=\d{3}\b)", "", s)
-    # remove stray non-number characters except . and - and %
-    # but keep percent sign to detect percent values
+    normalized = _normalize_number_text(s)
     # first handle percentage values (e.g., "12 %")
-    perc = re.search(r"(-?\d+\.?\d*)\s*%", s)
-    if perc:
-        try:
-            return float(perc.group(1))
-        except:
-            return None
-    m = re.search(r"(-?\d+\.?\d*)", s)
-    if m:
-        try:
-            return float(m.group(1))
-        except:
-            return None
-    return None
+    m = ("%" in normalized and PERCENT_RE.search(normalized)) or NUMBER_RE.search(normalized)
+    return float(m.group(1)) if m else None
+
+def extract_numbers(lines):
+    """
+    extract_number for a list of lines in one pass: thousands separators are removed from the
+    joined text at once, then each line needs at most two precompiled searches.
+    Lines must not contain newlines.
+    """
+    if not lines:
+        return []
+    percent_search = PERCENT_RE.search
+    number_search = NUMBER_RE.search
+    values = []
+    joined = "\n".join(ln if ln.isascii() else ln.translate(OCR_NUMBER_TRANSLATION) for ln in lines)
+    if "," in joined:
+        joined = THOUSANDS_COMMA_RE.sub("", joined)
+    for ln in joined.split("\n"):
+        m = ("%" in ln and percent_search(ln)) or number_search(ln)
+        values.append(float(m.group(1)) if m else None)
+    return values
+
+def read_header_fields(matches, lowered, raw):
+    """
+    (gender, age) from patient header matches (catalog.HEADER_PATTERN groups) in `lowered`.
+    raw is the text before lowering: the "M 25Y" shorthand only counts in uppercase.
+    A spelled-out sex wins over the shorthand, and male over female.
+    """
+    spelled, short = set(), set()
+    age = None
+    same_offsets = len(raw) == len(lowered)
+    for m in matches:
+        sex = m["sex"] or m["word"]
+        if sex:
+            spelled.add("female" if sex.startswith("f") else "male")
+        elif m["short"]:
+            letter = m["short"].upper()
+            if raw[m.start("short")] == letter if same_offsets else re.search(rf"\b{letter}[\s,]{m['short_age']}", raw):
+                short.add("female" if letter == "F" else "male")
+                if age is None:
+                    age = int(m["short_age"])
+        elif m["age"] and age is None:
+            age = int(m["age"])
+    for genders in (spelled, short):
+        for gender in ("male", "female"):
+            if gender in genders:
+                return gender, age
+    return "unknown", age
 
 def detect_gender_from_text(text):
     """Try to detect gender from OCR text. Returns ('male'|'female'|'unknown', source)."""
     if not text:
         return "unknown", "none"
     lowered = text.lower()
-    # common patterns
-    if re.search(r"\bsex[:\s]*male\b", lowered) or re.search(r"\bsex[:\s]*m\b", lowered) or re.search(r"\bmale\b", lowered):
-        return "male", "ocr"
-    if re.search(r"\bsex[:\s]*female\b", lowered) or re.search(r"\bsex[:\s]*f\b", lowered) or re.search(r"\bfemale\b", lowered):
-        return "female", "ocr"
-    # try shorter patterns like "M 25Y" or "F 30 Y"
-    if re.search(r"\bM\b[\s,]\d{1,2}\b", text):
-        return "male", "ocr"
-    if re.search(r"\bF\b[\s,]\d{1,2}\b", text):
-        return "female", "ocr"
-    return "unknown", "ocr"
-
-def get_threshold_for_param(param, gender="unknown"):
-    """Return (low, high) based on param_thresholds and gender."""
-    info = param_thresholds.get(param)
-    if not info:
-        return None, None
-    # prefer gender-specific
-    if gender and gender.lower() in info:
-        return info[gender.lower()]
-    if "default" in info:
-        return info["default"]
-    # fallback to any numeric tuple
-    for v in info.values():
-        if isinstance(v, (tuple, list)) and len(v) == 2:
-            return tuple(v)
-    return None, None
+    gender, _ = read_header_fields(HEADER_RE.finditer(lowered), lowered, text)
+    return gender, "ocr"
 
 # ---------------------------
-# Parser
+# Range classification
 # ---------------------------
 
-def parse_medical_report(text, gender="unknown"):
+def describe_values(found, gender="unknown", cat=None):
     """
-    Robust parser that:
-    - normalizes text into lines,
-    - for each parameter alias, finds line with alias and searches that line and next 3 lines for numeric value,
-    - fallback: windowed search near alias in the whole text.
+    Classify {param id: value} with the catalog's range classifier in one vectorized call and
+    build the per-parameter result dicts (value, normal_range, description, meaning, advice).
     """
     results = {}
-    if not text:
+    if not found:
         return results
+    cat = cat or catalog
+    param_ids = list(found)
+    values = list(found.values())
+    gid = gender_id(gender)
+    codes = cat.classifier.classify(param_ids, values, gid)
+    for param_id, value, code in zip(param_ids, values, codes.tolist()):
+        param = cat.parameters[param_id]
+        results[param.name] = {
+            "value": value,
+            "normal_range": param.normal_ranges[gid],
+            "description": param.description,
+            "meaning": param.meanings[code],
+            "advice": param.advice
+        }
+    return results
 
-    # normalize newlines and split into non-empty lines
-    norm = text.replace("\r", "\n")
-    raw_lines = [ln.strip() for ln in norm.splitlines() if ln.strip() != ""]
-    lower_lines = [ln.lower() for ln in raw_lines]
+# ---------------------------
+# Parser
+# ---------------------------
 
-    # helper to attempt add param if number found
-    def try_add(param_key, value):
-        if value is None:
-            return False
-        low, high = get_threshold_for_param(param_key, gender)
-        if low is not None and high is not None:
-            if value < low:
-                meaning = medical_info[param_key].get("low_meaning", "Below normal range.")
-            elif value > high:
-                meaning = medical_info[param_key].get("high_meaning", "Above normal range.")
-            else:
-                meaning = "Within normal range."
+# characters that match an ASCII alias letter under re.IGNORECASE but not after str.lower()
+CASEFOLD_MISMATCH_CHARS = ("\u0130", "\u0131", "\u017f")  # İ, ı, ſ
+
+ReportScan = namedtuple("ReportScan", "cat text lines rows hit_lines hit_ends row_hits seen_aliases gender age")
+
+# match aliases OCR misspelled ("creatinlne") to the nearest alias word, see fuzzy.FuzzyAliasIndex
+FUZZY_ALIASES = os.environ.get("FUZZY_ALIASES", "1") == "1"
+
+def scan_report(parts, cat=None):
+    """
+    Normalize a report and scan it once; gender detection and the parser both read the result.
+    parts is [(text, word rows)]: a part with rows is read one visual row per line (see
+    layout.group_rows), otherwise its text is split into non-empty lines.
+    One pass of the catalog's alias index over the lowered lines finds every alias hit (its
+    lines, and where in them the alias ends) and the patient header fields (sex, age, "M 25Y");
+    with FUZZY_ALIASES, words OCR misread are then looked up in the fuzzy alias index.
+    """
+    cat = cat or catalog
+    texts, lines, line_rows = [], [], []
+    for text, rows in parts:
+        if rows:
+            part_lines = [" ".join(w.text for w in row) for row in rows]
+            texts.append("\n".join(part_lines))
+            line_rows.extend(rows)
+        elif text:
+            texts.append(text)
+            # normalize newlines and split into non-empty lines
+            part_lines = [ln.strip() for ln in text.replace("\r", "\n").splitlines() if ln.strip() != ""]
+            line_rows.extend([None] * len(part_lines))
         else:
-            meaning = "Value found."
+            continue
+        lines.extend(part_lines)
+    lower_lines = [ln.lower() for ln in lines]
+    lowered = "\n".join(lower_lines)
+    line_starts = []
+    offset = 0
+    for ln in lower_lines:
+        line_starts.append(offset)
+        offset += len(ln) + 1
 
-        results[param_key] = {
-            "value": value,
-            "normal_range": medical_info[param_key].get("normal_range", ""),
-            "description": medical_info[param_key].get("description", ""),
-            "meaning": meaning,
-            "advice": medical_info[param_key].get("advice", "")
-        }
-        return True
-
-    # 1) Line-based scanning
-    for param_key, aliases in param_aliases.items():
-        found_flag = False
-        for i, ln in enumerate(lower_lines):
-            for alias in aliases:
-                if alias in ln:
-                    # search current line and up to next 3 lines for a number
-                    for j in range(i, min(i + 4, len(raw_lines))):
-                        candidate = raw_lines[j]
-                        num = extract_number(candidate)
-                        if num is not None:
-                            if try_add(param_key, num):
-                                found_flag = True
-                                break
-                    if found_flag:
-                        break
-            if found_flag:
+    hit_lines = {}  # param id -> line indices (ascending, unique)
+    hit_ends = {}  # (param id, line index) -> end of its first alias in lines[line index]
+    row_hits = {}  # line index of a word row -> [(offset in the line, ((alias, end offset), ...) longest first)], left to right
+    seen_aliases = set()
+    header_matches = []
+    hits = cat.alias_index["hits"]
+    for m in cat.alias_index["pattern"].finditer(lowered):
+        alias = m["alias"]
+        if alias is None:
+            header_matches.append(m)
+            continue
+        header = HEADER_RE.match(lowered, m.start())  # an alias match hides a header field at the same position
+        if header is not None:
+            header_matches.append(header)
+        aliases, params = hits[alias]
+        seen_aliases.update(aliases)
+        line_no = bisect_right(line_starts, m.start()) - 1
+        end = m.start() - line_starts[line_no] + len(alias)
+        for param_id in params:
+            found_lines = hit_lines.setdefault(param_id, [])
+            if not found_lines or found_lines[-1] != line_no:
+                found_lines.append(line_no)
+            hit_ends.setdefault((param_id, line_no), end)
+        if line_rows[line_no] is not None:
+            start = m.start() - line_starts[line_no]
+            row_hits.setdefault(line_no, []).append((start, tuple((a, start + len(a)) for a in aliases)))
+
+    if FUZZY_ALIASES:
+        # aliases misread by OCR ("haemoglobln"): whole words within a small edit distance
+        alias_params = cat.alias_index["params"]
+        fuzzy_rows = set()
+        for line_no, start, end, alias in cat.fuzzy_index.find_all(lower_lines, lowered):
+            for param_id in alias_params[alias]:
+                found_lines = hit_lines.setdefault(param_id, [])
+                if line_no not in found_lines:
+                    insort(found_lines, line_no)
+                hit_ends.setdefault((param_id, line_no), end)
+            if line_rows[line_no] is not None:
+                row_hits.setdefault(line_no, []).append((start, ((alias, end),)))
+                fuzzy_rows.add(line_no)
+            elif len(lines[line_no]) == len(lower_lines[line_no]):
+                # blank the misread word so its digits ("hem0globin") are not read as the value
+                lines[line_no] = lines[line_no][:start] + " " * (end - start) + lines[line_no][end:]
+        for line_no in fuzzy_rows:
+            row_hits[line_no].sort()
+
+    gender, age = read_header_fields(header_matches, lowered, "\n".join(lines))
+    resized = {i for i, (line, lower_line) in enumerate(zip(lines, lower_lines)) if len(line) != len(lower_line)}
+    if resized:
+        # lowering changed these lines' length, so offsets in the lowered text do not fit them
+        hit_ends = {key: end for key, end in hit_ends.items() if key[1] not in resized}
+    return ReportScan(cat, "\n".join(texts), lines, line_rows, hit_lines, hit_ends, row_hits, seen_aliases, gender, age)
+
+def find_values_layout(scan):
+    """
+    Read parameter values from the word rows of a scanned report: an alias takes the number in
+    its own row's result column, looking only at the cells after it (up to the next alias in
+    the row) and skipping reference ranges. Aliases must start and end on word boundaries and
+    the first row naming a parameter wins.
+    Returns ({param id: value}, {param ids whose rows have other cells but no result}).
+    """
+    found = {}
+    alias_params = scan.cat.alias_index["params"]
+    candidates = {}  # param id -> numeric cells of each row naming it, top to bottom
+    blank = set()  # table rows whose result cell is empty (unit and range only)
+    first_cells = []
+    for line_no, line_hits in scan.row_hits.items():
+        row = scan.rows[line_no]
+        words = [w.text.lower() for w in row]
+        text = " ".join(words)
+        starts = [0]
+        for word in words[:-1]:
+            starts.append(starts[-1] + len(word) + 1)
+
+        spans = []  # (first word, last word, param ids), left to right
+        covered = 0  # end of the last accepted alias: words inside it ("platelet" in "mean platelet volume") are not hits
+        for start, alias_ends in line_hits:
+            if start < covered or (start and text[start - 1].isalnum()):
+                continue
+            for alias, end in alias_ends:  # longest first
+                if end < len(text) and text[end].isalnum():
+                    continue
+                spans.append((bisect_right(starts, start) - 1, bisect_right(starts, end - 1) - 1, alias_params[alias]))
+                covered = end
+                break
+
+        for k, (first, last, params) in enumerate(spans):
+            stop = next((f for f, _, _ in spans[k + 1:] if f > last), len(row))
+            cells = numeric_cells(row, last + 1, stop, extract_number)
+            if cells:
+                first_cells.append(cells[0][0])
+                for param_id in params:
+                    candidates.setdefault(param_id, []).append(cells)
+            elif stop > last + 1:
+                blank.update(params)
+
+    column = result_column(first_cells)
+    for param_id in sorted(candidates):
+        found[param_id] = pick_cell(candidates[param_id][0], column)[1]
+    return found, blank.difference(found)
+
+def parse_report(scan, gender="unknown"):
+    """
+    Robust parser over a scanned report (see scan_report) that:
+    - reads word rows first (find_values_layout); parameters whose table row has an empty
+      result are left out,
+    - for each parameter still missing, searches its matching lines (in order) and next 3 lines for numeric value;
+      on the matching line itself only the text after the alias counts, so digits in the name
+      ("Vitamin B12", "T3") or a number before it are not taken for the value,
+    - fallback: windowed search near alias in the whole text.
+    """
+    cat = scan.cat  # one catalog for the whole parse, even if a reload swaps it meanwhile
+    found, blank = find_values_layout(scan) if scan.row_hits else ({}, ())
+    if len(found) + len(blank) == len(cat):
+        return describe_values(found, gender, cat)
+    skip = found.keys() | blank  # parameters settled by the layout pass
+    raw_lines = scan.lines
+
+    # first number of every line, extracted in one pass (only needed once an alias was hit)
+    line_numbers = extract_numbers(raw_lines) if scan.hit_lines else []
+
+    # 1) Line-based: search the hit line and up to next 3 lines for a number
+    for param_id in range(len(cat)):
+        if param_id in skip:
+            continue
+        for i in scan.hit_lines.get(param_id, ()):
+            num = None
+            for j in range(i, min(i + 4, len(raw_lines))):
+                num = line_numbers[j]
+                end = scan.hit_ends.get((param_id, i)) if j == i else None
+                if num is not None and end and DIGIT_RE.search(raw_lines[i], 0, end):
+                    # the line's first number lies in or before the alias: read on from its end
+                    match = find_number(raw_lines[i][end:])
+                    num = match.value if match else None
+                if num is not None:
+                    break
+            if num is not None:
+                found[param_id] = num
                 break
 
     # 2) Fallback: windowed search across entire text (handles unusual layouts)
-    for param_key, aliases in param_aliases.items():
-        if param_key in results:
+    # The scan already tells us which aliases occur at all, unless the text holds
+    # one of the few characters that re.IGNORECASE folds differently from str.lower().
+    text = scan.text
+    scan_is_exact = not any(ch in text for ch in CASEFOLD_MISMATCH_CHARS)
+    fallback = cat.alias_index["fallback"]
+    for param_id, aliases in enumerate(cat.aliases):
+        if param_id in found or param_id in skip:
             continue  # already found
         for alias in aliases:
-            # search alias and up to 60 chars following for a number
-            m = re.search(rf"{re.escape(alias)}[\s\S]{{0,80}}?([-\d.,%]+)", text, re.IGNORECASE)
+            if scan_is_exact and alias not in scan.seen_aliases:
+                continue
+            # search alias and up to 80 chars following for a number
+            m = fallback[alias].search(text)
             if m:
                 candidate = m.group(1)
                 num = extract_number(candidate)
                 if num is not None:
-                    try_add(param_key, num)
+                    found[param_id] = num
                     break
 
-    return results
+    # classify all values against gender-aware thresholds at once
+    return describe_values(found, gender, cat)
+
+def parse_medical_report(text, gender="unknown", rows=None):
+    """Parse OCR text, or the word rows it was read from when given (scan_report, then parse_report)."""
+    if not text and not rows:
+        return {}
+    return parse_report(scan_report([(text, rows or [])]), gender)
 
 # ---------------------------
-# Upload endpoint
+# OCR worker pool
 # ---------------------------
 
-@app.post("/upload")
-async def upload_report(file: UploadFile = File(...), user_gender: str = Form(None)):
+class OCRPoolBusy(Exception):
+    """Raised when every OCR worker is busy and the wait queue is full."""
+
+_ocr_pool = None
+_ocr_jobs = 0  # submitted jobs that have not finished yet (running + queued)
+_ocr_jobs_lock = threading.Lock()
+# OCR jobs requests may have in flight at once, shared by all of them: a request waits here for
+# a free worker rather than filling the pool's queue and failing with OCRPoolBusy partway through
+ocr_slots = asyncio.Semaphore(OCR_WORKERS)
+
+def get_ocr_pool():
+    """Create the OCR process pool on first use."""
+    global _ocr_pool
+    if _ocr_pool is None:
+        _ocr_pool = ProcessPoolExecutor(max_workers=OCR_WORKERS)
+    return _ocr_pool
+
+def shutdown_ocr_pool():
+    global _ocr_pool
+    if _ocr_pool is not None:
+        _ocr_pool.shutdown(wait=False, cancel_futures=True)
+        _ocr_pool = None
+
+def recycle_ocr_pool():
+    """Retire the current OCR workers (running jobs still finish); the next job starts fresh ones."""
+    global _ocr_pool
+    pool, _ocr_pool = _ocr_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+def replace_broken_ocr_pool(pool):
+    """Drop a pool that lost a worker (killed, out of memory, crashed in Tesseract); the next job starts a new one."""
+    global _ocr_pool
+    if _ocr_pool is pool:
+        print("An OCR worker died, starting a new pool")
+        _ocr_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def ocr_pool_saturated():
+    return _ocr_jobs >= OCR_WORKERS + OCR_MAX_QUEUE
+
+def _release_ocr_slot(_future):
+    global _ocr_jobs
+    with _ocr_jobs_lock:
+        _ocr_jobs -= 1
+
+async def run_ocr_job(func, *args):
     """
-    Accepts uploaded image (PDF not handled here) and optional form field 'user_gender' (male/female).
-    Returns extracted raw_text, detected gender, parsed_results.
+    Run func(*args) in the OCR process pool without blocking the event loop.
+    Raises OCRPoolBusy when workers and queue are full, asyncio.TimeoutError after OCR_TIMEOUT.
+    A timed-out job keeps its slot until the worker finishes it; Tesseract gives up on its own
+    at OCR_TIMEOUT too (see get_ocr_engine), so that is soon after. When a worker dies the pool
+    is broken for good: it is replaced and the job tried once more, then BrokenProcessPool is raised.
     """
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{timestamp}_{file.filename}"
-    filepath = os.path.join(UPLOAD_DIR, filename)
+    global _ocr_jobs
+    for attempt in range(2):
+        with _ocr_jobs_lock:
+            if ocr_pool_saturated():
+                raise OCRPoolBusy()
+            _ocr_jobs += 1
+        pool = get_ocr_pool()
+        try:
+            future = pool.submit(func, *args)
+        except BrokenProcessPool:
+            _release_ocr_slot(None)
+            replace_broken_ocr_pool(pool)
+            if attempt:
+                raise
+            continue
+        except Exception:
+            _release_ocr_slot(None)
+            raise
+        future.add_done_callback(_release_ocr_slot)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), OCR_TIMEOUT)
+        except BrokenProcessPool:
+            replace_broken_ocr_pool(pool)
+            if attempt:
+                raise
+
+metrics.OCR_JOBS_RUNNING.set_function(lambda: min(_ocr_jobs, OCR_WORKERS))
+metrics.OCR_JOBS_QUEUED.set_function(lambda: max(_ocr_jobs - OCR_WORKERS, 0))
+
+def ocr_busy_error():
+    return HTTPException(
+        status_code=503,
+        detail="OCR workers are busy, please retry shortly.",
+        headers={"Retry-After": str(OCR_RETRY_AFTER)},
+    )
 
-    # save file
-    with open(filepath, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+# ---------------------------
+# Upload ingestion
+# ---------------------------
 
-    # OCR
+def check_pixel_budget(data):
+    """
+    Read the image header from the bytes received so far and reject oversized images
+    before anything is decoded. Returns False while the header is not complete (or not an image).
+    """
     try:
-        img = Image.open(filepath)
+        width, height = Image.open(io.BytesIO(data)).size
+    except Exception:
+        return False
+    if width * height > MAX_IMAGE_PIXELS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image is {width}x{height} pixels; the limit is {MAX_IMAGE_PIXELS} pixels.",
+        )
+    return True
+
+async def read_upload(file):
+    """
+    Read one uploaded file in chunks into a single buffer, hashing it and enforcing
+    MAX_UPLOAD_BYTES per file as it goes; the pixel budget is checked as soon as the image
+    header has been read. The request body was already capped by AdmissionMiddleware, and
+    Starlette has parsed it into a spooled file (in memory up to 1 MB, on disk beyond), so
+    this is the second copy of the upload, but the only one that outlives the request.
+    Returns (bytes, sha256 hex digest).
+    """
+    digest = hashlib.sha256()
+    buffer = io.BytesIO()
+    size = 0
+    header_checked = False
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES} bytes.")
+        digest.update(chunk)
+        buffer.write(chunk)
+        if not header_checked and size <= UPLOAD_HEADER_PROBE_BYTES:
+            header_checked = check_pixel_budget(buffer.getvalue())
+    data = buffer.getvalue()  # hands over the buffer's own bytes, no copy
+    if not header_checked:
+        check_pixel_budget(data)
+    metrics.UPLOAD_BYTES.inc(size)
+    return data, digest.hexdigest()
+
+def write_upload(data, digest, filename):
+    with timed_stage("persist"):
+        if not upload_store.put(data, digest, filename):
+            metrics.UPLOADS_DEDUPLICATED.inc()
+
+def ocr_whitelist():
+    """Characters Tesseract may emit: digits, alias letters, header words (sex/age) and range punctuation."""
+    chars = set(string.digits + ".,:%/-()<> ")  # without the space, Tesseract's LSTM model runs words together
+    for word in [a for aliases in catalog.aliases for a in aliases] + ["sex", "male", "female", "age", "years"]:
+        chars.update(c for c in word.lower() + word.upper() if not c.isspace())
+    return "".join(sorted(chars))
+
+def tesseract_config():
+    config = OCR_CONFIG
+    if OCR_WHITELIST:
+        config += " -c " + shlex.quote("tessedit_char_whitelist=" + ocr_whitelist())
+    return config.strip()
+
+def prepare_image(img):
+    """Run the configured preprocessing stages. Returns (image, {stage: milliseconds})."""
+    if PREPROCESS_STEPS:
+        return preprocess(img, PREPROCESS_STEPS, roi=OCR_ROI, max_dimension=OCR_MAX_DIMENSION, target_dpi=OCR_TARGET_DPI)
+    if img.mode != "RGB":
         # convert if needed
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-        extracted_text = pytesseract.image_to_string(img)
+        img = img.convert("RGB")
+    return img, {}
+
+_ocr_engine = None
+_ocr_engine_key = None  # (process id, engine kind, language, config) the engine was created for
+
+def get_ocr_engine():
+    """
+    This process's OCR engine (see ocr_engine.create_engine), created on first use: every OCR
+    worker loads its own, and keeps it until the settings it was made for change.
+    """
+    global _ocr_engine, _ocr_engine_key
+    key = (os.getpid(), OCR_ENGINE, OCR_LANG, tesseract_config())
+    if key != _ocr_engine_key:
+        if _ocr_engine is not None and _ocr_engine_key[0] == key[0]:
+            _ocr_engine.close()
+        # Tesseract itself is stopped at OCR_TIMEOUT, so a stuck image does not hold the worker forever
+        _ocr_engine = create_engine(OCR_ENGINE, OCR_LANG, key[3], TESSDATA_DIR, OCR_TIMEOUT)
+        _ocr_engine_key = key
+        if _ocr_engine.fallback_reason:
+            print(f"OCR engine {OCR_ENGINE}: tesserocr unavailable, using pytesseract:", _ocr_engine.fallback_reason)
+    return _ocr_engine
+
+def run_tesseract(img):
+    """OCR payload of a prepared image: Tesseract TSV with word boxes when OCR_LAYOUT is on, else plain text."""
+    engine = get_ocr_engine()
+    return engine.image_to_data(img) if OCR_LAYOUT else engine.image_to_string(img)
+
+def ocr_image(img, timings=None):
+    """Preprocess and OCR an image. Returns (OCR payload, {stage: milliseconds}, decoded pixel count)."""
+    timings = dict(timings or {})
+    pixels = img.width * img.height
+    img, stage_times = prepare_image(img)
+    timings.update(stage_times)
+    start = time.perf_counter()
+    text = run_tesseract(img)
+    timings["tesseract"] = (time.perf_counter() - start) * 1000
+    return text, timings, pixels
+
+def ocr_image_bytes(data):
+    """Decode an in-memory image and run Tesseract on it (executed inside an OCR worker process)."""
+    start = time.perf_counter()
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    return ocr_image(img, {"decode": (time.perf_counter() - start) * 1000})
+
+def prepare_bands(data, count):
+    """
+    Decode and preprocess an image, then cut it into up to `count` bands for incremental OCR
+    (executed inside an OCR worker process). Returns ([(mode, size, pixels bytes)], {stage: milliseconds}, pixel count).
+    """
+    start = time.perf_counter()
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    timings = {"decode": (time.perf_counter() - start) * 1000}
+    pixels = img.width * img.height
+    img, stage_times = prepare_image(img)
+    timings.update(stage_times)
+    return [(band.mode, band.size, band.tobytes()) for band in split_bands(img, count)], timings, pixels
+
+def ocr_band(mode, size, data):
+    """Run Tesseract on one preprocessed band from prepare_bands (executed inside an OCR worker process)."""
+    img = Image.frombytes(mode, size, data)
+    start = time.perf_counter()
+    text = run_tesseract(img)
+    return text, {"tesseract": (time.perf_counter() - start) * 1000}, 0
+
+def ocr_config_signature():
+    return (
+        f"lang={OCR_LANG};config={tesseract_config()};steps={','.join(PREPROCESS_STEPS)};"
+        f"roi={OCR_ROI};max_dim={OCR_MAX_DIMENSION};dpi={OCR_TARGET_DPI};layout={int(OCR_LAYOUT)}"
+    )
+
+def read_ocr_output(payload):
+    """
+    (text, rows) of an OCR payload. TSV payloads give their words clustered into table rows
+    (several TSV blocks are separated by form feeds, see join_ocr_output); plain text has no rows.
+    """
+    if not is_tsv(payload):
+        return payload, []
+    texts, rows = [], []
+    for part in payload.split("\f"):
+        text, words = parse_tsv(part)
+        texts.append(text)
+        rows.extend(group_rows(words))
+    return "\n".join(texts), rows
+
+def join_ocr_output(payloads):
+    """One payload for consecutive blocks of a page (e.g. OCR bands) that read_ocr_output splits again."""
+    return ("\f" if any(is_tsv(p) for p in payloads) else "\n").join(payloads)
+
+# ---------------------------
+# PDF ingestion
+# ---------------------------
+
+def is_pdf(data):
+    return data[:1024].lstrip().startswith(b"%PDF-")
+
+def write_temp_pdf(data):
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return path
+
+def load_pymupdf():
+    """
+    The pymupdf module (PDF text extraction and rasterization), imported on first use rather than
+    with main, since it adds about a tenth of a second to every worker's start. Raises 415 if missing.
+    """
+    try:
+        import pymupdf
+    except ImportError:
+        raise HTTPException(status_code=415, detail="PDF support is not installed on this server (pip install pymupdf).")
+    return pymupdf
+
+def pdf_text_layer(path):
+    """
+    Return the embedded text of every page of a PDF.
+    Pages with fewer than PDF_MIN_TEXT_CHARS non-space characters come back as None (they need OCR).
+    """
+    pymupdf = load_pymupdf()
+    try:
+        doc = pymupdf.open(path, filetype="pdf")
+    except Exception:
+        raise HTTPException(status_code=400, detail="Could not read PDF.")
+    with doc:
+        if doc.needs_pass:
+            raise HTTPException(status_code=400, detail="Encrypted PDFs are not supported.")
+        if doc.page_count > MAX_PDF_PAGES:
+            raise HTTPException(status_code=413, detail=f"PDF exceeds {MAX_PDF_PAGES} pages.")
+        texts = []
+        for page in doc:
+            text = page.get_text()
+            texts.append(text if len("".join(text.split())) >= PDF_MIN_TEXT_CHARS else None)
+    return texts
+
+def ocr_pdf_page(path, index, dpi):
+    """Rasterize a single PDF page and run Tesseract on it (executed inside an OCR worker process)."""
+    start = time.perf_counter()
+    pymupdf = load_pymupdf()
+    with pymupdf.open(path, filetype="pdf") as doc:
+        page = doc[index]
+        scale = dpi / 72
+        pixels = page.rect.width * page.rect.height * scale * scale
+        if pixels > MAX_IMAGE_PIXELS:
+            scale *= (MAX_IMAGE_PIXELS / pixels) ** 0.5
+        pix = page.get_pixmap(matrix=pymupdf.Matrix(scale, scale), colorspace=pymupdf.csRGB, alpha=False)
+        img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    return ocr_image(img, {"rasterize": (time.perf_counter() - start) * 1000})
+
+async def iter_pdf_pages(data, digest):
+    """
+    Yield the text of each PDF page, in page order, as {"pdf_page", "source", "raw_text", "rows", "timings_ms"}:
+    "text" pages come from the embedded text layer, "ocr" pages are rasterized at PDF_DPI and
+    OCR'd (all pages are started at once, at most `ocr_slots` at a time). "rows" holds the OCR word
+    boxes grouped into table rows (empty for text-layer pages and plain-text OCR).
+    """
+    path = await run_in_threadpool(write_temp_pdf, data)
+    tasks = []
+    try:
+        layer = await run_in_threadpool(pdf_text_layer, path)
+
+        async def page_text(index, text):
+            if text is not None:
+                return {"pdf_page": index + 1, "source": "text", "raw_text": text, "rows": [], "timings_ms": {}}
+            key = cache_key(f"{digest}:page{index}:dpi{PDF_DPI}", ocr_config_signature())
+            async with ocr_slots:
+                payload, timings = await ocr_cached(key, ocr_pdf_page, path, index, PDF_DPI)
+            text, rows = read_ocr_output(payload)
+            return {"pdf_page": index + 1, "source": "ocr", "raw_text": text, "rows": rows, "timings_ms": timings}
+
+        tasks = [asyncio.ensure_future(page_text(i, text)) for i, text in enumerate(layer)]
+        for task in tasks:
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        os.remove(path)
+
+async def extract_pdf_pages(data, digest):
+    """Text of every PDF page (see iter_pdf_pages)."""
+    return [page async for page in iter_pdf_pages(data, digest)]
+
+# ---------------------------
+# Upload endpoint
+# ---------------------------
+
+async def cached_text(key):
+    """OCR text cached under key, or None. A cache that cannot be read counts as a miss."""
+    if ocr_cache is None:
+        return None
+    with timed_stage("cache"):
+        try:
+            cached = await run_in_threadpool(ocr_cache.get, key)
+        except sqlite3.Error as e:
+            print("OCR cache lookup failed:", e)
+            metrics.OCR_CACHE_LOOKUPS.labels("error").inc()
+            return None
+    metrics.OCR_CACHE_LOOKUPS.labels("miss" if cached is None else "hit").inc()
+    return cached
+
+async def cache_text(key, text):
+    """Cache OCR text under key; a failed write is logged and skipped, the text is still used."""
+    if ocr_cache is None:
+        return
+    try:
+        await run_in_threadpool(ocr_cache.put, key, text)
+    except sqlite3.Error as e:
+        print("OCR cache write failed:", e)
+
+async def run_ocr_step(func, *args):
+    """
+    run_ocr_job with the endpoints' error handling: a saturated pool or a worker that died twice
+    becomes 503, a timeout 504, a file that is not a readable image 422, and any other OCR
+    failure 500. A failed OCR never passes for a report with no findings.
+    Stage timings measured in the worker are recorded in the metrics of this process.
+    """
+    start = time.perf_counter()
+    try:
+        result = await run_ocr_job(func, *args)
+    except OCRPoolBusy:
+        metrics.OCR_REJECTED.inc()
+        raise ocr_busy_error()
+    except BrokenProcessPool:
+        metrics.OCR_FAILURES.labels("BrokenProcessPool").inc()
+        raise HTTPException(
+            status_code=503, detail="An OCR worker crashed, please retry.", headers={"Retry-After": str(OCR_RETRY_AFTER)}
+        )
+    except (asyncio.TimeoutError, OCRTimeout):
+        metrics.OCR_FAILURES.labels("TimeoutError").inc()
+        raise HTTPException(status_code=504, detail=f"OCR did not finish within {OCR_TIMEOUT:g} seconds.")
+    except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+        metrics.OCR_FAILURES.labels(type(e).__name__).inc()
+        raise HTTPException(status_code=422, detail="The file could not be read as an image.")
     except Exception as e:
-        extracted_text = ""
+        metrics.OCR_FAILURES.labels(type(e).__name__).inc()
         print("OCR error:", e)
+        raise HTTPException(status_code=500, detail=f"OCR failed ({type(e).__name__}).")
+    finally:
+        # wall time of the job as seen by the request, queueing in the pool included
+        record_stage("ocr", time.perf_counter() - start)
+    _, timings, pixels = result
+    metrics.OCR_PIXELS.inc(pixels)
+    for stage, ms in timings.items():
+        record_stage(stage, ms / 1000)
+    return result
 
-    # detect gender via OCR unless user provided an explicit gender
-    detected_gender = "unknown"
-    gender_source = "none"
-    if user_gender and user_gender.lower() in ("male", "female"):
-        detected_gender = user_gender.lower()
-        gender_source = "user"
-    else:
-        detected_gender, gender_source = detect_gender_from_text(extracted_text)
+async def ocr_cached(key, func, *args):
+    """
+    Run an OCR job in the pool, reusing output cached under key.
+    Returns (OCR payload, per-stage milliseconds); cache hits have no stage timings.
+    """
+    cached = await cached_text(key)
+    if cached is not None:
+        return cached, {}
+    extracted_text, timings, _ = await run_ocr_step(func, *args)
+    await cache_text(key, extracted_text)
+    return extracted_text, timings
 
-    # parse values using gender-aware thresholds
-    parsed_results = parse_medical_report(extracted_text, gender=detected_gender)
+async def extract_pages(data, digest):
+    """
+    Text of one uploaded file as a list of pages: a single OCR'd page for an image,
+    one entry per page for a PDF.
+    """
+    if is_pdf(data):
+        return await extract_pdf_pages(data, digest)
+    async with ocr_slots:
+        payload, timings = await ocr_cached(cache_key(digest, ocr_config_signature()), ocr_image_bytes, data)
+    text, rows = read_ocr_output(payload)
+    return [{"source": "ocr", "raw_text": text, "rows": rows, "timings_ms": timings}]
 
-    # optional summary
+def total_timings(pages):
+    """Sum per-stage OCR milliseconds over pages."""
+    totals = {}
+    for page in pages:
+        for stage, ms in page.get("timings_ms", {}).items():
+            totals[stage] = round(totals.get(stage, 0) + ms, 2)
+    return totals
+
+def page_parts(pages, key="raw_text"):
+    """[(text, word rows)] of pages (or streamed blocks, key="text") for scan_report."""
+    return [(page[key], page.get("rows", ())) for page in pages]
+
+def without_rows(entry):
+    """A page or block as sent to clients: its word rows are only needed for parsing."""
+    return {key: value for key, value in entry.items() if key != "rows"}
+
+def resolve_gender(user_gender, scan):
+    """Use an explicit user gender when given, otherwise the one read from the report header (see scan_report)."""
+    if user_gender and user_gender.lower() in ("male", "female"):
+        return user_gender.lower(), "user"
+    if not scan.text:
+        return "unknown", "none"
+    return scan.gender, "ocr"
+
+def summarize(parsed_results):
     issues = []
     for p, info in parsed_results.items():
         if info.get("meaning") and info["meaning"] != "Within normal range.":
             issues.append(f"{p}: {info['meaning']}")
 
-    summary = "All parameters are within normal ranges." if not issues else "Issues: " + "; ".join(issues)
+    if not parsed_results:
+        return "No known parameters were found in the report."
+    return "All parameters are within normal ranges." if not issues else "Issues: " + "; ".join(issues)
 
-    return {
-        "filename": file.filename,
+def persist_upload(background_tasks, filename, data, digest):
+    """Schedule a copy of the upload in the upload store, written after the response is sent."""
+    if upload_store is not None:
+        background_tasks.add_task(write_upload, data, digest, filename)
+
+def parse_date(value, field):
+    """ISO date (YYYY-MM-DD) of a request field, or None when it is empty; 422 when it is not a date."""
+    if not value or not value.strip():
+        return None
+    try:
+        return date.fromisoformat(value.strip()).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"{field} must be a date as YYYY-MM-DD.")
+
+def history_entry(patient_id, report_date):
+    """
+    (patient id, report date) under which a report's results go into the patient history,
+    or None when no patient_id was sent (or the history is disabled). The date defaults to today.
+    """
+    if history_store is None or not patient_id or not patient_id.strip():
+        return None
+    patient_id = patient_id.strip()
+    if len(patient_id) > PATIENT_ID_MAX_CHARS:
+        raise HTTPException(status_code=422, detail=f"patient_id is longer than {PATIENT_ID_MAX_CHARS} characters.")
+    return patient_id, parse_date(report_date, "report_date") or date.today().isoformat()
+
+def record_history(entry, filename, response):
+    """Queue the parsed results of a report for the patient history; they are written in the background."""
+    if entry is None or history_store is None:
+        return
+    parsed = response["parsed_results"]
+    params = list(parsed)
+    values = [parsed[p]["value"] for p in params]
+    gender = response["detected_gender"]
+    codes = catalog.classifier.classify_named(params, values, [gender] * len(params))
+    flags = [CLASS_LABELS[code] for code in codes.tolist()]
+    history_store.add(entry[0], entry[1], zip(params, values, flags), filename, gender)
+
+async def analyze_report(data, digest, filename, user_gender=None):
+    """OCR (or read the text layer of) one uploaded file and parse it; returns the /upload response."""
+    # reuse OCR text of an identical image, otherwise OCR in the worker pool
+    pages = await extract_pages(data, digest)
+    return report_response(filename, pages, user_gender, is_pdf(data))
+
+def report_response(filename, pages, user_gender, pdf):
+    """Detect gender in and parse the text of the extracted pages; returns the /upload response."""
+    extracted_text = "\n".join(page["raw_text"] for page in pages)
+
+    # one pass over the text finds the parameter aliases and the patient header
+    with timed_stage("scan"):
+        scan = scan_report(page_parts(pages))
+
+    # use the gender read from the header unless user provided an explicit gender
+    detected_gender, gender_source = resolve_gender(user_gender, scan)
+
+    # parse values using gender-aware thresholds
+    with timed_stage("parse"):
+        parsed_results = parse_report(scan, gender=detected_gender)
+    metrics.PARAMETERS_FOUND.observe(len(parsed_results))
+
+    # optional summary
+    summary = summarize(parsed_results)
+
+    response = {
+        "filename": filename,
         "detected_gender": detected_gender,
         "gender_source": gender_source,
+        "detected_age": scan.age,
         "raw_text": extracted_text,
         "parsed_results": parsed_results,
-        "summary": summary
+        "summary": summary,
+        "timings_ms": total_timings(pages)
     }
+    if pdf:
+        response["pages"] = [{"page": page["pdf_page"], "source": page["source"]} for page in pages]
+    return response
+
+@app.post("/upload")
+async def upload_report(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    user_gender: str = Form(None),
+    patient_id: str = Form(None),
+    report_date: str = Form(None),
+):
+    """
+    Accepts uploaded image or PDF and optional form field 'user_gender' (male/female).
+    Returns extracted raw_text, detected gender, parsed_results.
+    For PDFs, 'pages' tells which pages were read from the text layer and which were OCR'd.
+    With 'patient_id' the results are added to that patient's history, dated 'report_date' (YYYY-MM-DD, default today).
+    """
+    entry = history_entry(patient_id, report_date)
+    with timed_stage("read"):
+        data, digest = await read_upload(file)
+
+    # keep a copy on disk without holding up the response
+    persist_upload(background_tasks, file.filename, data, digest)
+
+    response = await analyze_report(data, digest, file.filename, user_gender)
+    record_history(entry, file.filename, response)
+    return response
+
+# ---------------------------
+# Streaming upload endpoint
+# ---------------------------
+
+async def iter_image_bands(data, digest):
+    """
+    Yield ("stage", info) and ("text", block) events for an image. Cached text comes back as one
+    block; otherwise the preprocessed page is cut into STREAM_BANDS bands that are OCR'd in
+    parallel and yielded in reading order as each one finishes.
+    """
+    signature = ocr_config_signature()
+    band_key = cache_key(f"{digest}:bands{STREAM_BANDS}", signature)
+    for key in (cache_key(digest, signature), band_key):
+        payload = await cached_text(key)
+        if payload is not None:
+            text, rows = read_ocr_output(payload)
+            yield "text", {"page": 1, "block": 1, "source": "ocr", "text": text, "rows": rows, "timings_ms": {}}
+            return
+
+    yield "stage", {"stage": "preprocess"}
+    async with ocr_slots:
+        bands, prep_timings, _ = await run_ocr_step(prepare_bands, data, STREAM_BANDS)
+    yield "stage", {"stage": "ocr", "blocks": len(bands)}
+
+    async def band_text(band):
+        async with ocr_slots:
+            return await run_ocr_step(ocr_band, *band)
+
+    tasks = [asyncio.ensure_future(band_text(band)) for band in bands]
+    payloads = []
+    try:
+        for i, task in enumerate(tasks):
+            payload, timings, _ = await task
+            if i == 0:
+                timings = {**prep_timings, **timings}
+            payloads.append(payload)
+            text, rows = read_ocr_output(payload)
+            yield "text", {"page": 1, "block": i + 1, "source": "ocr", "text": text, "rows": rows, "timings_ms": timings}
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    await cache_text(band_key, join_ocr_output(payloads))
+
+async def iter_blocks(data, digest):
+    """Text of an upload as ("stage" | "text", payload) events, blocks in reading order."""
+    if is_pdf(data):
+        yield "stage", {"stage": "ocr"}
+        async for page in iter_pdf_pages(data, digest):
+            yield "text", {
+                "page": page["pdf_page"], "block": 1, "source": page["source"],
+                "text": page["raw_text"], "rows": page["rows"], "timings_ms": page["timings_ms"],
+            }
+    else:
+        async for event in iter_image_bands(data, digest):
+            yield event
+
+def sse_event(name, payload):
+    return f"event: {name}\ndata: {json.dumps(payload)}\n\n"
+
+def blocks_to_pages(blocks, pdf):
+    """Merge streamed blocks back into the page list report_response expects."""
+    pages = {}
+    for block in blocks:
+        page = pages.setdefault(block["page"], {"source": block["source"], "texts": [], "rows": [], "timings_ms": {}})
+        page["texts"].append(block["text"])
+        page["rows"].extend(block["rows"])
+        for stage, ms in block["timings_ms"].items():
+            page["timings_ms"][stage] = page["timings_ms"].get(stage, 0) + ms
+    merged = []
+    for number, page in pages.items():
+        entry = {
+            "source": page["source"], "raw_text": "\n".join(page["texts"]), "rows": page["rows"],
+            "timings_ms": page["timings_ms"],
+        }
+        if pdf:
+            entry["pdf_page"] = number
+        merged.append(entry)
+    return merged
+
+async def report_events(data, digest, filename, user_gender, entry=None):
+    """
+    Server-sent events for one report: "stage" progress, "text" per OCR block, "gender",
+    "parameter" whenever a parameter is resolved (or its value changes as more text arrives),
+    then "result" with the same body as /upload, or "error" with status and detail.
+    """
+    start = time.perf_counter()
+
+    def event(name, payload):
+        return sse_event(name, {**payload, "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)})
+
+    pdf = is_pdf(data)
+    yield event("stage", {"stage": "received", "bytes": len(data)})
+    blocks = []
+    gender = None
+    emitted = {}
+    try:
+        async for kind, payload in iter_blocks(data, digest):
+            if kind == "stage":
+                yield event("stage", payload)
+                continue
+            blocks.append(payload)
+            yield event("text", without_rows(payload))
+            # parse the text received so far; the final result re-parses the whole report
+            scan = scan_report(page_parts(blocks, "text"))
+            detected_gender, gender_source = resolve_gender(user_gender, scan)
+            if detected_gender != gender:
+                gender = detected_gender
+                yield event("gender", {"detected_gender": detected_gender, "gender_source": gender_source})
+            for name, info in parse_report(scan, gender=detected_gender).items():
+                if emitted.get(name) != info:
+                    emitted[name] = info
+                    yield event("parameter", {"name": name, **info})
+    except HTTPException as e:
+        yield event("error", {"status": e.status_code, "detail": e.detail})
+        return
+    yield event("stage", {"stage": "parse"})
+    response = report_response(filename, blocks_to_pages(blocks, pdf), user_gender, pdf)
+    record_history(entry, filename, response)
+    yield event("result", response)
+
+@app.post("/upload/stream")
+async def upload_stream(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    user_gender: str = Form(None),
+    patient_id: str = Form(None),
+    report_date: str = Form(None),
+):
+    """
+    Same input as /upload, answered as a text/event-stream: progress, OCR text and parameters
+    are pushed as soon as they are known, and the last event carries the full /upload response.
+    """
+    entry = history_entry(patient_id, report_date)
+    with timed_stage("read"):
+        data, digest = await read_upload(file)
+    persist_upload(background_tasks, file.filename, data, digest)
+    return StreamingResponse(
+        report_events(data, digest, file.filename, user_gender, entry),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# ---------------------------
+# Batch upload endpoint
+# ---------------------------
+
+def unpack_zip_pages(data, limit=MAX_BATCH_BYTES):
+    """
+    Return [(filename, bytes, sha256 hex digest)] for the files inside a zip, in name order.
+    Entries are size-checked from the zip directory before they are inflated, each against
+    MAX_UPLOAD_BYTES and all together against limit.
+    """
+    pages = []
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid zip archive.")
+    with archive:
+        entries = sorted((i for i in archive.infolist() if not i.is_dir()), key=lambda i: i.filename)
+        if len(entries) > MAX_BATCH_PAGES:
+            raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_PAGES} pages.")
+        total = 0
+        for info in entries:
+            if info.file_size > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail=f"{info.filename} exceeds {MAX_UPLOAD_BYTES} bytes.")
+            total += info.file_size
+            if total > limit:
+                raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_BYTES} bytes once unpacked.")
+            try:
+                page = archive.read(info)  # never inflates past info.file_size
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"{info.filename} is corrupt in the zip archive.")
+            except NotImplementedError:
+                raise HTTPException(status_code=400, detail=f"{info.filename} uses an unsupported zip compression method.")
+            except RuntimeError:
+                raise HTTPException(status_code=400, detail=f"{info.filename} is encrypted in the zip archive.")
+            check_pixel_budget(page)
+            pages.append((os.path.basename(info.filename), page, hashlib.sha256(page).hexdigest()))
+    return pages
+
+@app.post("/upload/batch")
+async def upload_batch(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    user_gender: str = Form(None),
+    patient_id: str = Form(None),
+    report_date: str = Form(None),
+):
+    """
+    Accepts several page images or PDFs, or zip archives of them, for one report.
+    Pages are OCR'd in parallel, their text is merged in upload order and parsed once.
+    Returns per-page raw_text plus the combined detected gender, parsed_results and summary.
+    'patient_id' and 'report_date' add the report to the patient history as with /upload.
+    """
+    entry = history_entry(patient_id, report_date)
+    uploads = []
+    for file in files:
+        with timed_stage("read"):
+            data, digest = await read_upload(file)
+        if file.filename.lower().endswith(".zip") or zipfile.is_zipfile(io.BytesIO(data)):
+            unpacked = MAX_BATCH_BYTES - sum(len(page) for _, page, _ in uploads)
+            uploads.extend(await run_in_threadpool(unpack_zip_pages, data, unpacked))
+        else:
+            uploads.append((file.filename, data, digest))
+        if len(uploads) > MAX_BATCH_PAGES:
+            raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_PAGES} pages.")
+
+    for filename, data, digest in uploads:
+        persist_upload(background_tasks, filename, data, digest)
+
+    extracted = await asyncio.gather(*(extract_pages(data, digest) for _, data, digest in uploads))
+
+    pages = []
+    for (filename, _, _), file_pages in zip(uploads, extracted):
+        for page in file_pages:
+            pages.append({"page": len(pages) + 1, "filename": filename, **page})
+    with timed_stage("scan"):
+        scan = scan_report(page_parts(pages))
+    detected_gender, gender_source = resolve_gender(user_gender, scan)
+    with timed_stage("parse"):
+        parsed_results = parse_report(scan, gender=detected_gender)
+    metrics.PARAMETERS_FOUND.observe(len(parsed_results))
+
+    response = {
+        "pages": [without_rows(page) for page in pages],
+        "detected_gender": detected_gender,
+        "gender_source": gender_source,
+        "detected_age": scan.age,
+        "parsed_results": parsed_results,
+        "summary": summarize(parsed_results)
+    }
+    record_history(entry, files[0].filename, response)
+    return response
+
+# ---------------------------
+# Asynchronous jobs
+# ---------------------------
+
+job_wakeup = None  # asyncio.Event set when a job is submitted (created with the app's event loop)
+_callback_tasks = set()  # callback deliveries in flight (kept referenced until they finish)
+
+async def start_job_workers():
+    """Start JOB_WORKERS queue consumers (they requeue jobs whose lease expired, see recover_jobs)."""
+    global job_wakeup
+    if job_store is None:
+        return []
+    job_wakeup = asyncio.Event()
+    return [asyncio.create_task(job_worker()) for _ in range(JOB_WORKERS)]
+
+async def stop_job_workers(tasks):
+    """Cancel the workers and hand the jobs they were running back to the queue."""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, *_callback_tasks, return_exceptions=True)
+    if job_store is not None:
+        released = await run_in_threadpool(job_store.release)
+        if released:
+            print(f"Requeued {released} unfinished job(s)")
+
+async def recover_jobs():
+    """Requeue jobs left running by a process that died (their lease expired)."""
+    recovered = await run_in_threadpool(job_store.recover)
+    if recovered:
+        print(f"Requeued {recovered} interrupted job(s)")
+
+async def keep_lease(job_id):
+    """Renew a running job's lease until cancelled, so no other process takes it over."""
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        if not await run_in_threadpool(job_store.renew, job_id):
+            return
+
+async def job_worker():
+    last_purge = last_recover = 0.0
+    while True:
+        job_wakeup.clear()
+        if time.time() - last_recover > JOB_LEASE_SECONDS:
+            last_recover = time.time()
+            await recover_jobs()
+        job = await run_in_threadpool(job_store.claim)
+        if job is None:
+            if time.time() - last_purge > 3600:
+                last_purge = time.time()
+                await run_in_threadpool(job_store.purge, last_purge - JOB_RETENTION_HOURS * 3600)
+            try:
+                await asyncio.wait_for(job_wakeup.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        job_wakeup.set()  # there may be more queued work for idle workers
+        await run_job(job)
+
+async def run_job(job):
+    """
+    Process a claimed job like /upload would, renewing its lease meanwhile, then store the
+    outcome and notify the callback. A job whose lease was lost to another process is dropped.
+    """
+    result = error = None
+    lease = asyncio.create_task(keep_lease(job["id"]))
+    try:
+        result = await analyze_report(job["data"], job["digest"], job["filename"], job["user_gender"])
+    except HTTPException as e:
+        if e.status_code == 503:
+            # OCR pool saturated (interactive uploads come first): back off and retry later
+            lease.cancel()
+            await run_in_threadpool(job_store.requeue, job["id"])
+            await asyncio.sleep(OCR_RETRY_AFTER)
+            return
+        error = str(e.detail)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        lease.cancel()
+    if not await run_in_threadpool(job_store.finish, job["id"], result, error):
+        print(f"Job {job['id']} was taken over by another worker, dropping this run")
+        return
+    if result is not None and job["patient_id"]:
+        record_history((job["patient_id"], job["report_date"]), job["filename"], result)
+    if result is not None and upload_store is not None:
+        await run_in_threadpool(write_upload, job["data"], job["digest"], job["filename"])
+    metrics.JOBS_FINISHED.labels("failed" if error else "done").inc()
+    if job["callback_url"]:
+        task = asyncio.create_task(notify_callback(job["id"], job["callback_url"]))
+        _callback_tasks.add(task)
+        task.add_done_callback(_callback_tasks.discard)
+
+def check_callback_url(url):
+    """
+    Raise ValueError unless job results may be POSTed to url: an http(s) URL whose host is in
+    JOB_CALLBACK_HOSTS or, when that is unset, resolves to public addresses only. Loopback,
+    private, link-local (cloud metadata) and reserved addresses are refused, so a client cannot
+    make the server send patient data to itself or to its internal network. Returns the checked
+    address to connect to, or None for a JOB_CALLBACK_HOSTS host (not resolved here).
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("callback_url must be an http(s) URL.")
+    host = parts.hostname.lower()
+    if JOB_CALLBACK_HOSTS:
+        if host not in JOB_CALLBACK_HOSTS:
+            raise ValueError("callback_url host is not allowed on this server.")
+        return
+    try:
+        infos = socket.getaddrinfo(host, parts.port or (443 if parts.scheme == "https" else 80), type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError, ValueError):
+        raise ValueError("callback_url host cannot be resolved.")
+    for *_, sockaddr in infos:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise ValueError("callback_url must point to a public address.")
+    return infos[0][4][0]
+
+class RefuseRedirects(urllib.request.HTTPRedirectHandler):
+    """Callbacks are not redirected: a checked public URL could otherwise forward the POST to an internal one."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+def pinned_connection(connection_class, address):
+    """
+    Factory of connection_class (an http.client connection) instances that connect to address
+    whatever their host name resolves to by then; the name is still sent as Host and TLS SNI.
+    """
+    def connection(host, **kwargs):
+        conn = connection_class(host, **kwargs)
+        conn._create_connection = lambda host_port, *args: socket.create_connection((address, host_port[1]), *args)
+        return conn
+    return connection
+
+class PinnedHTTPHandler(urllib.request.HTTPHandler):
+    def __init__(self, address):
+        super().__init__()
+        self.address = address
+
+    def http_open(self, req):
+        return self.do_open(pinned_connection(http.client.HTTPConnection, self.address), req)
+
+class PinnedHTTPSHandler(urllib.request.HTTPSHandler):
+    def __init__(self, address):
+        super().__init__()
+        self.address = address
+
+    def https_open(self, req):
+        return self.do_open(pinned_connection(http.client.HTTPSConnection, self.address), req, context=self._context)
+
+callback_opener = urllib.request.build_opener(RefuseRedirects)
+
+def post_callback(url, payload):
+    """
+    POST payload as JSON to url; returns the HTTP status (errors raise). The URL is checked again
+    first (DNS may have changed), and the request goes to the address that passed the check, not
+    through a proxy and not to whatever a second lookup of the host name returns.
+    """
+    address = check_callback_url(url)
+    opener = callback_opener
+    if address is not None:
+        opener = urllib.request.build_opener(
+            RefuseRedirects, urllib.request.ProxyHandler({}), PinnedHTTPHandler(address), PinnedHTTPSHandler(address)
+        )
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"}, method="POST"
+    )
+    with opener.open(request, timeout=JOB_CALLBACK_TIMEOUT) as response:
+        return response.status
+
+async def notify_callback(job_id, url):
+    """Send the finished job (same body as GET /jobs/{id}) to its callback URL, retrying with backoff."""
+    payload = await run_in_threadpool(job_store.get, job_id)
+    outcome = "failed"
+    for attempt in range(JOB_CALLBACK_RETRIES):
+        try:
+            status = await run_in_threadpool(post_callback, url, payload)
+            outcome = f"delivered ({status})"
+            break
+        except Exception as e:
+            outcome = f"failed: {e}"
+            if attempt + 1 < JOB_CALLBACK_RETRIES:
+                await asyncio.sleep(2 ** attempt)
+    await run_in_threadpool(job_store.set_callback_status, job_id, outcome)
+
+def jobs_enabled():
+    if job_store is None:
+        raise HTTPException(status_code=404, detail="The job queue is disabled on this server.")
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    file: UploadFile = File(...),
+    user_gender: str = Form(None),
+    priority: int = Form(0),
+    callback_url: str = Form(None),
+    patient_id: str = Form(None),
+    report_date: str = Form(None),
+):
+    """
+    Queue an image or PDF for processing and return its job id at once.
+    Higher priority jobs run first. When callback_url is given, the finished job is POSTed to it as JSON
+    (public hosts only, or those in JOB_CALLBACK_HOSTS; see check_callback_url).
+    Poll GET /jobs/{id} for the status; its result has the same shape as the /upload response.
+    'patient_id' and 'report_date' add the finished report to the patient history as with /upload.
+    """
+    jobs_enabled()
+    entry = history_entry(patient_id, report_date) or (None, None)
+    if callback_url:
+        try:
+            await run_in_threadpool(check_callback_url, callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    if await run_in_threadpool(job_store.count, QUEUED) >= JOB_MAX_QUEUED:
+        raise HTTPException(
+            status_code=503,
+            detail="The job queue is full, please retry later.",
+            headers={"Retry-After": str(OCR_RETRY_AFTER)},
+        )
+    with timed_stage("read"):
+        data, digest = await read_upload(file)
+    job_id = await run_in_threadpool(
+        job_store.submit, data, digest, file.filename, user_gender, priority, callback_url, *entry
+    )
+    if job_wakeup is not None:
+        job_wakeup.set()
+    return {"id": job_id, "status": QUEUED, "status_url": f"/jobs/{job_id}"}
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Status of a job (queued / running / done / failed), its queue position while queued, and the result once done."""
+    jobs_enabled()
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id.")
+    return job
+
+# ---------------------------
+# Patient history
+# ---------------------------
+
+def history_enabled():
+    if history_store is None:
+        raise HTTPException(status_code=404, detail="Patient history is disabled on this server.")
+
+def require_history_token(authorization: str = Header(None)):
+    """Dependency of the /patients endpoints: the request must carry the HISTORY_API_TOKEN bearer token."""
+    history_enabled()
+    if not HISTORY_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Patient history reads need HISTORY_API_TOKEN to be set on the server.")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), HISTORY_API_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Missing or invalid bearer token.", headers={"WWW-Authenticate": "Bearer"})
+
+def clamp_limit(limit):
+    return max(1, min(limit, HISTORY_MAX_ROWS))
+
+def canonical_param(param):
+    """Catalog spelling of a parameter name given in any case; unknown names are kept as given (older catalogs)."""
+    wanted = param.strip().lower()
+    return next((name for name in catalog.names if name.lower() == wanted), param.strip())
+
+async def history_query(method, patient_id, *args):
+    """Run a HistoryStore query off the event loop; 404 for patients (or reports) the history does not know."""
+    history_enabled()
+    with timed_stage("history"):
+        result = await run_in_threadpool(method, patient_id, *args)
+    if result is None:
+        raise HTTPException(status_code=404, detail="No stored reports for this patient.")
+    return result
+
+@app.get("/patients/{patient_id}/reports", dependencies=[Depends(require_history_token)])
+async def patient_reports(patient_id: str, limit: int = 100):
+    """Stored reports of a patient, newest first."""
+    reports = await history_query(history_store.reports, patient_id, clamp_limit(limit))
+    return {"patient_id": patient_id, "reports": reports}
+
+@app.get("/patients/{patient_id}/trend", dependencies=[Depends(require_history_token)])
+async def patient_trend(patient_id: str, param: str, since: str = None, until: str = None, limit: int = HISTORY_MAX_ROWS):
+    """Values of one parameter across a patient's reports, oldest first, optionally within since/until (YYYY-MM-DD)."""
+    param = canonical_param(param)
+    points = await history_query(
+        history_store.trend, patient_id, param, parse_date(since, "since"), parse_date(until, "until"), clamp_limit(limit)
+    )
+    return {"patient_id": patient_id, "param": param, "points": points}
+
+@app.get("/patients/{patient_id}/out-of-range", dependencies=[Depends(require_history_token)])
+async def patient_out_of_range(
+    patient_id: str, param: str = None, since: str = None, until: str = None, limit: int = 100
+):
+    """Values flagged low or high in a patient's reports, newest first; optionally one parameter only."""
+    results = await history_query(
+        history_store.out_of_range, patient_id, canonical_param(param) if param else None,
+        parse_date(since, "since"), parse_date(until, "until"), clamp_limit(limit),
+    )
+    return {"patient_id": patient_id, "results": results}
+
+@app.get("/patients/{patient_id}/delta", dependencies=[Depends(require_history_token)])
+async def patient_delta(patient_id: str, report_id: int = None):
+    """Each parameter of a report (the latest by default) next to its value in the patient's previous report."""
+    delta = await history_query(history_store.delta, patient_id, report_id)
+    return {"patient_id": patient_id, **delta}
+
+@app.get("/history/stats")
+def history_stats():
+    """Patients and reports stored, and reports still waiting to be written."""
+    if history_store is None:
+        return {"enabled": False}
+    return {"enabled": True, **history_store.stats()}
+
+# ---------------------------
+# Catalog reload
+# ---------------------------
+
+_catalog_failed_mtime = None  # mtime of a catalog file that failed validation (not retried until it changes)
+
+def reload_catalog():
+    """
+    Load CATALOG_PATH and swap it in. Parses already running keep the catalog they started with.
+    Raises CatalogError (and keeps the current catalog) when the file is invalid.
+    """
+    global catalog
+    new = load_catalog(CATALOG_PATH)
+    new.warm()
+    old_whitelist = ocr_whitelist()
+    catalog = new
+    if ocr_whitelist() != old_whitelist:
+        # OCR workers build the Tesseract whitelist from their own copy of the catalog
+        recycle_ocr_pool()
+    return new
+
+async def watch_catalog():
+    """Reload the catalog whenever its file changes."""
+    global _catalog_failed_mtime
+    while True:
+        await asyncio.sleep(CATALOG_RELOAD_INTERVAL)
+        try:
+            mtime = os.stat(CATALOG_PATH).st_mtime_ns
+        except OSError:
+            continue
+        if mtime in (catalog.mtime, _catalog_failed_mtime):
+            continue
+        try:
+            new = await run_in_threadpool(reload_catalog)
+            metrics.CATALOG_RELOADS.labels("ok").inc()
+            print(f"Catalog {new.version} loaded ({len(new)} parameters)")
+        except CatalogError as e:
+            _catalog_failed_mtime = mtime
+            metrics.CATALOG_RELOADS.labels("invalid").inc()
+            print("Catalog reload failed, keeping version", catalog.version, "-", e)
+
+def catalog_info(cat):
+    return {
+        "version": cat.version,
+        "parameters": len(cat),
+        "source": cat.source,
+        "loaded_at": cat.loaded_at,
+    }
+
+@app.get("/catalog")
+def catalog_status():
+    """Version and size of the parameter catalog in use."""
+    return catalog_info(catalog)
+
+@app.post("/catalog/reload")
+async def catalog_reload():
+    """Reload the catalog file now. Returns 422 with the validation problems if it is invalid."""
+    try:
+        new = await run_in_threadpool(reload_catalog)
+    except CatalogError as e:
+        metrics.CATALOG_RELOADS.labels("invalid").inc()
+        raise HTTPException(status_code=422, detail=str(e))
+    metrics.CATALOG_RELOADS.labels("ok").inc()
+    return catalog_info(new)
+
+# ---------------------------
+# Startup and readiness
+# ---------------------------
+
+startup = {"ready": False, "tesseract": None, "error": None, "warmup_ms": {}}
+
+def set_ready(ready):
+    startup["ready"] = ready
+    metrics.READY.set(1 if ready else 0)
+
+def check_tesseract():
+    """
+    The OCR engine, with its version and languages (executed inside an OCR worker process).
+    The server process never loads the engine: a worker forked while one of its threads was
+    inside Tesseract's initialisation would inherit Tesseract's locks held, and hang on its
+    first image. Raises EngineUnavailable when it cannot OCR OCR_LANG.
+    """
+    return get_ocr_engine().describe()
+
+def warm_parser():
+    """Parse a small report naming every parameter once, so the first upload does not pay for lazy setup."""
+    cat = catalog
+    cat.warm()
+    lines = ["Patient Name: Jane Doe    Sex: Female    Age: 42 Years"]
+    lines += [f"{aliases[0]} 1.0" for aliases in cat.aliases]
+    lines.append("haemoglobln 13.5")  # the fuzzy alias lookup
+    scan = scan_report([("\n".join(lines), [])], cat)
+    summarize(parse_report(scan, resolve_gender(None, scan)[0]))
+
+def warm_ocr_worker():
+    """
+    Preprocess and OCR a small rendered line (executed inside an OCR worker process): the worker
+    is started and its OCR engine loaded before real uploads arrive.
+    """
+    img = Image.new("RGB", (480, 96), "white")
+    ImageDraw.Draw(img).text((16, 40), "Hemoglobin 13.5 g/dL", fill="black")
+    ocr_image(img)
+    return os.getpid()
+
+async def timed_startup_stage(stage, awaitable):
+    start = time.perf_counter()
+    result = await awaitable
+    seconds = time.perf_counter() - start
+    startup["warmup_ms"][stage] = round(seconds * 1000, 1)
+    metrics.STARTUP_SECONDS.labels(stage).set(seconds)
+    return result
+
+async def warm_up():
+    """
+    Startup phase, run beside the server as it starts: warm the parser, check Tesseract and its
+    language data, then run one OCR job per worker so the whole pool is started. The steps run
+    one after another, but the server is already up: job workers, the history writer and early
+    requests run meanwhile, and one of them may start the pool first. GET /ready answers 200
+    once everything succeeded; a failure is reported there and in the log.
+    """
+    try:
+        if STARTUP_WARMUP:
+            await timed_startup_stage("parser", run_in_threadpool(warm_parser))
+        startup["tesseract"] = await timed_startup_stage("tesseract", run_ocr_job(check_tesseract))
+        if STARTUP_WARMUP:
+            jobs = [run_ocr_job(warm_ocr_worker) for _ in range(OCR_WORKERS)]
+            await timed_startup_stage("ocr", asyncio.gather(*jobs))
+    except Exception as e:
+        startup["error"] = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+        print("Startup checks failed, not ready:", startup["error"])
+        return
+    set_ready(True)
+
+@app.get("/health")
+def health():
+    """Liveness: the process is serving requests (it may still be warming up, see /ready)."""
+    return {"status": "ok"}
+
+@app.get("/ready")
+def readiness():
+    """Readiness: 200 once the startup checks and warm-up have finished, else 503 (with the error, if any)."""
+    return JSONResponse(startup, status_code=200 if startup["ready"] else 503)
+
+# ---------------------------
+# Bulk classification endpoint
+# ---------------------------
+
+class ClassifyRequest(BaseModel):
+    params: List[str]
+    values: List[float]
+    genders: Optional[List[str]] = None  # one per value; when omitted `gender` applies to all
+    gender: str = "unknown"
+
+@app.post("/classify")
+def classify_bulk(request: ClassifyRequest):
+    """
+    Classify stored values against the same thresholds /upload uses.
+    Returns one of low / normal / high / no_range per value, plus counts.
+    """
+    if len(request.values) != len(request.params):
+        raise HTTPException(status_code=422, detail="params and values must have the same length.")
+    if request.genders is not None and len(request.genders) != len(request.params):
+        raise HTTPException(status_code=422, detail="genders must have one entry per value.")
+    classifier = catalog.classifier
+    param_ids = classifier.encode_params(request.params)
+    if (param_ids < 0).any():
+        unknown = sorted({p for p, i in zip(request.params, param_ids.tolist()) if i < 0})
+        raise HTTPException(status_code=422, detail=f"Unknown parameters: {', '.join(unknown[:10])}")
+    genders = classifier.encode_genders(request.genders) if request.genders is not None else gender_id(request.gender)
+    codes = classifier.classify(param_ids, request.values, genders)
+    import numpy as np  # loaded by the classifier by now; not at import time, see classify.py
+    labels = np.array(CLASS_LABELS)
+    counts = np.bincount(codes, minlength=len(CLASS_LABELS))
+    return {
+        "classes": labels[codes].tolist(),
+        "counts": dict(zip(CLASS_LABELS, counts.tolist()))
+    }
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counters and size of the OCR result cache."""
+    if ocr_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **ocr_cache.stats()}
+
+async def sweep_uploads():
+    """
+    Every UPLOAD_SWEEP_INTERVAL seconds, move flat files left in UPLOAD_DIR by older versions into
+    the upload store, recompress new images and apply the retention limits, off the event loop.
+    """
+    while True:
+        try:
+            done = await run_in_threadpool(upload_store.sweep, UPLOAD_DIR)
+        except Exception as e:
+            print("Upload sweep failed:", e)
+        else:
+            for action, count in done.items():
+                if count:
+                    metrics.UPLOAD_STORE_SWEPT.labels(action).inc(count)
+        await asyncio.sleep(UPLOAD_SWEEP_INTERVAL)
+
+@app.get("/uploads/stats")
+def upload_store_stats():
+    """Files and bytes in the upload store, deduplicated uploads, evictions and recompression savings."""
+    if upload_store is None:
+        return {"enabled": False}
+    return {"enabled": True, **upload_store.stats()}
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus metrics: stage latencies, in-flight requests, OCR queue, failures and volumes."""
+    body, content_type = metrics.render_metrics()
+    return Response(content=body, media_type=content_type)
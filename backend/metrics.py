@@ -0,0 +1,100 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# ---------------------------
+# Prometheus metrics
+# ---------------------------
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "deepdoc_stage_seconds", "Time spent in each pipeline stage.", ["stage"], buckets=STAGE_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    "deepdoc_request_seconds", "End-to-end request latency.", ["endpoint", "status"], buckets=STAGE_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge("deepdoc_requests_in_flight", "Requests currently being served.", ["endpoint"])
+OCR_JOBS_RUNNING = Gauge("deepdoc_ocr_jobs_running", "OCR jobs occupying a worker.")
+OCR_JOBS_QUEUED = Gauge("deepdoc_ocr_jobs_queued", "OCR jobs waiting for a free worker.")
+ADMISSION_ACTIVE = Gauge("deepdoc_admission_active", "Upload requests holding an admission slot.")
+ADMISSION_WAITING = Gauge("deepdoc_admission_waiting", "Upload requests waiting for an admission slot.")
+ADMISSION_LIMIT = Gauge("deepdoc_admission_limit", "Upload requests allowed to run at once.")
+ADMISSION_SERVICE_SECONDS = Gauge(
+    "deepdoc_admission_service_seconds", "Moving average of the time an upload request holds its slot."
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "deepdoc_admission_wait_seconds", "Time admitted upload requests waited for a slot.", buckets=STAGE_BUCKETS
+)
+ADMISSION_REJECTED = Counter(
+    "deepdoc_admission_rejected_total", "Requests refused by admission control, by reason.", ["reason"]
+)
+UPLOAD_BUFFERED_BYTES = Gauge("deepdoc_upload_buffered_bytes", "Bytes of upload bodies held in memory ahead of admission.")
+RATE_LIMITED_CLIENTS = Gauge("deepdoc_rate_limit_clients", "Clients with a tracked token bucket.")
+OCR_FAILURES = Counter("deepdoc_ocr_failures_total", "OCR jobs that failed, by exception type.", ["exception"])
+OCR_REJECTED = Counter("deepdoc_ocr_rejected_total", "OCR jobs refused because the pool was saturated.")
+OCR_CACHE_LOOKUPS = Counter("deepdoc_ocr_cache_lookups_total", "OCR cache lookups, by result (hit, miss or error).", ["result"])
+UPLOAD_BYTES = Counter("deepdoc_upload_bytes_total", "Bytes received in uploads.")
+UPLOAD_STORE_BYTES = Gauge("deepdoc_upload_store_bytes", "Bytes of uploads kept in the upload store.")
+UPLOADS_DEDUPLICATED = Counter("deepdoc_uploads_deduplicated_total", "Uploads not stored again because identical bytes were.")
+UPLOAD_STORE_SWEPT = Counter(
+    "deepdoc_upload_store_swept_total", "Files handled by the upload store sweeper, by action.", ["action"]
+)
+OCR_PIXELS = Counter("deepdoc_ocr_pixels_total", "Pixels of decoded images handed to OCR.")
+JOBS_QUEUED = Gauge("deepdoc_jobs_queued", "Asynchronous jobs waiting in the queue.")
+JOBS_FINISHED = Counter("deepdoc_jobs_finished_total", "Asynchronous jobs finished, by outcome.", ["status"])
+HISTORY_PENDING = Gauge("deepdoc_history_pending", "Reports waiting to be written to the patient history.")
+HISTORY_WRITE_FAILURES = Counter(
+    "deepdoc_history_write_failures_total", "Patient history batches that failed to write (they are retried)."
+)
+READY = Gauge("deepdoc_ready", "1 once startup checks and warm-up have finished (GET /ready answers 200).")
+STARTUP_SECONDS = Gauge("deepdoc_startup_seconds", "Time each startup stage took.", ["stage"])
+CATALOG_RELOADS = Counter("deepdoc_catalog_reloads_total", "Parameter catalog reloads, by outcome.", ["result"])
+PARAMETERS_FOUND = Histogram(
+    "deepdoc_parameters_found", "Parameters parsed per report.", buckets=(0, 1, 2, 5, 10, 15, 20, 25, 30, 40)
+)
+
+def render_metrics():
+    """Return (body, content type) in the Prometheus text exposition format."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+# ---------------------------
+# Per-request stage timing
+# ---------------------------
+
+_request_timer = ContextVar("request_timer", default=None)
+
+class StageTimer:
+    """Stage durations of one request, rendered as a Server-Timing header."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self):
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items())
+
+def start_request_timer():
+    """Attach a fresh StageTimer to the current request (tasks it spawns share it)."""
+    timer = StageTimer()
+    _request_timer.set(timer)
+    return timer
+
+def record_stage(stage, seconds):
+    """Observe a stage duration in the histogram and in the current request's timer, if any."""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    timer = _request_timer.get()
+    if timer is not None:
+        timer.add(stage, seconds)
+
+@contextmanager
+def timed_stage(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
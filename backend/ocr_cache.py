@@ -0,0 +1,96 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+
+def cache_key(digest, ocr_config):
+    """Cache key for an image: content hash plus the OCR settings that produced the text."""
+    return hashlib.sha256(f"{digest}|{ocr_config}".encode("utf-8")).hexdigest()
+
+
+class OCRCache:
+    """
+    Content-addressed store of OCR text in a local SQLite file.
+    Entries are evicted least-recently-used first once the stored text exceeds max_bytes.
+    The size is always summed from the table, so processes sharing the file hold it to one limit;
+    in WAL mode their readers do not block on a writer, and a writer waits up to busy_timeout
+    seconds for another before sqlite3.OperationalError. Safe to share between threads.
+    """
+
+    def __init__(self, path, max_bytes, busy_timeout=5.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_cache ("
+            " key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        # (last_used, size) lets SUM(size) scan the index instead of every cached text
+        self._db.execute("DROP INDEX IF EXISTS ocr_cache_last_used")
+        self._db.execute("CREATE INDEX IF NOT EXISTS ocr_cache_lru ON ocr_cache(last_used, size)")
+        self._db.commit()
+
+    def _total(self):
+        return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+
+    def get(self, key):
+        """Return cached text for key (refreshing its LRU position) or None."""
+        with self._lock:
+            row = self._db.execute("SELECT text FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE ocr_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, text):
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO ocr_cache (key, text, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, text, size, time.time()),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        excess = self._total() - self.max_bytes
+        while excess > 0:
+            rows = self._db.execute(
+                "SELECT key, size FROM ocr_cache ORDER BY last_used LIMIT 64"
+            ).fetchall()
+            if not rows:
+                return
+            for key, size in rows:
+                if excess <= 0:
+                    break
+                self._db.execute("DELETE FROM ocr_cache WHERE key = ?", (key,))
+                excess -= size
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM ocr_cache").fetchone()[0]
+            return {
+                "entries": entries,
+                "bytes": self._total(),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,192 @@
+import shlex
+import threading
+
+from layout import TSV_HEADER
+
+try:
+    import tesserocr  # Tesseract C API bindings: the engine stays loaded between images
+except ImportError:
+    tesserocr = None
+
+ENGINES = ("auto", "tesserocr", "pytesseract")
+BYTES_PER_PIXEL = {"L": 1, "RGB": 3, "RGBA": 4}
+tesseract_cmd = "tesseract"  # binary PytesseractEngine runs; set before OCR workers are forked so they inherit it
+
+
+class EngineUnavailable(Exception):
+    """An OCR engine cannot run here: not installed, no language data, or options it does not support."""
+
+
+class OCRTimeout(Exception):
+    """Tesseract did not finish an image within the engine's timeout and was stopped."""
+
+
+def parse_config(config):
+    """
+    (page segmentation mode, engine mode, {variable: value}) from Tesseract command line options.
+    Only --psm, --oem, --dpi and -c name=value are understood; anything else raises EngineUnavailable.
+    """
+    psm = oem = None
+    variables = {}
+    args = shlex.split(config)
+    for option, value in zip(args[::2], args[1::2] + [None] * (len(args) % 2)):
+        if value is None:
+            raise EngineUnavailable(f"option {option} has no value")
+        if option == "--psm":
+            psm = int(value)
+        elif option == "--oem":
+            oem = int(value)
+        elif option == "--dpi":
+            variables["user_defined_dpi"] = value
+        elif option == "-c" and "=" in value:
+            name, _, setting = value.partition("=")
+            variables[name] = setting
+        else:
+            raise EngineUnavailable(f"unsupported Tesseract option {option}")
+    return psm, oem, variables
+
+
+def load_pytesseract():
+    """pytesseract, imported on first use (it imports NumPy) and set to run tesseract_cmd."""
+    import pytesseract
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    return pytesseract
+
+
+class PytesseractEngine:
+    """
+    Runs the tesseract command once per image through pytesseract (image and output go through
+    temp files). A command still running after timeout seconds is killed.
+    """
+
+    name = "pytesseract"
+
+    def __init__(self, lang, config, fallback_reason=None, timeout=0):
+        self.lang = lang
+        self.config = config
+        self.fallback_reason = fallback_reason  # why the persistent engine is not used, if it was wanted
+        self.timeout = timeout
+        self._pytesseract = load_pytesseract()
+
+    def _run(self, func, img):
+        pytesseract = self._pytesseract
+        # pytesseract's own exceptions cannot be unpickled, and one raised in an OCR worker
+        # would break the whole process pool, so they are re-raised as plain exceptions
+        try:
+            return func(img, lang=self.lang, config=self.config, timeout=self.timeout)
+        except pytesseract.TesseractNotFoundError:
+            raise EngineUnavailable(f"Tesseract not found at {pytesseract.pytesseract.tesseract_cmd!r}") from None
+        except pytesseract.TesseractError as e:
+            raise RuntimeError(f"tesseract failed with status {e.status}: {e.message}") from None
+        except RuntimeError as e:
+            if str(e) == "Tesseract process timeout":
+                raise OCRTimeout(f"tesseract ran longer than {self.timeout:g} seconds") from None
+            raise
+
+    def image_to_string(self, img):
+        return self._run(self._pytesseract.image_to_string, img)
+
+    def image_to_data(self, img):
+        return self._run(self._pytesseract.image_to_data, img)
+
+    def describe(self):
+        """Binary, version and languages. Raises EngineUnavailable when it cannot OCR lang."""
+        pytesseract = self._pytesseract
+        cmd = pytesseract.pytesseract.tesseract_cmd
+        try:
+            version = str(pytesseract.get_tesseract_version())
+            languages = pytesseract.get_languages(config="")
+        except pytesseract.TesseractNotFoundError:
+            raise EngineUnavailable(f"Tesseract not found at {cmd!r}; install it or set TESSERACT_CMD")
+        missing = [lang for lang in self.lang.split("+") if lang not in languages]
+        if missing:
+            raise EngineUnavailable(f"Tesseract has no language data for {', '.join(missing)} (check TESSDATA_PREFIX)")
+        info = {"engine": self.name, "cmd": cmd, "version": version, "languages": languages}
+        if self.fallback_reason:
+            info["fallback_reason"] = self.fallback_reason
+        return info
+
+    def close(self):
+        pass
+
+
+class TesserocrEngine:
+    """
+    One Tesseract instance kept loaded through its C API (tesserocr). Language models are read
+    once, when the engine is created, and images are handed over as raw pixel buffers, so an
+    image costs only its recognition: no process start, model load or temp files per image.
+    Recognition is abandoned after timeout seconds. Create one per process; calls are serialized.
+    """
+
+    name = "tesserocr"
+    fallback_reason = None  # it is never the fallback
+
+    def __init__(self, lang, config, tessdata=None, timeout=0):
+        if tesserocr is None:
+            raise EngineUnavailable("tesserocr is not installed (pip install tesserocr)")
+        psm, oem, variables = parse_config(config)
+        options = {"lang": lang, "variables": variables}
+        if tessdata:
+            options["path"] = tessdata
+        if psm is not None:
+            options["psm"] = psm
+        if oem is not None:
+            options["oem"] = oem
+        try:
+            self.api = tesserocr.PyTessBaseAPI(**options)
+        except RuntimeError as e:
+            raise EngineUnavailable(f"tesserocr cannot load {lang}: {e}")
+        self.lang = lang
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def _set_image(self, img):
+        if img.mode not in BYTES_PER_PIXEL:
+            img = img.convert("L" if img.mode in ("1", "I;16", "I", "F") else "RGB")
+        bpp = BYTES_PER_PIXEL[img.mode]
+        # no SetSourceResolution from img.info["dpi"]: the tag is often a meaningless 72, and
+        # pytesseract never passes it either, so both engines leave it to Tesseract or --dpi
+        self.api.SetImageBytes(img.tobytes(), img.width, img.height, bpp, img.width * bpp)
+        if not self.api.Recognize(timeout=round(self.timeout * 1000)):
+            raise OCRTimeout(f"Tesseract ran longer than {self.timeout:g} seconds")
+
+    def image_to_string(self, img):
+        with self._lock:
+            self._set_image(img)
+            return self.api.GetUTF8Text()
+
+    def image_to_data(self, img):
+        """Word boxes in the TSV format of `tesseract ... tsv` (and pytesseract.image_to_data), header included."""
+        with self._lock:
+            self._set_image(img)
+            return f"{TSV_HEADER}\n{self.api.GetTSVText(0)}"
+
+    def describe(self):
+        return {
+            "engine": self.name,
+            "version": tesserocr.tesseract_version().split()[1],
+            "tessdata": self.api.GetDatapath(),
+            "languages": list(self.api.GetAvailableLanguages()),
+        }
+
+    def close(self):
+        with self._lock:
+            self.api.End()
+
+
+def create_engine(kind, lang, config, tessdata=None, timeout=0):
+    """
+    OCR engine of the given kind (see ENGINES) for lang and config (Tesseract command line options).
+    "auto" and "tesserocr" use the persistent engine when it can run here and fall back to
+    pytesseract otherwise, keeping the reason in the fallback engine's fallback_reason.
+    Either engine stops an image after timeout seconds (0: no limit) with OCRTimeout.
+    """
+    if kind not in ENGINES:
+        raise ValueError(f"OCR engine must be one of {', '.join(ENGINES)}")
+    reason = None
+    if kind != "pytesseract":
+        try:
+            return TesserocrEngine(lang, config, tessdata, timeout)
+        except EngineUnavailable as e:
+            reason = str(e)
+    return PytesseractEngine(lang, config, fallback_reason=reason, timeout=timeout)
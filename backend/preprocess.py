@@ -0,0 +1,143 @@
+import time
+from PIL import Image, ImageOps
+
+# ---------------------------
+# Image preprocessing before OCR
+# ---------------------------
+# Each stage takes and returns a PIL image. Tesseract is much faster on a small
+# clean black-and-white page than on a full-resolution colour phone photo.
+
+DEFAULT_STEPS = ("grayscale", "crop", "downscale", "deskew", "binarize")
+
+def grayscale(img):
+    return img if img.mode == "L" else ImageOps.grayscale(img.convert("RGB"))
+
+def crop_roi(img, roi=None):
+    """Crop to roi = (left, top, right, bottom) given as fractions of the page, e.g. the results table."""
+    if not roi:
+        return img
+    w, h = img.size
+    left, top, right, bottom = roi
+    return img.crop((round(left * w), round(top * h), round(right * w), round(bottom * h)))
+
+def downscale(img, max_dimension=None, target_dpi=None):
+    """
+    Shrink to target_dpi (when the image records its DPI) and to max_dimension on the longest side,
+    scaling the recorded DPI along with the pixels. Never upscales.
+    """
+    scale = 1.0
+    dpi = img.info.get("dpi")
+    if target_dpi and dpi and dpi[0] and dpi[0] > target_dpi:
+        scale = target_dpi / float(dpi[0])
+    longest = max(img.size)
+    if max_dimension and longest * scale > max_dimension:
+        scale = max_dimension / longest
+    if scale >= 1.0:
+        return img
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    small = img.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    if dpi:
+        small.info["dpi"] = tuple(d * scale for d in dpi)
+    return small
+
+def otsu_threshold(gray):
+    """Otsu's threshold from the histogram of a grayscale image."""
+    hist = gray.histogram()[:256]
+    total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    sum_bg = weight_bg = 0
+    best_t, best_var = 127, -1.0
+    for t, h in enumerate(hist):
+        weight_bg += h
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += t * h
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        var = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if var > best_var:
+            best_t, best_var = t, var
+    return best_t
+
+def binarize(img):
+    gray = grayscale(img)
+    t = otsu_threshold(gray)
+    return gray.point([0] * (t + 1) + [255] * (255 - t))
+
+def estimate_skew(gray, max_angle=5.0, precision=0.25, sample_size=800):
+    """
+    Projection-profile skew estimate: the rotation that makes text rows sharpest.
+    Works on a small inverted binary copy (row sums come from resizing to one column),
+    searching whole degrees first and then halving the step around the best angle.
+    """
+    small = gray.copy()
+    small.thumbnail((sample_size, sample_size))
+    t = otsu_threshold(small)
+    ink = small.point([255] * (t + 1) + [0] * (255 - t))
+    scores = {}
+
+    def score(angle):
+        if angle not in scores:
+            rotated = ink.rotate(angle, resample=Image.Resampling.BILINEAR, fillcolor=0)
+            rows = list(rotated.resize((1, rotated.height), Image.Resampling.BOX).getdata())
+            scores[angle] = sum((a - b) ** 2 for a, b in zip(rows, rows[1:]))
+        return scores[angle]
+
+    # smallest rotations first, so ties (e.g. a blank page) keep the image as it is
+    coarse = sorted(range(-int(max_angle), int(max_angle) + 1), key=abs)
+    best = max((float(a) for a in coarse), key=score)
+    step = 1.0
+    while step > precision:
+        step /= 2
+        best = max((best, best - step, best + step), key=score)
+    return best
+
+def deskew(img, max_angle=5.0):
+    angle = estimate_skew(grayscale(img), max_angle=max_angle)
+    if angle == 0:
+        return img
+    return img.rotate(angle, resample=Image.Resampling.BILINEAR, expand=True, fillcolor="white")
+
+def split_bands(img, count, search=0.25, min_height=32):
+    """
+    Cut a page into up to `count` horizontal bands so it can be OCR'd piece by piece.
+    Each cut goes on the lightest row within `search` of a band height around the even split,
+    which puts it in the gap between text lines instead of through them.
+    """
+    if count <= 1 or img.height < count * min_height:
+        return [img]
+    rows = list(grayscale(img).resize((1, img.height), Image.Resampling.BOX).getdata())  # mean brightness per row
+    band = img.height / count
+    window = max(1, int(band * search))
+    cuts = [0]
+    for k in range(1, count):
+        target = round(k * band)
+        candidates = range(max(cuts[-1] + min_height, target - window), min(img.height - min_height, target + window) + 1)
+        if candidates:
+            cuts.append(max(candidates, key=lambda y: (rows[y], -abs(y - target))))
+    cuts.append(img.height)
+    return [img.crop((0, top, img.width, bottom)) for top, bottom in zip(cuts, cuts[1:])]
+
+def preprocess(img, steps=DEFAULT_STEPS, roi=None, max_dimension=2500, target_dpi=300, max_skew=5.0):
+    """
+    Run the configured stages in order. Returns (image, {stage: milliseconds}).
+    Unknown stage names raise ValueError.
+    """
+    stages = {
+        "grayscale": grayscale,
+        "crop": lambda im: crop_roi(im, roi),
+        "downscale": lambda im: downscale(im, max_dimension, target_dpi),
+        "deskew": lambda im: deskew(im, max_skew),
+        "binarize": binarize,
+    }
+    timings = {}
+    for step in steps:
+        if step not in stages:
+            raise ValueError(f"Unknown preprocessing step: {step}")
+        start = time.perf_counter()
+        img = stages[step](img)
+        timings[step] = (time.perf_counter() - start) * 1000
+    return img, timings
@@ -0,0 +1,320 @@
+"""
+Re-run OCR and parsing over the uploads archive (or any directory / manifest of reports),
+for example after the parameter catalog (catalog.json) changes.
+
+    cd backend
+    python reprocess.py uploads --output results.jsonl
+    python reprocess.py --manifest files.txt --output results.parquet --workers 16
+
+Files are processed in a pool of worker processes (one per core by default) and results are
+streamed to JSON Lines, or to a directory of Parquet part files (needs pyarrow). Completed
+paths are appended to a checkpoint file, so an interrupted run picks up where it stopped;
+files that failed are not checkpointed and are tried again. Pass --fresh to start over. OCR text still valid in the OCR cache (same bytes and OCR
+settings) is reused, so only parsing is redone for those files.
+"""
+import os
+
+# the CLI does not serve jobs; give each Tesseract one thread since the pool already uses every core
+os.environ.setdefault("JOB_WORKERS", "0")
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+# importing main creates UPLOAD_DIR and its SQLite files: use the server's, not the working directory's
+os.environ.setdefault("UPLOAD_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads"))
+
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import main
+from ocr_cache import OCRCache, cache_key
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+REPORT_EXTENSIONS = {".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp", ".gif", ".pdf"}
+STORE_OBJECT_RE = re.compile(r"[0-9a-f]{64}")  # upload store files are named by the sha256 of the upload
+
+# ---------------------------
+# Inputs
+# ---------------------------
+
+def walk_reports(root, exclude=()):
+    """Yield report files under root in a stable order, without listing the whole tree up front."""
+    exclude = {os.path.abspath(p) for p in exclude}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if os.path.abspath(os.path.join(dirpath, d)) not in exclude)
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() in REPORT_EXTENSIONS:
+                yield os.path.join(dirpath, name)
+
+def read_manifest(path):
+    """Yield the paths listed in a manifest (one per line, relative to the manifest; # comments)."""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield os.path.join(base, line)
+
+# ---------------------------
+# Worker
+# ---------------------------
+
+_cache = None  # this worker process's own connection to the OCR cache
+
+def init_worker(use_cache):
+    global _cache
+    if use_cache and main.OCR_CACHE_MAX_BYTES > 0:
+        _cache = OCRCache(main.OCR_CACHE_PATH, main.OCR_CACHE_MAX_BYTES)
+
+def cached_ocr(key, func, *args):
+    """
+    OCR output under key from the cache, else func(*args). Returns (payload, was_cached).
+    The cache is shared with the other workers and the server: a lookup also writes (it
+    refreshes the entry's LRU position), so while another process holds the write lock a
+    failed lookup counts as a miss and a failed store is skipped.
+    """
+    if _cache is not None:
+        try:
+            payload = _cache.get(key)
+        except sqlite3.Error:
+            payload = None
+        if payload is not None:
+            return payload, True
+    payload = func(*args)[0]
+    if _cache is not None:
+        try:
+            _cache.put(key, payload)
+        except sqlite3.Error:
+            pass  # the text is still used
+    return payload, False
+
+def report_text(path, data, digest):
+    """Text and OCR word rows of a report plus (pages, pages OCR'd, pages served from the cache)."""
+    if main.is_pdf(data):
+        texts, rows = [], []
+        ocr_pages = cached_pages = 0
+        for index, text in enumerate(main.pdf_text_layer(path)):
+            if text is None:
+                key = cache_key(f"{digest}:page{index}:dpi{main.PDF_DPI}", main.ocr_config_signature())
+                payload, cached = cached_ocr(key, main.ocr_pdf_page, path, index, main.PDF_DPI)
+                text, page_rows = main.read_ocr_output(payload)
+                rows.extend(page_rows)
+                ocr_pages += 1
+                cached_pages += cached
+            texts.append(text)
+        return "\n".join(texts), rows, len(texts), ocr_pages, cached_pages
+    main.check_pixel_budget(data)
+    payload, cached = cached_ocr(cache_key(digest, main.ocr_config_signature()), main.ocr_image_bytes, data)
+    text, rows = main.read_ocr_output(payload)
+    return text, rows, 1, 1, int(cached)
+
+def process_file(path, keep_text=False):
+    """OCR and parse one file. Never raises: failures come back as a row with 'error' set."""
+    row = {"path": path}
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = os.path.splitext(os.path.basename(path))[0]
+        if not STORE_OBJECT_RE.fullmatch(digest):
+            digest = hashlib.sha256(data).hexdigest()
+        # a store file recompressed to PNG or WebP keeps the upload's digest, and with it its cached OCR text
+        row.update(sha256=digest, bytes=len(data))
+        text, rows, row["pages"], row["ocr_pages"], row["cached_pages"] = report_text(path, data, digest)
+        scan = main.scan_report([(text, rows)])
+        gender, row["gender_source"] = main.resolve_gender(None, scan)
+        parsed = main.parse_report(scan, gender=gender)
+        params = list(parsed)
+        values = [parsed[p]["value"] for p in params]
+        codes = main.catalog.classifier.classify_named(params, values, [gender] * len(params))
+        row["detected_gender"] = gender
+        row["results"] = [
+            {"param": p, "value": v, "flag": main.CLASS_LABELS[c]} for p, v, c in zip(params, values, codes.tolist())
+        ]
+        if keep_text:
+            row["raw_text"] = text
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {getattr(e, 'detail', e)}"
+    return row
+
+# ---------------------------
+# Output
+# ---------------------------
+
+class JsonlSink:
+    """Appends one JSON object per line; every row is durable once written."""
+
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, row):
+        self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._file.flush()
+        return [row]
+
+    def close(self):
+        self._file.close()
+        return []
+
+PARQUET_SCHEMA = pa and pa.schema([
+    ("path", pa.string()),
+    ("sha256", pa.string()),
+    ("bytes", pa.int64()),
+    ("pages", pa.int32()),
+    ("ocr_pages", pa.int32()),
+    ("cached_pages", pa.int32()),
+    ("detected_gender", pa.string()),
+    ("gender_source", pa.string()),
+    ("results", pa.list_(pa.struct([("param", pa.string()), ("value", pa.float64()), ("flag", pa.string())]))),
+    ("raw_text", pa.string()),
+    ("error", pa.string()),
+])
+
+class ParquetSink:
+    """
+    Buffers rows and writes them as numbered part files (part-00000.parquet, ...) in a directory.
+    Rows become durable (and can be checkpointed) when their part file is written.
+    """
+
+    def __init__(self, directory, batch_size):
+        if pa is None:
+            raise SystemExit("Parquet output needs pyarrow (pip install pyarrow).")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.batch_size = batch_size
+        self._rows = []
+        self._part = sum(1 for name in os.listdir(directory) if name.endswith(".parquet"))
+
+    def write(self, row):
+        self._rows.append(row)
+        return self._flush() if len(self._rows) >= self.batch_size else []
+
+    def _flush(self):
+        if not self._rows:
+            return []
+        path = os.path.join(self.directory, f"part-{self._part:05d}.parquet")
+        pq.write_table(pa.Table.from_pylist(self._rows, schema=PARQUET_SCHEMA), path)
+        self._part += 1
+        written = self._rows
+        self._rows = []
+        return written
+
+    def close(self):
+        return self._flush()
+
+class Checkpoint:
+    """Append-only list of completed paths: those of rows without an error."""
+
+    def __init__(self, path, fresh=False):
+        self.done = set()
+        if fresh and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+        self._file = open(path, "a", encoding="utf-8")
+
+    def add(self, rows):
+        paths = [row["path"] for row in rows if "error" not in row]
+        if paths:
+            self._file.write("".join(p + "\n" for p in paths))
+            self._file.flush()
+            self.done.update(paths)
+
+    def close(self):
+        self._file.close()
+
+# ---------------------------
+# Driver
+# ---------------------------
+
+def run(paths, sink, checkpoint, workers, keep_text=False, use_cache=True, window=None):
+    """
+    Process paths in a pool, keeping at most `window` files in flight so neither the path list
+    nor the results pile up in memory. Returns (processed, errors, skipped).
+    """
+    window = window or workers * 4
+    processed = errors = skipped = 0
+    started = last_report = time.perf_counter()
+
+    def collect(futures):
+        nonlocal processed, errors, last_report
+        for future in futures:
+            row = future.result()
+            processed += 1
+            errors += "error" in row
+            checkpoint.add(sink.write(row))
+        if time.perf_counter() - last_report > 10:
+            last_report = time.perf_counter()
+            rate = processed / (last_report - started)
+            print(f"{processed} files, {errors} errors, {skipped} skipped, {rate:.1f} files/s", file=sys.stderr)
+
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(use_cache,)) as pool:
+        pending = set()
+        for path in paths:
+            if path in checkpoint.done:
+                skipped += 1
+                continue
+            pending.add(pool.submit(process_file, path, keep_text))
+            if len(pending) >= window:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(finished)
+    checkpoint.add(sink.close())
+    return processed, errors, skipped
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", nargs="?", default=main.UPLOAD_DIR, help="directory to walk (default: UPLOAD_DIR)")
+    parser.add_argument("--manifest", help="file listing the reports to process, one path per line")
+    parser.add_argument("--output", required=True, help="results.jsonl, or a directory / *.parquet name for Parquet")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), help="default: parquet if --output ends in .parquet")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--checkpoint", help="completed-paths file (default: <output>.done)")
+    parser.add_argument("--fresh", action="store_true", help="ignore the checkpoint and start over")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per Parquet part file")
+    parser.add_argument("--raw-text", action="store_true", help="include the OCR text in every row")
+    parser.add_argument("--no-cache", action="store_true", help="always re-run OCR, even for cached text")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("parquet" if args.output.endswith(".parquet") else "jsonl")
+    checkpoint_path = args.checkpoint or args.output.rstrip("/") + ".done"
+    if args.fresh and os.path.isfile(args.output):
+        os.remove(args.output)
+    if args.fresh and os.path.isdir(args.output):
+        for name in os.listdir(args.output):
+            if name.startswith("part-") and name.endswith(".parquet"):
+                os.remove(os.path.join(args.output, name))
+
+    if args.manifest:
+        paths = read_manifest(args.manifest)
+    else:
+        paths = walk_reports(args.source, exclude=[main.JOBS_DIR])
+    sink = ParquetSink(args.output, args.batch_size) if fmt == "parquet" else JsonlSink(args.output)
+    checkpoint = Checkpoint(checkpoint_path, fresh=args.fresh)
+    start = time.perf_counter()
+    try:
+        processed, errors, skipped = run(
+            paths, sink, checkpoint, args.workers, keep_text=args.raw_text, use_cache=not args.no_cache
+        )
+    finally:
+        checkpoint.close()
+    elapsed = time.perf_counter() - start
+    print(
+        f"{processed} files in {elapsed:.1f} s ({processed / max(elapsed, 1e-9):.1f} files/s), "
+        f"{errors} errors, {skipped} already done",
+        file=sys.stderr,
+    )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
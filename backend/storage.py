@@ -0,0 +1,278 @@
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+
+from PIL import Image
+
+# file extension by Pillow format; reprocess.py picks stored reports up by these extensions
+IMAGE_EXTENSIONS = {"PNG": ".png", "JPEG": ".jpg", "TIFF": ".tif", "BMP": ".bmp", "WEBP": ".webp", "GIF": ".gif"}
+REPORT_EXTENSIONS = {".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp", ".gif", ".pdf"}
+RECOMPRESS_FORMATS = ("png", "webp")
+RECOMPRESS_SOURCES = ("PNG", "BMP", "TIFF")  # lossless sources; JPEGs are never re-encoded
+
+
+def extension_for(data, filename=""):
+    """File extension for an upload from its content, falling back to the uploaded name's extension."""
+    if data[:5] == b"%PDF-":
+        return ".pdf"
+    try:
+        ext = IMAGE_EXTENSIONS.get(Image.open(io.BytesIO(data)).format)
+    except Exception:
+        ext = None
+    if ext:
+        return ext
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if ext in REPORT_EXTENSIONS else ".bin"
+
+
+def recompress(data, fmt, webp_quality=100):
+    """
+    Re-encode a lossless image as PNG or WebP (WebP is lossless too at webp_quality 100, the default).
+    Returns (bytes, extension), or None when the image is not a lossless single-frame one.
+    """
+    img = Image.open(io.BytesIO(data))
+    if img.format not in RECOMPRESS_SOURCES or getattr(img, "n_frames", 1) > 1:
+        return None
+    exif = img.info.get("exif")
+    out = io.BytesIO()
+    if fmt == "png":
+        img.save(out, "PNG", optimize=True, **({"exif": exif} if exif else {}))
+        return out.getvalue(), ".png"
+    if img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGBA" if "A" in img.mode or "transparency" in img.info else "RGB")
+    options = {"lossless": True} if webp_quality >= 100 else {"quality": webp_quality}
+    img.save(out, "WEBP", method=4, **options, **({"exif": exif} if exif else {}))
+    return out.getvalue(), ".webp"
+
+
+class UploadStore:
+    """
+    Content-addressed store of uploaded reports: each distinct upload is kept once, as
+    root/ab/cd/<sha256><ext>, with its metadata in a SQLite index. Storing identical bytes again
+    only refreshes last_seen. sweep() enforces the retention limits (age since last upload,
+    total size; least recently seen go first), optionally recompresses lossless images to
+    PNG or WebP when that makes them smaller, and moves flat files left by older versions
+    into the store. The size limit is checked against the index itself, not a per-process count,
+    so several processes sharing the store are held to it together. Safe to share between threads.
+    """
+
+    def __init__(self, root, index_path, max_age_days=0, max_bytes=0, recompress=None, webp_quality=100):
+        if recompress and recompress not in RECOMPRESS_FORMATS:
+            raise ValueError(f"recompress must be one of {', '.join(RECOMPRESS_FORMATS)}")
+        self.root = root
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self.recompress = recompress
+        self.webp_quality = webp_quality
+        self.dedup_hits = 0
+        self.evictions = 0
+        self.recompressed = 0
+        self.saved_bytes = 0
+        self.adopted = 0
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(index_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS uploads ("
+            " digest TEXT PRIMARY KEY, path TEXT NOT NULL, filename TEXT, size INTEGER NOT NULL,"
+            " original_size INTEGER NOT NULL, uploads INTEGER NOT NULL, created_at REAL NOT NULL,"
+            " last_seen REAL NOT NULL, compacted INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS uploads_last_seen ON uploads(last_seen)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS uploads_not_compacted ON uploads(created_at) WHERE compacted = 0")
+        self._db.commit()
+
+    def object_path(self, digest, ext):
+        """Path of a stored upload, relative to root: two levels of 256 shards keep directories small."""
+        return os.path.join(digest[:2], digest[2:4], digest + ext)
+
+    @property
+    def size(self):
+        with self._lock:
+            return self._total()
+
+    def _total(self):
+        return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM uploads").fetchone()[0]
+
+    def put(self, data, digest=None, filename=None, seen_at=None):
+        """Store an upload unless identical bytes are already stored. Returns True when a new file was written."""
+        digest = digest or hashlib.sha256(data).hexdigest()
+        seen_at = seen_at or time.time()
+        with self._lock:
+            updated = self._db.execute(
+                "UPDATE uploads SET uploads = uploads + 1, last_seen = MAX(last_seen, ?), filename = ? WHERE digest = ?",
+                (seen_at, filename, digest),
+            ).rowcount
+            if updated:
+                self._db.commit()
+                self.dedup_hits += 1
+                return False
+            path = self.object_path(digest, extension_for(data, filename))
+            self._write(path, data)
+            self._db.execute(
+                "INSERT INTO uploads (digest, path, filename, size, original_size, uploads, created_at, last_seen,"
+                " compacted) VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?)",
+                (digest, path, filename, len(data), len(data), seen_at, seen_at, 0 if self.recompress else 1),
+            )
+            self._db.commit()
+        return True
+
+    def _write(self, path, data):
+        full = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        tmp = f"{full}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, full)
+
+    def _remove(self, path):
+        try:
+            os.remove(os.path.join(self.root, path))
+        except FileNotFoundError:
+            pass
+
+    def path_of(self, digest):
+        """Absolute path of a stored upload, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT path FROM uploads WHERE digest = ?", (digest,)).fetchone()
+        return os.path.join(self.root, row[0]) if row else None
+
+    # ---------------------------
+    # Sweeping
+    # ---------------------------
+
+    def sweep(self, legacy_dir=None, max_files=500):
+        """
+        One cleanup pass: move up to max_files flat files from legacy_dir into the store, recompress
+        up to max_files stored images, then delete expired and least recently seen uploads until
+        the store fits max_bytes. Returns counts of what was done.
+        """
+        done = {"adopted": 0, "recompressed": 0, "expired": 0, "evicted": 0}
+        if legacy_dir:
+            done["adopted"] = self.adopt(legacy_dir, max_files)
+        if self.recompress:
+            done["recompressed"] = self.compact(max_files)
+        if self.max_age_days > 0:
+            done["expired"] = self._delete_where("last_seen < ?", (time.time() - self.max_age_days * 86400,))
+        if self.max_bytes > 0:
+            done["evicted"] = self._evict()
+        return done
+
+    def adopt(self, directory, max_files=500):
+        """Move report files lying directly in directory (the old flat layout) into the store."""
+        adopted = 0
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if adopted >= max_files:
+                    break
+                if not entry.is_file() or os.path.splitext(entry.name)[1].lower() not in REPORT_EXTENSIONS:
+                    continue
+                with open(entry.path, "rb") as f:
+                    data = f.read()
+                # old names are "<timestamp>_<upload name>"
+                filename = entry.name.split("_", 2)[-1] if entry.name[:8].isdigit() else entry.name
+                self.put(data, filename=filename, seen_at=entry.stat().st_mtime)
+                os.remove(entry.path)
+                adopted += 1
+        self.adopted += adopted
+        return adopted
+
+    def compact(self, max_files=500):
+        """Recompress stored images that have not been looked at yet, keeping the smaller file."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT digest, path, size FROM uploads WHERE compacted = 0 ORDER BY created_at LIMIT ?", (max_files,)
+            ).fetchall()
+        count = 0
+        for digest, path, size in rows:
+            result = None
+            if not path.endswith(".pdf"):
+                try:
+                    with open(os.path.join(self.root, path), "rb") as f:
+                        result = recompress(f.read(), self.recompress, self.webp_quality)
+                except (OSError, ValueError, Image.DecompressionBombError):
+                    result = None  # unreadable or vanished; mark it done and leave it alone
+            with self._lock:
+                current = self._db.execute("SELECT path FROM uploads WHERE digest = ?", (digest,)).fetchone()
+                if current is None or current[0] != path:
+                    continue  # evicted or changed while we were encoding
+                if result is not None and len(result[0]) < size:
+                    data, ext = result
+                    new_path = self.object_path(digest, ext)
+                    self._write(new_path, data)
+                    if new_path != path:
+                        self._remove(path)
+                    self._db.execute(
+                        "UPDATE uploads SET path = ?, size = ?, compacted = 1 WHERE digest = ?", (new_path, len(data), digest)
+                    )
+                    self.saved_bytes += size - len(data)
+                    self.recompressed += 1
+                    count += 1
+                else:
+                    self._db.execute("UPDATE uploads SET compacted = 1 WHERE digest = ?", (digest,))
+                self._db.commit()
+        return count
+
+    def _delete_where(self, condition, args):
+        count = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT digest, path, size FROM uploads WHERE {condition} ORDER BY last_seen LIMIT 256", args
+                ).fetchall()
+                for digest, path, size in rows:
+                    self._remove(path)
+                    self._db.execute("DELETE FROM uploads WHERE digest = ?", (digest,))
+                self._db.commit()
+            count += len(rows)
+            self.evictions += len(rows)
+            if len(rows) < 256:
+                return count
+
+    def _evict(self):
+        count = 0
+        while True:
+            with self._lock:
+                # summed afresh for every batch: other processes add and evict uploads too
+                excess = self._total() - self.max_bytes
+                rows = self._db.execute(
+                    "SELECT digest, path, size FROM uploads ORDER BY last_seen LIMIT 256"
+                ).fetchall() if excess > 0 else []
+                for digest, path, size in rows:
+                    if excess <= 0:
+                        break
+                    self._remove(path)
+                    self._db.execute("DELETE FROM uploads WHERE digest = ?", (digest,))
+                    excess -= size
+                    count += 1
+                self._db.commit()
+            if not rows:
+                break
+        self.evictions += count
+        return count
+
+    def stats(self):
+        with self._lock:
+            files, size, original = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(original_size), 0) FROM uploads"
+            ).fetchone()
+        return {
+            "files": files,
+            "bytes": size,
+            "original_bytes": original,
+            "max_bytes": self.max_bytes,
+            "max_age_days": self.max_age_days,
+            "recompress": self.recompress,
+            "dedup_hits": self.dedup_hits,
+            "evictions": self.evictions,
+            "recompressed": self.recompressed,
+            "saved_bytes": self.saved_bytes,
+            "adopted": self.adopted,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -15,6 +15,30 @@ function App() {
     : "http://localhost:8000";
 
 
+  // Read the server-sent events of /upload/stream, calling onEvent(name, data) for each one.
+  async function readEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let end;
+      while ((end = buffer.indexOf("\n\n")) !== -1) {
+        const chunk = buffer.slice(0, end);
+        buffer = buffer.slice(end + 2);
+        let name = "message";
+        let data = "";
+        for (const line of chunk.split("\n")) {
+          if (line.startsWith("event: ")) name = line.slice(7);
+          else if (line.startsWith("data: ")) data += line.slice(6);
+        }
+        if (data) onEvent(name, JSON.parse(data));
+      }
+    }
+  }
+
   async function handleUpload(e) {
     e.preventDefault();
     if (!file) {
@@ -30,7 +54,8 @@ function App() {
     formData.append("gender", gender); // send gender to backend if needed
 
     try {
-      const response = await fetch(`${API_URL}/upload`, {
+      // stream the report: text and parameters show up while OCR is still running
+      const response = await fetch(`${API_URL}/upload/stream`, {
         method: "POST",
         body: formData,
       });
@@ -39,8 +64,31 @@ function App() {
         throw new Error("Upload failed");
       }
 
-      const data = await response.json();
-      setResult(data);
+      let partial = { filename: file.name, parsed_results: {}, raw_text: "" };
+      let failed = false;
+      setResult(partial);
+      await readEvents(response, (name, data) => {
+        if (name === "stage") {
+          setStatus(`Processing (${data.stage})...`);
+        } else if (name === "text") {
+          const rawText = partial.raw_text ? `${partial.raw_text}\n${data.text}` : data.text;
+          partial = { ...partial, raw_text: rawText };
+          setResult(partial);
+        } else if (name === "parameter") {
+          const { name: param, elapsed_ms, ...info } = data;
+          partial = { ...partial, parsed_results: { ...partial.parsed_results, [param]: info } };
+          setResult(partial);
+        } else if (name === "result") {
+          const { elapsed_ms, ...final } = data;
+          partial = final;
+          setResult(final);
+        } else if (name === "error") {
+          failed = true;
+        }
+      });
+      if (failed) {
+        throw new Error("Upload failed");
+      }
       setStatus("Upload successful");
     } catch (error) {
       console.error(error);